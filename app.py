@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
@@ -9,8 +9,9 @@ import random
 from datetime import datetime
 from collections import Counter
 from collections import Counter, defaultdict 
-from rag.orchestrator import analyze
-from config import SECRET_KEY, MAX_CODE_LEN
+from rag.orchestrator import analyze, pipeline_stats
+from rag import telemetry, warmup
+from config import SECRET_KEY, MAX_CODE_LEN, ALLOWED_EXTS, EXT_TO_LANG
 from flask_mail import Mail, Message
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from flask import jsonify, request
@@ -27,6 +28,10 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 db = SQLAlchemy(app)
 
+# Load models on background threads so the first request doesn't pay for it;
+# /ready reports when they are in.
+warmup.start()
+
 
 """Email config.
 
@@ -169,6 +174,21 @@ class History(db.Model):
 
     # NEW: owner of the row
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    llm_usage = db.relationship("LlmUsage", backref="history", lazy=True, cascade="all, delete-orphan")
+
+
+# --------- LLM call accounting (one row per generation call) ----------
+class LlmUsage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    history_id = db.Column(db.Integer, db.ForeignKey("history.id"), nullable=False, index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    backend = db.Column(db.String(32))
+    model = db.Column(db.String(128), index=True)
+    prompt_tokens = db.Column(db.Integer)
+    completion_tokens = db.Column(db.Integer)
+    usage_estimated = db.Column(db.Boolean, default=False)
+    ttfb_ms = db.Column(db.Float)
+    total_ms = db.Column(db.Float)
 # ----------------------------------
 
 # ----------------------------------
@@ -383,8 +403,8 @@ def analyze_route():
     """
 
     # --- Safe defaults ---
-    allowed_exts = {'.py', '.js', '.ts', '.java', '.cpp', '.c', '.cs', '.php', '.rb', '.go', '.rs'}
-    max_code_len = 20000
+    allowed_exts = ALLOWED_EXTS
+    max_code_len = MAX_CODE_LEN
 
     # --- Prepare in-memory history ---
     globals().setdefault("HISTORY_BY_USER", {})
@@ -417,13 +437,7 @@ def analyze_route():
             return redirect(url_for("index"))
 
         fname = name
-        ext_to_lang = {
-            ".py": "python", ".js": "javascript", ".ts": "typescript",
-            ".java": "java", ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp",
-            ".c": "c", ".cs": "csharp", ".php": "php", ".rb": "ruby",
-            ".go": "go", ".rs": "rust"
-        }
-        lang = ext_to_lang.get(ext, lang)
+        lang = EXT_TO_LANG.get(ext, lang)
 
     # --- Validate ---
     if not code:
@@ -466,8 +480,22 @@ def analyze_route():
             root_cause=out.get("root_cause", "No root cause generated."),
             confidence=final_confidence_100,
         )
-        db.session.add(new_entry)
-        db.session.commit()
+        metrics = out.get("_metrics")
+        if isinstance(metrics, dict):
+            new_entry.llm_usage.append(
+                LlmUsage(
+                    backend=metrics.get("backend"),
+                    model=metrics.get("model"),
+                    prompt_tokens=metrics.get("prompt_tokens"),
+                    completion_tokens=metrics.get("completion_tokens"),
+                    usage_estimated=bool(metrics.get("usage_estimated")),
+                    ttfb_ms=metrics.get("ttfb_ms"),
+                    total_ms=metrics.get("total_ms"),
+                )
+            )
+        with telemetry.span("db_write"):
+            db.session.add(new_entry)
+            db.session.commit()
     except Exception as e:
         app.logger.error(f"Error saving history: {e}")
         db.session.rollback()
@@ -665,6 +693,66 @@ def ganalysis_data():
     return jsonify({"labels": [r[0] for r in results], "counts": [r[1] for r in results]})
 
 
+@app.get("/ready")
+def ready_route():
+    """Readiness probe for load balancers: 200 once enabled models are loaded, else 503."""
+    body = dict(warmup.status(), ready=warmup.ready())
+    return jsonify(body), 200 if body["ready"] else 503
+
+
+@app.get("/metrics")
+def metrics_route():
+    """Stage latency histograms and counters in the Prometheus text format, for scraping."""
+    return Response(telemetry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/pipeline_stats")
+@login_required
+def pipeline_stats_route():
+    """Routing tiers and single-flight coalescing counters for the analysis pipeline."""
+    return jsonify(pipeline_stats())
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+@app.get("/llm_usage_data")
+@login_required
+def llm_usage_data():
+    """Per-model latency percentiles and tokens per request for the current user's analyses."""
+    rows = db.session.execute(
+        db.select(LlmUsage)
+          .join(History, LlmUsage.history_id == History.id)
+          .where(History.user_id == current_user.id)
+    ).scalars().all()
+
+    by_model = defaultdict(list)
+    for r in rows:
+        by_model[r.model or "unknown"].append(r)
+
+    models = {}
+    for model, calls in by_model.items():
+        total = [c.total_ms for c in calls if c.total_ms is not None]
+        ttfb = [c.ttfb_ms for c in calls if c.ttfb_ms is not None]
+        prompt = [c.prompt_tokens or 0 for c in calls]
+        completion = [c.completion_tokens or 0 for c in calls]
+        models[model] = {
+            "requests": len(calls),
+            "total_ms_p50": _percentile(total, 50) if total else None,
+            "total_ms_p95": _percentile(total, 95) if total else None,
+            "ttfb_ms_p50": _percentile(ttfb, 50) if ttfb else None,
+            "ttfb_ms_p95": _percentile(ttfb, 95) if ttfb else None,
+            "prompt_tokens_avg": round(sum(prompt) / len(calls), 1),
+            "completion_tokens_avg": round(sum(completion) / len(calls), 1),
+            "estimated_share": round(sum(c.usage_estimated for c in calls) / len(calls), 3),
+        }
+    return jsonify({"models": models})
+
+
 @app.get("/history")
 @login_required
 def history_route():
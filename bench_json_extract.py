@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Microbenchmark: single-pass tolerant parser (rag/jsonstream.py) vs the
+previous four-strategy _extract_json chain from rag/gemini_api.py.
+
+Usage:
+    python bench_json_extract.py [--size 20000] [--repeat 200]
+
+Three response shapes are timed: clean JSON, fenced JSON, and fenced JSON
+with raw newlines inside strings (the case that fell through to the
+character-by-character _fix_json_newlines pass).
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag.jsonstream import extract_json
+
+
+# ---- previous implementation, kept verbatim for comparison ----
+def _legacy_extract_json(text):
+    try:
+        return json.loads(text)
+    except Exception:
+        pass
+    cleaned = re.sub(r'^```(?:json)?\s*\n?', '', text.strip(), flags=re.MULTILINE)
+    cleaned = re.sub(r'\n?```\s*$', '', cleaned.strip(), flags=re.MULTILINE)
+    try:
+        return json.loads(cleaned)
+    except Exception:
+        pass
+    s = text.find("{")
+    e = text.rfind("}")
+    if 0 <= s < e:
+        json_str = text[s : e + 1]
+        try:
+            return json.loads(json_str)
+        except Exception:
+            pass
+        try:
+            return json.loads(_legacy_fix_json_newlines(json_str))
+        except Exception:
+            pass
+    return None
+
+
+def _legacy_fix_json_newlines(text):
+    result = []
+    in_string = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == '\\' and in_string and i + 1 < len(text):
+            result.append(ch)
+            result.append(text[i + 1])
+            i += 2
+            continue
+        if ch == '"' and (i == 0 or text[i - 1] != '\\'):
+            in_string = not in_string
+        if ch == '\n' and in_string:
+            result.append('\\n')
+        elif ch == '\r' and in_string:
+            result.append('\\r')
+        elif ch == '\t' and in_string:
+            result.append('\\t')
+        else:
+            result.append(ch)
+        i += 1
+    return ''.join(result)
+
+
+def _responses(size):
+    line = "    value = compute(items[i], factor) + offset  # keep going\n"
+    code = (line * (size // len(line) + 1))[:size]
+    obj = {
+        "root_cause": "Off-by-one error in loop bound",
+        "fix_explanation": "Changed <= to < so the last index stays in range.",
+        "patched_code": code,
+        "patch_unified_diff": "",
+        "references": ["kb_1", "kb_7"],
+        "confidence": 0.9,
+    }
+    clean = json.dumps(obj)
+    fenced = "```json\n" + json.dumps(obj, indent=2) + "\n```"
+    raw = fenced.replace("\\n", "\n")
+    return {"clean": clean, "fenced": fenced, "raw-newlines": raw}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", type=int, default=20000, help="chars of code in patched_code")
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    print(f"{'case':14s} {'legacy us':>10s} {'single us':>10s} {'speedup':>8s}")
+    for name, text in _responses(args.size).items():
+        assert extract_json(text) == _legacy_extract_json(text), name
+        old = timeit.timeit(lambda: _legacy_extract_json(text), number=args.repeat) / args.repeat
+        new = timeit.timeit(lambda: extract_json(text), number=args.repeat) / args.repeat
+        print(f"{name:14s} {old * 1e6:10.1f} {new * 1e6:10.1f} {old / new:7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
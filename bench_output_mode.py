@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Compares LLM latency for the "full" and "hunks" output contracts on the
+Sample files corpus.
+
+Usage:
+    python bench_output_mode.py [--runs 1] [--limit 0]
+
+Needs GROQ_API_KEY. Each file is sent once per mode per run; modes are
+interleaved so API-side load drifts affect both equally.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import gemini_api
+from rag.predictor import predict_defect
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample files")
+EXT_TO_LANG = {
+    ".py": "python", ".js": "javascript", ".ts": "typescript", ".java": "java",
+    ".cpp": "cpp", ".c": "c", ".php": "php",
+}
+MODES = ("full", "hunks")
+
+
+def _corpus(limit):
+    files = sorted(f for f in os.listdir(SAMPLES_DIR) if os.path.splitext(f)[1] in EXT_TO_LANG)
+    if limit:
+        files = files[:limit]
+    for name in files:
+        with open(os.path.join(SAMPLES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+            yield name, EXT_TO_LANG[os.path.splitext(name)[1]], f.read()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=1)
+    ap.add_argument("--limit", type=int, default=0, help="only the first N files")
+    args = ap.parse_args()
+
+    if not gemini_api.is_available():
+        print("GROQ_API_KEY not configured; nothing to measure.")
+        return 1
+
+    latency = {m: [] for m in MODES}
+    changed = {m: 0 for m in MODES}
+    failed = {m: 0 for m in MODES}
+
+    corpus = list(_corpus(args.limit))
+    for _ in range(args.runs):
+        for name, lang, code in corpus:
+            det = predict_defect(code, lang=lang)
+            for mode in MODES:
+                t0 = time.perf_counter()
+                out = gemini_api.generate_fix(lang, name, det["issue_type"], det["span_lines"], code, [], output_mode=mode)
+                dt = time.perf_counter() - t0
+                if not out:
+                    failed[mode] += 1
+                    continue
+                latency[mode].append(dt)
+                if out.get("patched_code") and out["patched_code"] != code:
+                    changed[mode] += 1
+                print(f"{mode:5s} {dt * 1000:8.0f} ms  {name}")
+
+    print()
+    print(f"{'mode':6s} {'n':>4s} {'mean ms':>9s} {'p50 ms':>9s} {'max ms':>9s} {'patched':>8s} {'failed':>7s}")
+    for mode in MODES:
+        xs = latency[mode]
+        if not xs:
+            print(f"{mode:6s} {0:4d}")
+            continue
+        print(
+            f"{mode:6s} {len(xs):4d} {statistics.mean(xs) * 1000:9.0f} {statistics.median(xs) * 1000:9.0f} "
+            f"{max(xs) * 1000:9.0f} {changed[mode]:8d} {failed[mode]:7d}"
+        )
+    if latency["full"] and latency["hunks"]:
+        speedup = statistics.mean(latency["full"]) / statistics.mean(latency["hunks"])
+        print(f"\nhunks vs full: {speedup:.2f}x mean latency")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Latency per KB of source for the windowed defect model (rag/predictor.py).
+
+Usage:
+    python bench_predictor.py [--sizes 1,4,16,64] [--batches 1,8] [--repeat 3]
+
+Builds inputs of each size (KB) by concatenating the Python files in
+"Sample files", then times predictor._model_findings for every max batch
+size. Batch 1 runs the windows one by one; larger batches run them as
+padded batches. Reported per row: tokens, windows, best-of-N wall time and
+ms per KB. Needs the checkpoint in config.DEFECT_PREDICTOR_DIR; the
+rule-based detector is timed alongside for reference.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+os.environ["ENABLE_DEFECT_MODEL"] = "1"
+os.environ.pop("MODEL_SERVER_URL", None)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+SAMPLES_DIR = os.path.join(ROOT, "Sample files")
+
+from config import DEFECT_WINDOW_OVERLAP, DEFECT_WINDOW_TOKENS  # noqa: E402
+from rag import predictor  # noqa: E402
+from rag.detector import detect  # noqa: E402
+
+
+def _source(kb: int) -> str:
+    parts = []
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        if name.endswith(".py"):
+            with open(os.path.join(SAMPLES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+                parts.append(f.read())
+    corpus = "\n".join(parts) or "x = [1, 2, 3]\nprint(x[3])\n"
+    out = corpus
+    while len(out) < kb * 1024:
+        out += "\n" + corpus
+    return out[: kb * 1024]
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1,4,16,64", help="input sizes in KB")
+    ap.add_argument("--batches", default="1,8", help="max windows per forward pass")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    predictor._ensure_loaded()
+    if predictor._model is None:
+        print(f"defect model not loaded from {predictor.DEFECT_PREDICTOR_DIR}")
+        return 1
+    print(f"model loaded in {time.perf_counter() - t0:.1f}s on {predictor._DEVICE} "
+          f"(window {DEFECT_WINDOW_TOKENS}, overlap {DEFECT_WINDOW_OVERLAP})")
+
+    print(f"{'KB':>4s} {'batch':>5s} {'tokens':>7s} {'windows':>7s} {'ms':>9s} {'ms/KB':>8s} {'rules ms/KB':>11s}")
+    for kb in (int(x) for x in args.sizes.split(",")):
+        code = _source(kb)
+        n_tokens = len(predictor._token_starts(code)[0])
+        size = min(DEFECT_WINDOW_TOKENS, int(getattr(predictor._tok, "model_max_length", DEFECT_WINDOW_TOKENS)))
+        size = max(8, size - predictor._tok.num_special_tokens_to_add())
+        n_windows = len(predictor._windows(n_tokens, size, min(DEFECT_WINDOW_OVERLAP, size // 2)))
+        rules_s = _best(lambda: detect(code, "python"), args.repeat)
+        for batch in (int(x) for x in args.batches.split(",")):
+            predictor._model_findings(code, max_batch=batch)  # warm up
+            secs = _best(lambda: predictor._model_findings(code, max_batch=batch), args.repeat)
+            print(f"{kb:4d} {batch:5d} {n_tokens:7d} {n_windows:7d} {secs * 1000:9.1f} "
+                  f"{secs * 1000 / kb:8.1f} {rules_s * 1000 / kb:11.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
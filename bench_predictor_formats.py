@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Compares runtimes for the defect model (config.DEFECT_MODEL_FORMAT).
+
+Usage:
+    python bench_predictor_formats.py [--formats fp32,int8,onnx,onnx-int8] [--repeat 3]
+
+Each format runs in a fresh subprocess so load time and RSS are not polluted
+by the previous model. Reported per format: load time, RSS after load, and
+the per-file latency of the windowed model (mean and max over "Sample
+files", best of --repeat). The onnx formats need `python export_predictor.py`
+first; label parity against fp32 is checked there.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.path.join(ROOT, "Sample files")
+
+
+def _child(fmt: str, repeat: int) -> dict:
+    os.environ["ENABLE_DEFECT_MODEL"] = "1"
+    os.environ["DEFECT_MODEL_FORMAT"] = fmt
+    os.environ.pop("MODEL_SERVER_URL", None)
+    sys.path.insert(0, ROOT)
+    from bench_quant import _rss_mb
+    from config import EXT_TO_LANG
+    from rag import predictor
+
+    t0 = time.perf_counter()
+    predictor._ensure_loaded()
+    load_s = time.perf_counter() - t0
+    if predictor._model is None:
+        return {"format": fmt, "error": "model not loaded"}
+    if (fmt in predictor.ONNX_FILES) != isinstance(predictor._model, predictor._OnnxTokenClassifier):
+        return {"format": fmt, "error": "fell back to fp32"}
+    rss = _rss_mb()
+
+    codes = []
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        if os.path.splitext(name)[1].lower() in EXT_TO_LANG:
+            with open(os.path.join(SAMPLES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+                codes.append(f.read())
+    predictor._model_findings(codes[0])  # warm up
+    per_file = []
+    for code in codes:
+        best = float("inf")
+        for _ in range(repeat):
+            t1 = time.perf_counter()
+            predictor._model_findings(code)
+            best = min(best, time.perf_counter() - t1)
+        per_file.append(best * 1000)
+
+    return {
+        "format": fmt,
+        "load_s": round(load_s, 2),
+        "rss_mb": round(rss),
+        "files": len(per_file),
+        "mean_ms": round(sum(per_file) / len(per_file), 2),
+        "max_ms": round(max(per_file), 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--formats", default="fp32,int8,onnx,onnx-int8")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child, args.repeat)))
+        return 0
+
+    rows = []
+    for fmt in args.formats.split(","):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", fmt, "--repeat", str(args.repeat)],
+            capture_output=True,
+            text=True,
+        )
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        rows.append(json.loads(lines[-1]) if lines else {"format": fmt, "error": proc.stderr.strip()[-300:]})
+
+    print(f"{'format':10s} {'load s':>7s} {'RSS MB':>7s} {'files':>6s} {'mean ms':>8s} {'max ms':>8s}")
+    for r in rows:
+        if "error" in r:
+            print(f"{r['format']:10s} error: {r['error']}")
+            continue
+        print(f"{r['format']:10s} {r['load_s']:7.2f} {r['rss_mb']:7d} {r['files']:6d} {r['mean_ms']:8.2f} {r['max_ms']:8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
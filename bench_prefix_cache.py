@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Measures prefill time saved by reusing the KV cache of the static prompt
+prefix (rag.llm.PROMPT_PREFIX) on the local coder model.
+
+Usage:
+    FAST_ANALYSIS_MODE=0 python bench_prefix_cache.py [--limit 0]
+
+For every file in Sample files the full prompt is prefilled twice: once from
+scratch and once as suffix-only on top of a copy of the cached prefix.
+"""
+
+import argparse
+import copy
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import torch
+
+from rag import llm
+from rag.batching import _make_cache as make_cache
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample files")
+
+
+def _prompts(limit):
+    files = sorted(os.listdir(SAMPLES_DIR))
+    files = [f for f in files if os.path.splitext(f)[1] in {".py", ".java", ".cpp", ".c", ".js", ".php"}]
+    if limit:
+        files = files[:limit]
+    for name in files:
+        with open(os.path.join(SAMPLES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+            code = f.read()
+        yield name, llm.PROMPT.format(lang="", path=name, issue="Possible_Bug", span="?", code=code, passages="")
+
+
+def _sync():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--limit", type=int, default=0, help="only the first N files")
+    args = ap.parse_args()
+
+    llm._ensure_loaded()
+    if llm._lm is None:
+        print("Local LLM not loaded:", llm._load_error)
+        return 1
+
+    # The worker is idle here, so it is safe to drive the model directly.
+    worker = llm._get_worker()
+    with torch.inference_mode():
+        worker._ensure_prefix()
+    prefix_ids = worker._prefix_ids.unsqueeze(0)
+    prefix_past = worker._prefix_layers
+    print(f"prefix: {prefix_ids.shape[1]} tokens")
+
+    cold, warm = [], []
+    for name, prompt in _prompts(args.limit):
+        suffix_ids = llm._tok(prompt, add_special_tokens=False, return_tensors="pt").input_ids.to(llm._lm.device)
+        full_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+        with torch.inference_mode():
+            _sync(); t0 = time.perf_counter()
+            llm._lm(input_ids=full_ids, use_cache=True)
+            _sync(); t1 = time.perf_counter()
+            past = make_cache(copy.deepcopy(prefix_past))
+            mask = torch.ones_like(full_ids)
+            llm._lm(input_ids=suffix_ids, attention_mask=mask, past_key_values=past, use_cache=True)
+            _sync(); t2 = time.perf_counter()
+        cold.append(t1 - t0)
+        warm.append(t2 - t1)
+        print(f"{name:32s} {full_ids.shape[1]:5d} tok  full {1000 * (t1 - t0):8.1f} ms  cached {1000 * (t2 - t1):8.1f} ms")
+
+    if cold:
+        saved = [c - w for c, w in zip(cold, warm)]
+        print()
+        print(f"mean prefill full:   {1000 * statistics.mean(cold):8.1f} ms")
+        print(f"mean prefill cached: {1000 * statistics.mean(warm):8.1f} ms")
+        print(f"mean saved/request:  {1000 * statistics.mean(saved):8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
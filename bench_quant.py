@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Compares CPU weight formats for the local coder LLM (config.LOCAL_LLM_QUANT).
+
+Usage:
+    python bench_quant.py [--modes fp32,bf16,int8] [--limit 8] [--tokens 256]
+
+Each mode runs in a fresh subprocess so load time and RSS are not polluted
+by the previous model. Reported per mode: load time, RSS after load, decode
+tokens/sec, and the share of Sample files whose output parses as JSON.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.path.join(ROOT, "Sample files")
+EXT_TO_LANG = {".py": "python", ".java": "java", ".cpp": "cpp", ".c": "c", ".js": "javascript", ".php": "php"}
+
+
+def _rss_mb() -> float:
+    try:
+        import psutil  # type: ignore
+
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _child(mode: str, limit: int, max_tokens: int, constrained: bool) -> dict:
+    os.environ["LOCAL_LLM_QUANT"] = mode
+    os.environ["FAST_ANALYSIS_MODE"] = "0"
+    sys.path.insert(0, ROOT)
+    from rag import llm
+
+    t0 = time.perf_counter()
+    llm._ensure_loaded()
+    load_s = time.perf_counter() - t0
+    if llm._lm is None:
+        return {"mode": mode, "error": llm._load_error}
+    rss = _rss_mb()
+
+    files = sorted(f for f in os.listdir(SAMPLES_DIR) if os.path.splitext(f)[1] in EXT_TO_LANG)[:limit]
+    n_tokens, gen_s, valid = 0, 0.0, 0
+    for name in files:
+        with open(os.path.join(SAMPLES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+            code = f.read()
+        lang = EXT_TO_LANG[os.path.splitext(name)[1]]
+        prompt = llm.PROMPT.format(lang=lang, path=name, issue="Possible_Bug", span="?", code=code, passages="")
+        t0 = time.perf_counter()
+        text = llm._local_generate(prompt, max_new_tokens=max_tokens, constrained=constrained)
+        gen_s += time.perf_counter() - t0
+        n_tokens += len(llm._tok(text, add_special_tokens=False).input_ids)
+        if llm._extract_json(text):
+            valid += 1
+
+    return {
+        "mode": mode,
+        "load_s": round(load_s, 2),
+        "rss_mb": round(rss),
+        "tok_per_s": round(n_tokens / gen_s, 2) if gen_s else 0.0,
+        "json_valid": f"{valid}/{len(files)}",
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--modes", default="fp32,bf16,int8")
+    ap.add_argument("--limit", type=int, default=8, help="Sample files per mode")
+    ap.add_argument("--tokens", type=int, default=256, help="max_new_tokens per file")
+    ap.add_argument("--constrained", action="store_true", help="use schema-constrained decoding")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child, args.limit, args.tokens, args.constrained)))
+        return 0
+
+    rows = []
+    for mode in args.modes.split(","):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--limit", str(args.limit), "--tokens", str(args.tokens)]
+            + (["--constrained"] if args.constrained else []),
+            capture_output=True,
+            text=True,
+        )
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        rows.append(json.loads(lines[-1]) if lines else {"mode": mode, "error": proc.stderr.strip()[-300:]})
+
+    print(f"{'mode':6s} {'load s':>7s} {'RSS MB':>7s} {'tok/s':>7s} {'json ok':>8s}")
+    for r in rows:
+        if "error" in r:
+            print(f"{r['mode']:6s} error: {r['error']}")
+            continue
+        print(f"{r['mode']:6s} {r['load_s']:7.2f} {r['rss_mb']:7d} {r['tok_per_s']:7.2f} {r['json_valid']:>8s}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+"""
+Parity check and throughput benchmark for the heuristic rule engine
+(rag/rules.py) against the previous chain of patch functions.
+
+Usage:
+    python bench_rules.py [--repeat 50]
+
+Every Sample file is run under each issue label, as is, with tabs and with
+a few injected defects so every rule fires somewhere. The run aborts on the
+first output that differs from the old chain. Then both implementations
+are timed over the whole corpus.
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag.rules import apply_rules
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample files")
+EXTS = (".py", ".js", ".ts", ".java", ".cpp", ".c", ".php")
+ISSUES = ("ZeroDivisionError", "IndexError", "ArrayIndexOutOfBounds", "NullPointerException", "Possible_Bug", "")
+
+# Snippets appended to each file so the rarer rules are exercised too.
+INJECTIONS = (
+    "",
+    "\ndef avg(total, count):\n    return total / count\n\n",
+    "\nfor i in range(n - i):\n    pass\n",
+    "\n        arr[j] = arr[j + 1]\n        arr[j + 1] = arr[j]\n        arr[j] = arr[j + 1]\n",
+    "\nvalues = [1, 2, 3]\nprint(values[ 3 ])\nprint(values[0])\n",
+    "\ni = 0\nwhile i < len(items):\n    print(items[i])\n\nj = 0\nwhile j < len(items):\n    j += 1\n",
+    "\nfor (int i = 0; i <= n; i++) {}\n",
+)
+
+
+# ---- previous implementation, kept verbatim for comparison (but see the division guard) ----
+def _simple_optimize_python(code: str) -> str:
+    out = code
+    # Replace tabs for consistent formatting in rendered output.
+    out = out.replace("\t", "    ")
+    # Trim trailing spaces line by line.
+    out = "\n".join(line.rstrip() for line in out.splitlines())
+    if code.endswith("\n"):
+        out += "\n"
+    return out
+
+
+def _patch_division_guard(text: str) -> tuple[str, bool]:
+    # One deliberate change from the old chain: the engine also guards a
+    # return line that ends in a comment (keeping it). Mirrored here so the
+    # parity check keeps covering everything else.
+    updated = re.sub(
+        r"return\s+([^\n#/]+?)\s*/\s*([A-Za-z_]\w*)(?:[ \t]*(#[^\n]*))?\s*$",
+        lambda m: f"return {m[1]} / {m[2]} if {m[2]} != 0 else 0" + (f"  {m[3]}" if m[3] else ""),
+        text,
+        flags=re.MULTILINE,
+    )
+    return updated, updated != text
+
+
+def _adjust_index_in_line(line: str) -> tuple[str, bool]:
+    m = re.search(r"\[( *)(\d+)( *)\]", line)
+    if not m:
+        return line, False
+    old_idx = int(m.group(2))
+    safe_idx = max(0, old_idx - 1)
+    if old_idx == safe_idx:
+        return line, False
+    old_bracket = f"[{m.group(1)}{old_idx}{m.group(3)}]"
+    new_bracket = f"[{safe_idx}]"
+    return line.replace(old_bracket, new_bracket, 1) + "  # fixed off-by-one", True
+
+
+def _patch_direct_indexing(text: str) -> tuple[str, bool]:
+    lines = text.splitlines()
+    changed = False
+    for i, line in enumerate(lines):
+        if "[" in line and "]" in line:
+            new_line, line_changed = _adjust_index_in_line(line)
+            if line_changed:
+                lines[i] = new_line
+                changed = True
+    return "\n".join(lines) if changed else text, changed
+
+
+def _patch_bounds_loops(text: str) -> tuple[str, bool]:
+    if "<=" in text and ("for" in text or "while" in text):
+        updated = text.replace("<=", "<")
+        return updated, updated != text
+    
+    lines = text.splitlines()
+    changed = False
+    
+    for i, line in enumerate(lines):
+        if "range(" in line and "- i)" in line:
+            lines[i] = re.sub(r"range\(([a-zA-Z0-9_]+)\s*-\s*i\)", r"range(\1 - i - 1)", line)
+            if lines[i] != line:
+                changed = True
+    
+    if changed:
+        return "\n".join(lines), True
+    
+    i = 0
+    while i < len(lines) - 1:
+        curr = lines[i].strip()
+        next_line = lines[i + 1].strip() if i + 1 < len(lines) else ""
+        has_first = "arr[j]" in lines[i] and "arr[j + 1]" in lines[i] and "=" in lines[i]
+        has_second = "arr[j + 1]" in lines[i + 1] and "arr[j]" in lines[i + 1] and "=" in lines[i + 1]
+        if has_first and has_second:
+            indent = len(lines[i]) - len(lines[i].lstrip())
+            lines[i] = " " * indent + "arr[j], arr[j + 1] = arr[j + 1], arr[j]  # fixed swap"
+            lines.pop(i + 1)
+            changed = True
+            continue
+        i += 1
+    
+    if changed:
+        return "\n".join(lines), True
+    
+    if "[" in text and "]" in text:
+        updated, changed = _patch_direct_indexing(text)
+        if changed:
+            return updated, True
+    
+    return text, False
+
+
+def _line_indent(line: str) -> int:
+    return len(line) - len(line.lstrip(" "))
+
+
+def _find_body_end(lines: list[str], body_start: int, base_indent: int) -> int:
+    j = body_start
+    while j < len(lines):
+        stripped = lines[j].strip()
+        if stripped and _line_indent(lines[j]) <= base_indent:
+            break
+        j += 1
+    return j
+
+
+def _has_counter_increment(lines: list[str], body_start: int, body_end: int, var: str) -> bool:
+    pattern = rf"^\s*{re.escape(var)}\s*(\+=|=)\s*"
+    for k in range(body_start, body_end):
+        if re.search(pattern, lines[k]):
+            return True
+    return False
+
+
+def _infer_body_indent(lines: list[str], body_start: int, body_end: int, base_indent: int) -> int:
+    for k in range(body_start, body_end):
+        if lines[k].strip():
+            return _line_indent(lines[k])
+    return base_indent + 4
+
+
+def _patch_missing_loop_increment(text: str) -> tuple[str, bool]:
+    lines = text.splitlines()
+    changed = False
+    i = 0
+
+    while i < len(lines):
+        m = re.match(r"^(\s*)while\s+([A-Za-z_]\w*)\s*<\s*len\([^\)]*\)\s*:\s*$", lines[i])
+        if not m:
+            i += 1
+            continue
+
+        base_indent = len(m.group(1))
+        var = m.group(2)
+        body_start = i + 1
+        body_end = _find_body_end(lines, body_start, base_indent)
+
+        if body_start >= body_end or _has_counter_increment(lines, body_start, body_end, var):
+            i = body_end
+            continue
+
+        body_indent = _infer_body_indent(lines, body_start, body_end, base_indent)
+        insert_line = f"{' ' * body_indent}{var} += 1  # auto-fix: avoid infinite loop"
+        lines.insert(body_end, insert_line)
+        changed = True
+        i = body_end + 1
+
+    return "\n".join(lines), changed
+
+
+def _detect_action(issue: str) -> tuple[str, str]:
+    text = issue or ""
+    if "ZeroDivision" in text:
+        return "division", "Added a division-by-zero guard in return expressions."
+    if "Index" in text or "Bounds" in text:
+        return "bounds", "Adjusted loop bounds to avoid out-of-range indexing."
+    if "None" in text or "Null" in text:
+        return "null", "Potential null/None dereference detected. Add guards before attribute or method access."
+    return "auto", "Applied safe fallback optimization and retained original logic."
+
+
+def _try_division_patch(action: str, patched: str, explanation: str) -> tuple[str, str, bool]:
+    if action not in {"division", "auto"}:
+        return patched, explanation, False
+    updated, changed = _patch_division_guard(patched)
+    if not changed:
+        return patched, explanation, False
+    if action == "auto":
+        explanation = "Detected unsafe division and added a zero-check guard."
+    return updated, explanation, True
+
+
+def _try_bounds_patch(action: str, patched: str, explanation: str) -> tuple[str, str, bool]:
+    if action not in {"bounds", "auto"}:
+        return patched, explanation, False
+    updated, changed = _patch_bounds_loops(patched)
+    if not changed:
+        return patched, explanation, False
+    
+    if action == "bounds":
+        explanation = "Applied safe bounds checking for array access and loop conditions."
+    else:
+        explanation = "Detected potential array bounds issue and applied defensive fix."
+    return updated, explanation, True
+
+
+def _try_iteration_patch(action: str, patched: str, explanation: str) -> tuple[str, str, bool]:
+    if action not in {"bounds", "auto"}:
+        return patched, explanation, False
+    updated, changed = _patch_missing_loop_increment(patched)
+    if not changed:
+        return patched, explanation, False
+    if action == "auto":
+        explanation = "Detected missing loop counter update and added an increment step."
+    else:
+        explanation = "Added missing loop counter increment to prevent infinite loops."
+    return updated, explanation, True
+
+
+def _apply_heuristic_fix(issue: str, code: str) -> tuple[str, str]:
+    action, explanation = _detect_action(issue)
+    patched = code
+
+    patched, explanation, changed = _try_division_patch(action, patched, explanation)
+    if changed:
+        return _simple_optimize_python(patched), explanation
+
+    patched, explanation, changed = _try_bounds_patch(action, patched, explanation)
+    if changed:
+        return _simple_optimize_python(patched), explanation
+
+    patched, explanation, changed = _try_iteration_patch(action, patched, explanation)
+    if changed:
+        return _simple_optimize_python(patched), explanation
+
+    patched = _simple_optimize_python(patched)
+    if patched != code:
+        return patched, "Applied safe code cleanup for readability and execution stability."
+    
+    if "Index" in (issue or "") or "Bounds" in (issue or "") or "ZeroDivision" in (issue or ""):
+        return patched, "Potential defect detected. Ensure bounds checks are in place before array access and arithmetic operations."
+    
+    return patched, explanation
+
+
+def _corpus():
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        if os.path.splitext(name)[1] not in EXTS:
+            continue
+        with open(os.path.join(SAMPLES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+            code = f.read()
+        for extra in INJECTIONS:
+            yield name, code + extra
+            yield name, (code + extra).replace("    ", "\t")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    cases = [(name, issue, code) for name, code in _corpus() for issue in ISSUES]
+    changed = 0
+    for name, issue, code in cases:
+        old = _apply_heuristic_fix(issue, code)
+        new = apply_rules(issue, code)
+        assert new == old, f"output differs: {name} / {issue!r}"
+        changed += old[0] != code
+    print(f"parity: {len(cases)} cases identical ({changed} patched)")
+
+    timings = {}
+    for label, fn in (("legacy", _apply_heuristic_fix), ("engine", apply_rules)):
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            for _, issue, code in cases:
+                fn(issue, code)
+        timings[label] = (time.perf_counter() - t0) / (args.repeat * len(cases))
+    print(f"{'impl':8s} {'us/case':>8s} {'cases/s':>9s}")
+    for label, dt in timings.items():
+        print(f"{label:8s} {dt * 1e6:8.1f} {1 / dt:9.0f}")
+    print(f"speedup: {timings['legacy'] / timings['engine']:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Overhead of the stage instrumentation (rag/telemetry.py).
+
+Usage:
+    python bench_telemetry.py [--repeat 20] [--ops 200000] [--max-overhead 1.0]
+
+Every Sample file runs through orchestrator.analyze() in fast mode:
+detector and heuristic only, no model, retrieval or LLM. That is the
+cheapest request (about a millisecond), so the overhead share is largest
+there.
+
+The spans and counter updates one corpus run records are priced with the
+per-operation cost measured in a tight loop, and compared with the corpus
+time with METRICS_ENABLED off. A wall-time A/B run with metrics on and off
+is printed as well. Its run-to-run spread on a shared machine is a few
+percent, far more than the overhead, so only the priced estimate is held
+to --max-overhead (exit 1 above it).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("FAST_ANALYSIS_MODE", "1")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import EXT_TO_LANG
+from rag import orchestrator, telemetry
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample files")
+
+
+def _samples():
+    out = []
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        ext = os.path.splitext(name)[1].lower()
+        if ext in EXT_TO_LANG:
+            with open(os.path.join(SAMPLES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+                out.append((name, EXT_TO_LANG[ext], f.read()))
+    return out
+
+
+def _corpus_s(samples, enabled: bool) -> float:
+    telemetry.METRICS_ENABLED = enabled
+    t0 = time.perf_counter()
+    for name, lang, code in samples:
+        orchestrator.analyze(code, path=name, lang=lang)
+    return time.perf_counter() - t0
+
+
+def _per_op_us(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def _span():
+    with telemetry.span("bench"):
+        pass
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--ops", type=int, default=200_000)
+    ap.add_argument("--max-overhead", type=float, default=1.0, help="percent")
+    args = ap.parse_args()
+
+    span_us = _per_op_us(_span, args.ops)
+    count_us = _per_op_us(lambda: telemetry.count("bench_total", tier="llm", chunked="0"), args.ops)
+    print(f"span: {span_us:.2f} us, counter update: {count_us:.2f} us")
+
+    samples = _samples()
+    _corpus_s(samples, True)  # warm up
+    telemetry.reset()
+    on, off = [], []
+    for _ in range(args.repeat):  # interleaved, so drift hits both sides alike
+        on.append(_corpus_s(samples, True))
+        off.append(_corpus_s(samples, False))
+    telemetry.METRICS_ENABLED = True
+    snap = telemetry.snapshot()
+    spans = sum(s["count"] for s in snap["stages"].values()) / args.repeat
+    updates = sum(v for by_label in snap["counters"].values() for v in by_label.values()) / args.repeat
+
+    median = lambda xs: sorted(xs)[len(xs) // 2]
+    base = median(off)
+    cost_s = (spans * span_us + updates * count_us) / 1e6
+    overhead = cost_s / base * 100
+    print(f"{len(samples)} files: {base * 1000:.1f} ms per corpus; {spans:.0f} spans + {updates:.0f} counter "
+          f"updates = {cost_s * 1000:.3f} ms ({overhead:.2f}%)")
+    spread = (max(off) - min(off)) / base * 100
+    print(f"wall-time A/B: {median(on) * 1000:.1f} ms with, {base * 1000:.1f} ms without "
+          f"({(median(on) - base) / base * 100:+.2f}%, run-to-run spread {spread:.1f}%)")
+    return 0 if overhead < args.max_overhead else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
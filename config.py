@@ -15,6 +15,150 @@ KB_JSONL = os.path.join(BASE_DIR, "kb", "clean_passages.jsonl")
 FAISS_INDEX = os.path.join(BASE_DIR, "index", "faiss", "kb.faiss")
 FAISS_IDS = os.path.join(BASE_DIR, "index", "faiss", "kb.ids")
 
+# ---- LLM prompt budget ----
+# Max prompt tokens (system + code + passages) per generation backend.
+# Override with PROMPT_TOKENS_<BACKEND>, e.g. PROMPT_TOKENS_GROQ=4000.
+PROMPT_TOKEN_BUDGETS = {
+    "groq": int(os.environ.get("PROMPT_TOKENS_GROQ") or 6000),
+    "local": int(os.environ.get("PROMPT_TOKENS_LOCAL") or 3000),
+}
+
+# ---- LLM output contract ----
+# "full": the model returns the whole patched file plus a diff.
+# "hunks": the model returns only find/replace hunks; patched_code and the
+#          unified diff are rebuilt locally (rag/patching.py).
+LLM_OUTPUT_MODE = (os.environ.get("LLM_OUTPUT_MODE") or "full").strip().lower()
+# Groq calls use non-streaming JSON mode (response_format=json_object);
+# latency is timed locally around the call. GROQ_STREAM=1 opts into
+# streaming, parsed incrementally for a real time-to-first-byte, but the
+# streaming request is sent without JSON mode.
+GROQ_STREAM = (os.environ.get("GROQ_STREAM") or "0").strip().lower() in {"1", "true", "yes"}
+
+# ---- Local LLM ----
+# Max requests decoded together by the local inference worker.
+LOCAL_LLM_MAX_BATCH = int(os.environ.get("LOCAL_LLM_MAX_BATCH") or 8)
+# CPU weight format: "fp32" (default), "bf16", or "int8" (dynamic int8 Linear
+# layers). fp32 needs ~6 GB for the 1.5B model; int8 roughly a third of that.
+# Ignored on CUDA, which always loads fp16.
+LOCAL_LLM_QUANT = (os.environ.get("LOCAL_LLM_QUANT") or "fp32").strip().lower()
+
+# ---- Defect model ----
+# With ENABLE_DEFECT_MODEL=1, rag/predictor.py splits long files into
+# overlapping windows of DEFECT_WINDOW_TOKENS tokens (sharing
+# DEFECT_WINDOW_OVERLAP tokens with the previous window) and runs up to
+# DEFECT_MAX_BATCH windows per padded forward pass.
+DEFECT_WINDOW_TOKENS = int(os.environ.get("DEFECT_WINDOW_TOKENS") or 512)
+DEFECT_WINDOW_OVERLAP = int(os.environ.get("DEFECT_WINDOW_OVERLAP") or 128)
+DEFECT_MAX_BATCH = int(os.environ.get("DEFECT_MAX_BATCH") or 8)
+# Runtime for the defect model: "fp32" (transformers, default), "int8"
+# (dynamic int8 Linear layers, CPU only), "onnx" or "onnx-int8" (ONNX
+# Runtime on the files `python export_predictor.py` writes to
+# DEFECT_ONNX_DIR; needs onnxruntime). A missing export falls back to fp32.
+DEFECT_MODEL_FORMAT = (os.environ.get("DEFECT_MODEL_FORMAT") or "fp32").strip().lower()
+DEFECT_ONNX_DIR = os.environ.get("DEFECT_ONNX_DIR") or os.path.join(BASE_DIR, "models", "defect_predictor", "onnx")
+
+# ---- Model server ----
+# Base URL of a running `python -m rag.model_server`, e.g. http://127.0.0.1:8765.
+# When set, rag.retriever, rag.predictor and rag.llm send embed / predict /
+# local-generate calls there instead of loading the models in every web
+# worker. Empty (default) = load models in-process.
+MODEL_SERVER_URL = (os.environ.get("MODEL_SERVER_URL") or "").strip().rstrip("/")
+MODEL_SERVER_TIMEOUT = float(os.environ.get("MODEL_SERVER_TIMEOUT") or 300)  # seconds
+# Server side: bind address and the /embed and /predict micro-batching window.
+MODEL_SERVER_HOST = os.environ.get("MODEL_SERVER_HOST") or "127.0.0.1"
+MODEL_SERVER_PORT = int(os.environ.get("MODEL_SERVER_PORT") or 8765)
+MODEL_SERVER_BATCH_WAIT_MS = float(os.environ.get("MODEL_SERVER_BATCH_WAIT_MS") or 5)
+MODEL_SERVER_MAX_BATCH = int(os.environ.get("MODEL_SERVER_MAX_BATCH") or 32)
+
+# ---- LLM backends ----
+# JSON file with the latency SLO and per-backend priority, weight, expected
+# latency and concurrency used by rag/router.py. Missing file = built-in
+# defaults (remote API, then local Qwen, then heuristic rules).
+LLM_BACKENDS_FILE = os.environ.get("LLM_BACKENDS_FILE") or os.path.join(BASE_DIR, "llm_backends.json")
+
+# ---- Analysis routing ----
+# analyze() runs the deterministic heuristic fixer first and returns its
+# patch without calling an LLM when the detector confidence and the fired
+# rule's certainty both reach these thresholds (and the rule is one that
+# fixes the detected finding, editing only its lines). The detector's rule
+# findings score 0.6-0.9 (rag/detector.py): an unchecked divisor 0.6 / 0.7,
+# a missing loop increment 0.85, x[len(x)] 0.9. So the detector bar admits
+# every finding a rule is mapped to, and the rule certainty does the
+# filtering. HEURISTIC_TIER=0 always escalates to the LLM.
+HEURISTIC_TIER = (os.environ.get("HEURISTIC_TIER") or "1").strip().lower() in {"1", "true", "yes"}
+HEURISTIC_MIN_DETECTOR_CONF = float(os.environ.get("HEURISTIC_MIN_DETECTOR_CONF") or 0.6)
+HEURISTIC_MIN_PATCH_CERTAINTY = float(os.environ.get("HEURISTIC_MIN_PATCH_CERTAINTY") or 0.85)
+
+# ---- Warmup ----
+# Components loaded on background threads at app start, comma-separated:
+# "embedder", "predictor", "llm". "auto" = whichever the current settings
+# will actually use (e.g. no embedder while FAST_ANALYSIS_MODE skips
+# retrieval). "none" disables warmup; /ready then reports ready at once.
+WARMUP_COMPONENTS = (os.environ.get("WARMUP_COMPONENTS") or "auto").strip().lower()
+
+# ---- Memory budget ----
+# rag/memory.py unloads models that have been idle for MODEL_IDLE_S seconds,
+# least recently used first, while process RSS exceeds MEMORY_BUDGET_MB.
+# They reload on next use. 0 = no budget (never evict). The budget is
+# checked after each model load and every MEMORY_CHECK_S seconds.
+MEMORY_BUDGET_MB = float(os.environ.get("MEMORY_BUDGET_MB") or 0)
+MODEL_IDLE_S = float(os.environ.get("MODEL_IDLE_S") or 300)
+MEMORY_CHECK_S = float(os.environ.get("MEMORY_CHECK_S") or 30)
+
 # ---- App ----
 SECRET_KEY = "change-me"
-MAX_CODE_LEN = 20000  # characters
+# Largest input accepted by /analyze and rag.scan (characters). Inputs over
+# CHUNK_THRESHOLD_CHARS are analyzed in chunks, see below.
+MAX_CODE_LEN = int(os.environ.get("MAX_CODE_LEN") or 500000)
+# Source files accepted by /analyze uploads and by `python -m rag.scan`.
+ALLOWED_EXTS = {".py", ".js", ".ts", ".java", ".cpp", ".c", ".cs", ".php", ".rb", ".go", ".rs"}
+EXT_TO_LANG = {
+    ".py": "python", ".js": "javascript", ".ts": "typescript",
+    ".java": "java", ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp",
+    ".c": "c", ".cs": "csharp", ".php": "php", ".rb": "ruby",
+    ".go": "go", ".rs": "rust",
+}
+
+# ---- Chunked analysis ----
+# Inputs longer than CHUNK_THRESHOLD_CHARS are split into functions/classes
+# (rag/chunker.py) of at most CHUNK_MAX_CHARS. The detector runs on every
+# chunk; retrieval and the LLM only on chunks whose detector confidence is
+# at least CHUNK_SUSPECT_CONF (the CHUNK_MAX_SUSPECTS most confident ones),
+# CHUNK_WORKERS at a time. Their patches are stitched back into the file.
+CHUNK_THRESHOLD_CHARS = int(os.environ.get("CHUNK_THRESHOLD_CHARS") or 20000)
+CHUNK_MAX_CHARS = int(os.environ.get("CHUNK_MAX_CHARS") or 6000)
+CHUNK_SUSPECT_CONF = float(os.environ.get("CHUNK_SUSPECT_CONF") or 0.6)
+CHUNK_MAX_SUSPECTS = int(os.environ.get("CHUNK_MAX_SUSPECTS") or 8)
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS") or 4)
+
+# ---- Async pipeline ----
+# rag/orchestrator.py runs its blocking stages on STAGE_WORKERS threads and
+# overlaps them: retrieval for the RETRIEVE_CANDIDATES most likely issue
+# types starts while the defect model is still running, and the first LLM
+# backend is readied meanwhile. Per-stage timeouts in seconds (0 = none),
+# counted from when a worker starts the stage: a late detector falls back
+# to the rule findings, late retrieval to no passages, a late LLM to the
+# heuristic fixer.
+STAGE_WORKERS = int(os.environ.get("STAGE_WORKERS") or 16)
+RETRIEVE_CANDIDATES = int(os.environ.get("RETRIEVE_CANDIDATES") or 3)
+DETECT_TIMEOUT_S = float(os.environ.get("DETECT_TIMEOUT_S") or 15)
+RETRIEVE_TIMEOUT_S = float(os.environ.get("RETRIEVE_TIMEOUT_S") or 10)
+LLM_TIMEOUT_S = float(os.environ.get("LLM_TIMEOUT_S") or 180)
+
+# ---- Telemetry ----
+# Per-stage latency histograms and cache / fallback / error counters
+# (rag/telemetry.py), served in the Prometheus text format at /metrics.
+METRICS_ENABLED = (os.environ.get("METRICS_ENABLED") or "1").strip().lower() in {"1", "true", "yes"}
+# Histogram bucket upper bounds in seconds (+Inf is implicit).
+METRICS_BUCKETS_S = tuple(
+    float(b) for b in (os.environ.get("METRICS_BUCKETS_S") or "0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(",")
+)
+
+# ---- Repository scan ----
+# `python -m rag.scan` worker processes; 0 = one per CPU core.
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS") or 0)
+# Directory names never descended into.
+SCAN_SKIP_DIRS = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", "env", "build", "dist", ".tox"}
+# Per-file result cache, keyed by git blob hash + detector / KB index version,
+# so rescans only re-analyze files whose content changed.
+SCAN_CACHE_FILE = os.environ.get("SCAN_CACHE_FILE") or os.path.join(BASE_DIR, "index", "scan_cache.sqlite")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Exports the defect model (config.DEFECT_PREDICTOR_DIR) for ONNX Runtime and
+checks that the faster formats still agree with it.
+
+Usage:
+    python export_predictor.py [--out DIR] [--opset 17] [--no-int8]
+                               [--check-only] [--formats int8,onnx,onnx-int8]
+                               [--min-agreement 0.98]
+
+Writes to --out (default config.DEFECT_ONNX_DIR):
+- model.onnx       fp32 graph with dynamic batch and sequence axes
+- model.int8.onnx  the same graph with dynamic int8 MatMul weights
+- the checkpoint's tokenizer and config
+Select one with DEFECT_MODEL_FORMAT=onnx / onnx-int8 (needs onnxruntime;
+the export also needs the onnx package).
+
+Parity check: every file in "Sample files" runs through the windowed
+inference of rag/predictor.py with the fp32 torch model and with each of
+--formats. The report is the share of tokens whose label (argmax) matches
+fp32, and the share of files whose findings (label and line span) match
+exactly. Exits 1 when any format agrees on fewer than --min-agreement of the
+tokens. Load time and latency: bench_predictor_formats.py.
+"""
+
+import argparse
+import os
+import sys
+
+os.environ["ENABLE_DEFECT_MODEL"] = "1"
+os.environ.pop("MODEL_SERVER_URL", None)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+SAMPLES_DIR = os.path.join(ROOT, "Sample files")
+
+from config import DEFECT_ONNX_DIR, DEFECT_PREDICTOR_DIR, EXT_TO_LANG  # noqa: E402
+from rag import predictor  # noqa: E402
+
+
+def export(out: str, opset: int, int8: bool) -> None:
+    import torch
+    from transformers import AutoModelForTokenClassification
+
+    os.makedirs(out, exist_ok=True)
+    tok = predictor._load_tokenizer(DEFECT_PREDICTOR_DIR)
+    model = AutoModelForTokenClassification.from_pretrained(DEFECT_PREDICTOR_DIR).eval()
+    if getattr(model.config, "pad_token_id", None) is None:
+        model.config.pad_token_id = tok.pad_token_id
+
+    class _Logits(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask).logits
+
+    sample = tok(["def f(xs):\n    return xs[len(xs)]\n"] * 2, return_tensors="pt")
+    path = os.path.join(out, predictor.ONNX_FILES["onnx"])
+    axes = {0: "batch", 1: "sequence"}
+    with torch.inference_mode():
+        torch.onnx.export(
+            _Logits(model),
+            (sample["input_ids"], sample["attention_mask"]),
+            path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={"input_ids": axes, "attention_mask": axes, "logits": axes},
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    tok.save_pretrained(out)
+    model.config.save_pretrained(out)
+    print(f"[export] {path} ({os.path.getsize(path) / 2**20:.0f} MB)")
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        qpath = os.path.join(out, predictor.ONNX_FILES["onnx-int8"])
+        quantize_dynamic(path, qpath, weight_type=QuantType.QInt8)
+        print(f"[export] {qpath} ({os.path.getsize(qpath) / 2**20:.0f} MB)")
+
+
+def _samples() -> list[str]:
+    out = []
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        if os.path.splitext(name)[1].lower() in EXT_TO_LANG:
+            with open(os.path.join(SAMPLES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+                out.append(f.read())
+    return out
+
+
+def _run(codes: list[str]) -> tuple[list, list]:
+    labels, findings = [], []
+    for code in codes:
+        merged, _ = predictor._token_probs(code)
+        labels.append(merged.argmax(-1) if merged is not None else None)
+        findings.append([(f["issue_type"], f["span_lines"]) for f in predictor._model_findings(code)])
+    return labels, findings
+
+
+def parity(formats: list[str], min_agreement: float) -> bool:
+    codes = _samples()
+    predictor._load_or_none("fp32")
+    if predictor._model is None:
+        print(f"[parity] fp32 model not loaded from {DEFECT_PREDICTOR_DIR}")
+        return False
+    ref_labels, ref_findings = _run(codes)
+
+    ok = True
+    print(f"{'format':10s} {'tokens agree':>13s} {'files same':>11s}")
+    for fmt in formats:
+        predictor._load_or_none(fmt)
+        if predictor._model is None or (fmt in predictor.ONNX_FILES) != isinstance(predictor._model, predictor._OnnxTokenClassifier):
+            print(f"{fmt:10s} not available")
+            ok = False
+            continue
+        labels, findings = _run(codes)
+        same = total = 0
+        for a, b in zip(ref_labels, labels):
+            if a is not None and b is not None:
+                same += int((a == b).sum())
+                total += len(a)
+        agreement = same / total if total else 1.0
+        files_same = sum(a == b for a, b in zip(ref_findings, findings))
+        print(f"{fmt:10s} {agreement:13.4f} {files_same:>5d}/{len(codes):<5d}")
+        ok = ok and agreement >= min_agreement
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--out", default=DEFECT_ONNX_DIR)
+    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument("--no-int8", action="store_true", help="skip the int8 ONNX model")
+    ap.add_argument("--check-only", action="store_true", help="only run the parity check")
+    ap.add_argument("--formats", default="int8,onnx,onnx-int8", help="formats compared against fp32")
+    ap.add_argument("--min-agreement", type=float, default=0.98, help="token label agreement required")
+    args = ap.parse_args()
+
+    if not args.check_only:
+        export(args.out, args.opset, not args.no_int8)
+    if os.path.abspath(args.out) != os.path.abspath(DEFECT_ONNX_DIR):
+        predictor.DEFECT_ONNX_DIR = args.out
+    formats = [f for f in args.formats.split(",") if f and not (args.no_int8 and f == "onnx-int8")]
+    return 0 if parity(formats, args.min_agreement) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""Continuous-batching inference worker for the local causal LM.
+
+HF models are not thread-safe, and one generate() per request serializes
+concurrent users. Instead a single worker thread owns the model and keeps a
+set of in-flight requests:
+- new requests are admitted between decode steps and prefilled on their own
+  (on top of a copy of the shared prompt-prefix KV cache when given)
+- every decode step runs ONE forward pass for all in-flight requests over a
+  shared batch cache: the per-request caches are left-padded to the same
+  length and masked once, when the batch membership changes, and the model's
+  output cache is fed straight back in while it stays the same
+- each request stops on its own (EOS, max_new_tokens, or a stop callback)
+  and its Future resolves immediately, freeing the slot for the next request
+
+Public API:
+- InferenceWorker(model, tokenizer, prefix=None, max_batch=8)
+- InferenceWorker.submit(prompt, max_new_tokens, stop=None, logits_processor=None) -> Future[str]
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# stop(token_id, piece) -> True to finish the request after this token.
+StopFn = Callable[[int, str], bool]
+# logits_processor(generated_ids, scores[vocab]) -> scores[vocab]
+LogitsFn = Callable[[list[int], torch.Tensor], torch.Tensor]
+
+
+def _cache_layers(past) -> list[tuple[torch.Tensor, torch.Tensor]]:
+    """Returns the cache as [(key, value)] per layer, whatever its container."""
+    if hasattr(past, "to_legacy_cache"):
+        past = past.to_legacy_cache()
+    return [(k, v) for k, v in past]
+
+
+def _make_cache(layers: list[tuple[torch.Tensor, torch.Tensor]]):
+    try:
+        from transformers import DynamicCache
+
+        return DynamicCache.from_legacy_cache(tuple(layers))
+    except Exception:
+        return tuple(layers)
+
+
+class _Request:
+    __slots__ = (
+        "ids", "max_new_tokens", "stop", "logits_processor", "future", "generated", "layers", "length", "next_token", "row"
+    )
+
+    def __init__(self, ids, max_new_tokens, stop, logits_processor):
+        self.ids: torch.Tensor = ids
+        self.max_new_tokens: int = max_new_tokens
+        self.stop: StopFn | None = stop
+        self.logits_processor: LogitsFn | None = logits_processor
+        self.future: Future = Future()
+        self.generated: list[int] = []
+        self.layers: list[tuple[torch.Tensor, torch.Tensor]] = []
+        self.length = 0
+        self.next_token = -1
+        self.row = -1  # row in the worker's batch cache; -1 while r.layers holds its own cache
+
+
+class InferenceWorker:
+    def __init__(self, model, tokenizer, prefix: str | None = None, max_batch: int = 8):
+        self.model = model
+        self.tok = tokenizer
+        self.max_batch = max(1, int(max_batch))
+        self.prefix = prefix or ""
+        self._prefix_ids: torch.Tensor | None = None
+        self._prefix_layers: list[tuple[torch.Tensor, torch.Tensor]] | None = None
+
+        eos = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+        if eos is None:
+            eos = tokenizer.eos_token_id
+        self._eos = set(eos if isinstance(eos, (list, tuple)) else [eos]) - {None}
+
+        self._queue: queue.Queue[_Request | None] = queue.Queue()
+        self._active: list[_Request] = []
+        # Batch cache of the last decode step: per-layer (key, value) of shape
+        # [len(_members), heads, _width, dim], each row left-padded, and the
+        # matching attention mask.
+        self._members: list[_Request] = []
+        self._layers: list[tuple[torch.Tensor, torch.Tensor]] = []
+        self._mask: torch.Tensor | None = None
+        self._width = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="llm-inference-worker", daemon=True)
+        self._thread.start()
+
+    # ---------- public ----------
+    def submit(
+        self,
+        prompt: str,
+        max_new_tokens: int = 1024,
+        stop: StopFn | None = None,
+        logits_processor: LogitsFn | None = None,
+    ) -> Future:
+        """Queues `prompt` (appended to the worker's prefix); the Future yields the decoded completion."""
+        if self._closed:
+            raise RuntimeError("inference worker is shut down")
+        ids = self.tok(prompt, add_special_tokens=False, return_tensors="pt").input_ids[0]
+        req = _Request(ids, max_new_tokens, stop, logits_processor)
+        self._queue.put(req)
+        return req.future
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._closed = True
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def stats(self) -> dict[str, int]:
+        return {"in_flight": len(self._active), "queued": self._queue.qsize(), "max_batch": self.max_batch}
+
+    # ---------- worker thread ----------
+    def _run(self) -> None:
+        with torch.inference_mode():
+            while True:
+                if not self._admit():
+                    break
+                if self._active:
+                    try:
+                        self._decode_step()
+                    except Exception as e:
+                        logger.exception("[llm-worker] decode step failed")
+                        for r in self._active:
+                            r.future.set_exception(e)
+                        self._active = []
+                        self._members, self._layers, self._mask = [], [], None
+        for r in self._active:
+            r.future.set_exception(RuntimeError("inference worker is shut down"))
+
+    def _admit(self) -> bool:
+        # Block only when idle; otherwise just drain what is already queued.
+        while len(self._active) < self.max_batch:
+            try:
+                req = self._queue.get(block=not self._active)
+            except queue.Empty:
+                return True
+            if req is None:
+                return False
+            if not req.future.set_running_or_notify_cancel():
+                continue
+            try:
+                self._prefill(req)
+            except Exception as e:
+                logger.exception("[llm-worker] prefill failed")
+                req.future.set_exception(e)
+                continue
+            if not self._accept(req, req.next_token):
+                self._active.append(req)
+        return True
+
+    def _ensure_prefix(self) -> None:
+        if self._prefix_layers is not None or not self.prefix:
+            return
+        ids = self.tok(self.prefix, add_special_tokens=False, return_tensors="pt").input_ids.to(self.model.device)
+        out = self.model(input_ids=ids, use_cache=True)
+        self._prefix_ids = ids[0]
+        self._prefix_layers = _cache_layers(out.past_key_values)
+
+    def _prefill(self, req: _Request) -> None:
+        self._ensure_prefix()
+        device = self.model.device
+        ids = req.ids.to(device).unsqueeze(0)
+        if self._prefix_layers is not None:
+            past = _make_cache(copy.deepcopy(self._prefix_layers))
+            total = self._prefix_ids.shape[0] + ids.shape[1]
+            out = self.model(
+                input_ids=ids,
+                attention_mask=torch.ones((1, total), dtype=torch.long, device=device),
+                past_key_values=past,
+                use_cache=True,
+            )
+        else:
+            total = ids.shape[1]
+            out = self.model(input_ids=ids, use_cache=True)
+        req.layers = _cache_layers(out.past_key_values)
+        req.length = total
+        req.next_token = self._pick(req, out.logits[0, -1])
+
+    def _pick(self, req: _Request, scores: torch.Tensor) -> int:
+        if req.logits_processor is not None:
+            scores = req.logits_processor(req.generated, scores)
+        return int(torch.argmax(scores).item())
+
+    def _accept(self, req: _Request, token: int) -> bool:
+        """Records `token` for req; resolves the future and returns True when req is done."""
+        done = token in self._eos
+        if not done:
+            req.generated.append(token)
+            if req.stop is not None:
+                piece = self.tok.decode([token], skip_special_tokens=True)
+                done = bool(req.stop(token, piece))
+            done = done or len(req.generated) >= req.max_new_tokens
+        if done:
+            req.future.set_result(self.tok.decode(req.generated, skip_special_tokens=True))
+            req.layers = []
+        return done
+
+    def _repack(self, batch: list[_Request]) -> None:
+        """Rebuilds the batch cache for `batch`: O(seq * batch) copies, once per membership change."""
+        device = self.model.device
+        for r in batch:
+            if r.row >= 0:  # still in the old batch cache; cut out its unpadded row
+                start = self._width - r.length
+                r.layers = [(k[r.row : r.row + 1, :, start:], v[r.row : r.row + 1, :, start:]) for k, v in self._layers]
+        width = max(r.length for r in batch)
+
+        # Left-pad every cache to width so one forward covers the batch.
+        layers = []
+        for li in range(len(batch[0].layers)):
+            ks, vs = [], []
+            for r in batch:
+                k, v = r.layers[li]
+                pad = width - r.length
+                if pad:
+                    k = torch.nn.functional.pad(k, (0, 0, pad, 0))
+                    v = torch.nn.functional.pad(v, (0, 0, pad, 0))
+                ks.append(k)
+                vs.append(v)
+            layers.append((torch.cat(ks, dim=0), torch.cat(vs, dim=0)))
+
+        mask = torch.zeros((len(batch), width), dtype=torch.long, device=device)
+        for b, r in enumerate(batch):
+            mask[b, width - r.length :] = 1
+            r.row = b
+            r.layers = []
+        self._members, self._layers, self._mask, self._width = list(batch), layers, mask, width
+
+    def _decode_step(self) -> None:
+        batch = self._active
+        device = self.model.device
+        if batch != self._members:
+            self._repack(batch)
+
+        mask = torch.cat([self._mask, torch.ones((len(batch), 1), dtype=torch.long, device=device)], dim=1)
+        input_ids = torch.tensor([[r.next_token] for r in batch], dtype=torch.long, device=device)
+        position_ids = torch.tensor([[r.length] for r in batch], dtype=torch.long, device=device)
+
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=_make_cache(self._layers),
+            use_cache=True,
+        )
+        # Every row grew by one token, so the padding stays aligned and the
+        # output cache is next step's input as is.
+        self._layers = _cache_layers(out.past_key_values)
+        self._mask = mask
+        self._width += 1
+        logits = out.logits[:, -1]
+
+        still: list[_Request] = []
+        for b, r in enumerate(batch):
+            r.length += 1
+            r.next_token = self._pick(r, logits[b])
+            if not self._accept(r, r.next_token):
+                still.append(r)
+        self._active = still
+        if not still:  # idle: do not hold the batch cache until the next request
+            self._members, self._layers, self._mask = [], [], None
@@ -0,0 +1,327 @@
+"""Prompt token budgeting for the fix generators.
+
+The code and retrieved passages are the only unbounded parts of the prompt.
+When they don't fit the backend's cap (config.PROMPT_TOKEN_BUDGETS) we:
+- drop the lowest-scoring passages first
+- elide code lines far from the predicted span, keeping the headers of the
+  enclosing functions/classes so the model still sees where it is
+
+Elided regions are replaced by a single marker comment line each, so the
+model's patched excerpt can be stitched back into the full file with
+restore_elided().
+
+Public API:
+- count_tokens(text, backend) -> int
+- fit_prompt(code, passages, span, lang, backend, overhead_tokens) -> (code, passages, stats)
+- restore_elided(original, patched, stats, lang) -> str | None
+- excerpt_line_to_original(stats, line) -> int
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from typing import Any, Callable
+
+from config import CODER_LLM_DIR, PROMPT_TOKEN_BUDGETS
+
+_DEFAULT_BUDGET = 6000
+# Share of the budget the code may claim before passages are trimmed.
+_CODE_SHARE = 0.75
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_MARKER_RE = re.compile(r"^\s*(?:#|//)\s*\.\.\. (\d+) lines? elided \.\.\.\s*$")
+
+_counters: dict[str, Callable[[str], int]] = {}
+_counters_lock = threading.Lock()
+
+
+def _approx_count(text: str) -> int:
+    # BPE vocabularies keep short words whole and split long identifiers in
+    # roughly 4-char pieces; punctuation is almost always its own token.
+    n = 0
+    for m in _WORD_RE.finditer(text):
+        w = len(m.group())
+        n += 1 if w <= 4 else (w + 3) // 4
+    return n
+
+
+def _load_counter(backend: str) -> Callable[[str], int]:
+    if backend == "local":
+        try:
+            from transformers import AutoTokenizer
+
+            tok = AutoTokenizer.from_pretrained(CODER_LLM_DIR, use_fast=True)
+            return lambda text: len(tok.encode(text, add_special_tokens=False))
+        except Exception as e:
+            print("[budget] local tokenizer unavailable, using estimate:", e)
+    else:
+        try:
+            import tiktoken  # type: ignore
+
+            enc = tiktoken.get_encoding("cl100k_base")
+            return lambda text: len(enc.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    return _approx_count
+
+
+def count_tokens(text: str, backend: str = "groq") -> int:
+    """Counts prompt tokens with the backend's tokenizer (or a close estimate)."""
+    counter = _counters.get(backend)
+    if counter is None:
+        with _counters_lock:
+            counter = _counters.get(backend)
+            if counter is None:
+                counter = _load_counter(backend)
+                _counters[backend] = counter
+    return counter(text or "")
+
+
+def _parse_span(span: str, n_lines: int) -> tuple[int, int] | None:
+    m = re.match(r"^\s*(\d+)\s*(?:-\s*(\d+))?", str(span or ""))
+    if not m:
+        return None
+    start = int(m.group(1))
+    end = int(m.group(2) or start)
+    if start > end:
+        start, end = end, start
+    start = min(max(start, 1), n_lines)
+    end = min(max(end, start), n_lines)
+    return start - 1, end - 1
+
+
+def _comment_prefix(lang: str) -> str:
+    return "#" if (lang or "").lower() in {"python", "py", "ruby", "rb"} else "//"
+
+
+_PY_HEADER_RE = re.compile(r"^\s*(?:async\s+def|def|class)\s")
+_BRACE_CONTROL_RE = re.compile(r"^\s*(?:\}\s*)?(?:if|else|for|while|do|switch|case|catch|try|finally)\b")
+
+
+def _python_headers(lines: list[str], first: int) -> list[int]:
+    headers: list[int] = []
+    indent = len(lines[first]) - len(lines[first].lstrip())
+    for i in range(first - 1, -1, -1):
+        line = lines[i]
+        if not line.strip():
+            continue
+        ind = len(line) - len(line.lstrip())
+        if ind < indent:
+            indent = ind
+            if _PY_HEADER_RE.match(line):
+                headers.append(i)
+            if ind == 0:
+                break
+    return headers
+
+
+def _brace_headers(lines: list[str], first: int) -> list[int]:
+    headers: list[int] = []
+    depth = 0
+    for i in range(first - 1, -1, -1):
+        line = lines[i]
+        depth += line.count("}") - line.count("{")
+        if depth < 0:
+            depth = 0
+            # Opening brace may sit on its own line under the signature.
+            j = i
+            if line.strip() == "{" and i > 0:
+                j = i - 1
+            if not _BRACE_CONTROL_RE.match(lines[j]):
+                headers.append(j)
+    return headers
+
+
+def _enclosing_headers(lines: list[str], first: int, lang: str) -> list[int]:
+    if (lang or "").lower() in {"python", "py"}:
+        return _python_headers(lines, first)
+    return _brace_headers(lines, first)
+
+
+def _elide_code(code: str, span: str, lang: str, budget: int, backend: str) -> tuple[str, list[list[int]]]:
+    lines = code.splitlines()
+    if not lines:
+        return code, []
+    cost = [count_tokens(line, backend) + 1 for line in lines]
+    marker_cost = count_tokens(f"{_comment_prefix(lang)} ... 0000 lines elided ...", backend) + 1
+
+    bounds = _parse_span(span, len(lines))
+    lo, hi = bounds if bounds else (0, 0)
+    keep = set(range(lo, hi + 1))
+    used = sum(cost[i] for i in keep)
+
+    for h in _enclosing_headers(lines, lo, lang):
+        if used + cost[h] + marker_cost <= budget:
+            keep.add(h)
+            used += cost[h]
+
+    # Grow a window around the span, alternating down/up, while it fits.
+    # Each side may need a marker for the region it leaves out.
+    up, down = lo - 1, hi + 1
+    while up >= 0 or down < len(lines):
+        grew = False
+        for side in ("down", "up"):
+            i = down if side == "down" else up
+            if not 0 <= i < len(lines):
+                continue
+            if i in keep:
+                grew = True
+            elif used + cost[i] + 2 * marker_cost <= budget:
+                keep.add(i)
+                used += cost[i]
+                grew = True
+            else:
+                continue
+            if side == "down":
+                down += 1
+            else:
+                up -= 1
+        if not grew:
+            break
+
+    ranges: list[list[int]] = []
+    for i in sorted(keep):
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+
+    prefix = _comment_prefix(lang)
+    out: list[str] = []
+    pos = 0
+    for start, end in ranges:
+        if start > pos:
+            out.append(f"{prefix} ... {start - pos} lines elided ...")
+        out.extend(lines[start:end])
+        pos = end
+    if pos < len(lines):
+        out.append(f"{prefix} ... {len(lines) - pos} lines elided ...")
+    # Report 1-based inclusive ranges, like the detector's span_lines.
+    return "\n".join(out), [[s + 1, e] for s, e in ranges]
+
+
+def fit_prompt(
+    code: str,
+    passages: list[dict[str, Any]],
+    span: str,
+    lang: str,
+    backend: str = "groq",
+    overhead_tokens: int = 0,
+) -> tuple[str, list[dict[str, Any]], dict[str, Any]]:
+    """
+    Trims passages and code so the prompt fits the backend's token cap.
+
+    Returns (code, passages, stats). stats records the cap, the prompt size
+    after trimming and the tokens dropped from code and passages; it is also
+    what restore_elided() needs to stitch the patched excerpt back together.
+    """
+    cap = int(PROMPT_TOKEN_BUDGETS.get(backend, _DEFAULT_BUDGET))
+    available = max(cap - overhead_tokens, 0)
+
+    code_tokens = count_tokens(code, backend)
+    ranked = sorted(
+        enumerate(passages or []),
+        key=lambda ip: (-float(ip[1].get("score", 0.0) or 0.0), ip[0]),
+    )
+    passage_tokens = [count_tokens(p.get("text", "") + p.get("title", ""), backend) + 8 for _, p in ranked]
+
+    stats: dict[str, Any] = {
+        "backend": backend,
+        "cap": cap,
+        "code_tokens": code_tokens,
+        "passage_tokens": sum(passage_tokens),
+        "code_tokens_dropped": 0,
+        "passage_tokens_dropped": 0,
+        "passages_dropped": 0,
+        "code_ranges": None,
+    }
+
+    if code_tokens + sum(passage_tokens) <= available:
+        stats["prompt_tokens"] = overhead_tokens + code_tokens + sum(passage_tokens)
+        return code, list(passages or []), stats
+
+    # Passages may use whatever the code leaves, but never squeeze the code
+    # below its share of the budget.
+    passage_budget = available - min(code_tokens, int(available * _CODE_SHARE))
+    kept_idx: list[int] = []
+    used = 0
+    for (idx, _), n in zip(ranked, passage_tokens):
+        if used + n <= passage_budget:
+            kept_idx.append(idx)
+            used += n
+        else:
+            stats["passages_dropped"] += 1
+            stats["passage_tokens_dropped"] += n
+    kept = [passages[i] for i in sorted(kept_idx)]
+
+    code_budget = available - used
+    if code_tokens > code_budget:
+        trimmed, ranges = _elide_code(code, span, lang, code_budget, backend)
+        trimmed_tokens = count_tokens(trimmed, backend)
+        stats["code_tokens_dropped"] = max(code_tokens - trimmed_tokens, 0)
+        stats["code_ranges"] = ranges
+        code, code_tokens = trimmed, trimmed_tokens
+
+    stats["prompt_tokens"] = overhead_tokens + code_tokens + used
+    return code, kept, stats
+
+
+def restore_elided(original: str, patched: str, stats: dict[str, Any] | None, lang: str = "") -> str | None:
+    """
+    Puts the elided regions of `original` back into a patched excerpt.
+
+    Each marker line in `patched` is replaced, in order, by the lines it stood
+    for. Returns None when the model dropped or invented markers, since the
+    excerpt can no longer be mapped back onto the file.
+    """
+    ranges = (stats or {}).get("code_ranges")
+    if not ranges:
+        return patched
+
+    lines = original.splitlines()
+    gaps: list[list[str]] = []
+    pos = 0
+    for start, end in ranges:
+        if start - 1 > pos:
+            gaps.append(lines[pos : start - 1])
+        pos = end
+    if pos < len(lines):
+        gaps.append(lines[pos:])
+
+    out: list[str] = []
+    g = 0
+    for line in (patched or "").splitlines():
+        if _MARKER_RE.match(line):
+            if g >= len(gaps):
+                return None
+            out.extend(gaps[g])
+            g += 1
+        else:
+            out.append(line)
+    if g != len(gaps):
+        return None
+    text = "\n".join(out)
+    if original.endswith("\n"):
+        text += "\n"
+    return text
+
+
+def excerpt_line_to_original(stats: dict[str, Any] | None, line: int) -> int:
+    """Maps a 1-based line number in the elided excerpt to the original file."""
+    ranges = (stats or {}).get("code_ranges")
+    if not ranges:
+        return line
+    pos = 0  # last original line emitted
+    seen = 0  # excerpt lines emitted
+    for start, end in ranges:
+        if start - 1 > pos:
+            seen += 1  # marker line
+            if line == seen:
+                return pos + 1
+        size = end - start + 1
+        if line <= seen + size:
+            return start + (line - seen - 1)
+        seen += size
+        pos = end
+    return pos + 1
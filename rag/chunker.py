@@ -0,0 +1,204 @@
+"""Splits large source files into function/class-sized chunks.
+
+Python is split on top-level statements with `ast` (a def or class, with
+its decorators, is one chunk; runs of other statements form "module"
+chunks). Brace languages (C/C++/C#/Java/JS/TS/Go/Rust/PHP) are split on
+top-level `{...}` blocks after rag.detector.mask() has blanked strings and
+comments, so braces inside them do not count; the lines before a block
+(signature, annotations, comments) belong to it. A class or block larger
+than `max_chars` is split again into its members, anything else that is
+still too large (or a file that does not parse) into runs of lines,
+preferably at blank lines.
+
+Chunks are contiguous and cover every line, so replacing each chunk's text
+with its patched text and concatenating (stitch) rebuilds the whole file.
+
+Public API:
+- Chunk(start, end, kind, name, text)     1-based inclusive line range
+- chunk(code, lang, max_chars=CHUNK_MAX_CHARS) -> list[Chunk]
+- stitch(code, chunks, patched: dict[int, str]) -> str
+                                          patched maps chunk index -> new text
+"""
+
+from __future__ import annotations
+
+import ast
+import re
+from dataclasses import dataclass
+
+from config import CHUNK_MAX_CHARS
+from rag.detector import mask
+
+_LINE_RE = re.compile(r".*?(?:\r\n|\r|\n)|.+", re.S)
+_BRACE_LANGS = {"c", "cpp", "csharp", "java", "javascript", "typescript", "go", "rust", "php"}
+_CALL_NAME_RE = re.compile(r"([A-Za-z_$][\w$]*)\s*(?:<[^<>]*>\s*)?\(")
+_TYPE_NAME_RE = re.compile(r"\b(?:class|struct|interface|enum|trait|impl|namespace|module|object)\s+([A-Za-z_$][\w$]*)")
+_NOT_NAMES = {"if", "for", "while", "switch", "catch", "return", "function", "sizeof", "typeof"}
+
+
+@dataclass(frozen=True)
+class Chunk:
+    start: int
+    end: int
+    kind: str  # "function" | "class" | "method" | "block" | "module"
+    name: str
+    text: str
+
+    @property
+    def span_lines(self) -> str:
+        return f"{self.start}-{self.end}"
+
+
+# A unit is (start, end, kind, name) with 0-based inclusive line indexes.
+_Unit = tuple[int, int, str, str]
+
+
+def _lines(code: str) -> list[str]:
+    # Line breaks as ast counts them (\n, \r\n, \r), endings kept.
+    return _LINE_RE.findall(code)
+
+
+def _size(lines: list[str], lo: int, hi: int) -> int:
+    return sum(len(lines[i]) for i in range(lo, hi + 1))
+
+
+def _split_lines(lines: list[str], lo: int, hi: int, kind: str, name: str, max_chars: int) -> list[_Unit]:
+    """Runs of at most ~max_chars, cut at the last blank line when there is one."""
+    out: list[_Unit] = []
+    start, size, blank = lo, 0, None
+    for i in range(lo, hi + 1):
+        size += len(lines[i])
+        if not lines[i].strip() and i > start:
+            blank = i
+        if size > max_chars and i > start:
+            cut = blank if blank is not None and blank > start else i - 1
+            out.append((start, cut, kind, name))
+            start, blank = cut + 1, None
+            size = _size(lines, start, i)
+    out.append((start, hi, kind, name))
+    if len(out) > 1:
+        out = [(a, b, k, f"{n}#{j}") for j, (a, b, k, n) in enumerate(out, 1)]
+    return out
+
+
+def _python_units(lines: list[str], body: list[ast.stmt], prefix: str, max_chars: int) -> list[_Unit]:
+    units: list[_Unit] = []
+    for node in body:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+        end = node.end_lineno - 1
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            is_class = isinstance(node, ast.ClassDef)
+            name = prefix + node.name
+            kind = "class" if is_class else ("method" if prefix else "function")
+            if _size(lines, start, end) <= max_chars:
+                units.append((start, end, kind, name))
+            elif is_class:
+                inner = _python_units(lines, node.body, name + ".", max_chars)
+                head = inner[0][0] - 1 if inner else end
+                if head >= start:
+                    units.append((start, head, kind, name))
+                units.extend(inner)
+            else:
+                units.extend(_split_lines(lines, start, end, kind, name, max_chars))
+        elif units and units[-1][2] == "module" and units[-1][3] == prefix.rstrip("."):
+            units[-1] = (units[-1][0], end, "module", units[-1][3])
+        else:
+            units.append((start, end, "module", prefix.rstrip(".")))
+    out: list[_Unit] = []
+    for a, b, kind, name in units:
+        if kind == "module" and _size(lines, a, b) > max_chars:
+            out.extend(_split_lines(lines, a, b, kind, name, max_chars))
+        else:
+            out.append((a, b, kind, name))
+    return out
+
+
+def _brace_name(header: str) -> tuple[str, str]:
+    header = re.split(r"[;}]", header)[-1]  # statements before the block's own header
+    m = _TYPE_NAME_RE.search(header)
+    if m:
+        return "class", m.group(1)
+    names = [n for n in _CALL_NAME_RE.findall(header) if n not in _NOT_NAMES]
+    return ("function", names[-1]) if names else ("block", "")
+
+
+def _brace_units(lines: list[str], masked: list[str], lo: int, hi: int, prefix: str, max_chars: int) -> list[_Unit]:
+    units: list[_Unit] = []
+    depth, start, opened = 0, None, None
+    for i in range(lo, hi + 1):
+        text = masked[i]
+        if start is None and text.strip():
+            start, opened = i, None
+        for ch in text:
+            if ch == "{":
+                if depth == 0 and opened is None:
+                    opened = i
+                depth += 1
+            elif ch == "}":
+                depth = max(0, depth - 1)
+        if start is not None and opened is not None and depth == 0:
+            header = "".join(masked[start : opened + 1])
+            header = header[: header.find("{")] if "{" in header else header
+            kind, name = _brace_name(header)
+            name = prefix + name if name else prefix.rstrip(".")
+            if kind == "function" and prefix:
+                kind = "method"
+            units.extend(_fit_brace(lines, masked, start, i, opened, kind, name, max_chars))
+            start = None
+    if start is not None:
+        units.extend(_split_lines(lines, start, hi, "module", prefix.rstrip("."), max_chars))
+    return units
+
+
+def _fit_brace(lines, masked, start, end, opened, kind, name, max_chars) -> list[_Unit]:
+    if _size(lines, start, end) <= max_chars:
+        return [(start, end, kind, name)]
+    if kind not in ("class", "block"):  # a function body is cut into line runs, not statements
+        return _split_lines(lines, start, end, kind, name, max_chars)
+    inner = _brace_units(lines, masked, opened + 1, end - 1, name + "." if name else "", max_chars) if end - 1 > opened else []
+    if len(inner) <= 1:  # nothing to split on
+        return _split_lines(lines, start, end, kind, name, max_chars)
+    return [(start, inner[0][0] - 1, kind, name)] + inner
+
+
+def _units(code: str, lines: list[str], lang: str, max_chars: int) -> list[_Unit]:
+    if lang == "python":
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            return _split_lines(lines, 0, len(lines) - 1, "module", "", max_chars)
+        return _python_units(lines, tree.body, "", max_chars)
+    if lang in _BRACE_LANGS:
+        return _brace_units(lines, _lines(mask(code, lang)), 0, len(lines) - 1, "", max_chars)
+    return _split_lines(lines, 0, len(lines) - 1, "module", "", max_chars)
+
+
+def chunk(code: str, lang: str = "python", max_chars: int = CHUNK_MAX_CHARS) -> list[Chunk]:
+    """Contiguous chunks covering all of `code`, in file order."""
+    lines = _lines(code)
+    if not lines:
+        return []
+    units = sorted(u for u in _units(code, lines, lang, max_chars) if u[0] <= u[1])
+    # Close the gaps: blank lines and comments between units go to the
+    # previous unit (the first unit starts at line 1).
+    bounds: list[_Unit] = []
+    for j, (a, b, kind, name) in enumerate(units):
+        a = 0 if j == 0 else max(a, bounds[-1][1] + 1)
+        b = len(lines) - 1 if j == len(units) - 1 else max(a, units[j + 1][0] - 1)
+        if a <= b:
+            bounds.append((a, b, kind, name))
+    if not bounds:
+        bounds = [(0, len(lines) - 1, "module", "")]
+    return [Chunk(a + 1, b + 1, kind, name or "<module>", "".join(lines[a : b + 1])) for a, b, kind, name in bounds]
+
+
+def stitch(code: str, chunks: list[Chunk], patched: dict[int, str]) -> str:
+    """`code` with the text of chunks[i] replaced by patched[i]."""
+    parts = []
+    for i, c in enumerate(chunks):
+        text = patched.get(i, c.text)
+        ending = c.text[len(c.text.rstrip("\r\n")) :]
+        if ending and not text.endswith(("\n", "\r")):
+            text += ending
+        parts.append(text)
+    return "".join(parts)
@@ -0,0 +1,210 @@
+"""Schema-constrained JSON decoding for the local model.
+
+The fix response always has the same shape:
+
+    {"root_cause": "...", "fix_explanation": "...", "patched_code": "...",
+     "patch_unified_diff": "...", "references": ["...", ...], "confidence": 0.9}
+
+JsonConstraint tracks that shape character by character. Before each token
+is picked it masks the logits so only tokens that keep the output a valid
+prefix of such an object survive, and it reports "stop" as soon as the
+closing brace is emitted. Output therefore parses on the first json.loads and
+no tokens are spent after the object.
+
+Only the best-scoring candidates are checked (greedy decoding needs exactly
+one valid token), so the per-step cost stays small even with a 150k vocab.
+
+Public API:
+- JsonConstraint(tokenizer)  — use as the inference worker's
+  logits_processor and stop callbacks
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any
+
+import torch
+
+# (kind, payload) segments of the response, in order.
+_STRING_FIELDS = ("root_cause", "fix_explanation", "patched_code", "patch_unified_diff")
+_SEGMENTS: list[tuple[str, str]] = [("lit", '{"root_cause": "'), ("str", "")]
+for _name in _STRING_FIELDS[1:]:
+    _SEGMENTS += [("lit", f'", "{_name}": "'), ("str", "")]
+_SEGMENTS += [("lit", '", "references": ['), ("arr", ""), ("lit", ', "confidence": '), ("num", ""), ("lit", "}")]
+_DONE = len(_SEGMENTS)
+
+_ESCAPES = set('"\\/bfnrtu')
+_HEX = set("0123456789abcdefABCDEF")
+_DIGITS = set("0123456789")
+
+# Substates for strings (also used inside array items).
+_S_TEXT, _S_ESC = 0, 1  # _S_ESC + n (n >= 1) means n hex digits of \\uXXXX still expected
+# Substates for arrays.
+_A_START, _A_ITEM, _A_AFTER, _A_SEP = 0, 1, 2, 3
+
+# state = (segment index, offset/substate, string substate)
+State = tuple[int, int, int]
+
+
+def _string_step(sub: int, ch: str) -> tuple[int, bool] | None:
+    """Advances a JSON string body; returns (new_sub, closed) or None if invalid."""
+    if sub == _S_TEXT:
+        if ch == '"':
+            return _S_TEXT, True
+        if ch == "\\":
+            return _S_ESC, False
+        if ord(ch) < 0x20:
+            return None
+        return _S_TEXT, False
+    if sub == _S_ESC:
+        if ch not in _ESCAPES:
+            return None
+        return (_S_ESC + 4, False) if ch == "u" else (_S_TEXT, False)
+    # \uXXXX digits
+    if ch not in _HEX:
+        return None
+    sub -= 1
+    return (_S_TEXT if sub == _S_ESC else sub), False
+
+
+def _step(state: State, ch: str) -> State | None:
+    seg, off, sub = state
+    while seg < _DONE:
+        kind, text = _SEGMENTS[seg]
+        if kind == "lit":
+            if ch != text[off]:
+                return None
+            off += 1
+            if off == len(text):
+                return (seg + 1, 0, 0)
+            return (seg, off, 0)
+        if kind == "str":
+            r = _string_step(sub, ch)
+            if r is None:
+                return None
+            sub, closed = r
+            # The closing quote is the first char of the next literal.
+            if closed:
+                return (seg + 1, 1, 0)
+            return (seg, 0, sub)
+        if kind == "arr":
+            if off == _A_START:
+                if ch == "]":
+                    return (seg + 1, 0, 0)
+                if ch == '"':
+                    return (seg, _A_ITEM, _S_TEXT)
+                return None
+            if off == _A_ITEM:
+                r = _string_step(sub, ch)
+                if r is None:
+                    return None
+                sub, closed = r
+                return (seg, _A_AFTER, 0) if closed else (seg, _A_ITEM, sub)
+            if off == _A_AFTER:
+                if ch == ",":
+                    return (seg, _A_SEP, 0)
+                if ch == "]":
+                    return (seg + 1, 0, 0)
+                return None
+            # _A_SEP: optional single space, then the next item
+            if ch == " ":
+                return (seg, _A_SEP, 1) if sub == 0 else None
+            if ch == '"':
+                return (seg, _A_ITEM, _S_TEXT)
+            return None
+        # num: digits with at most one '.', ended by the next literal
+        # off = digits seen, sub = 1 once '.' seen, 2 once a digit follows it
+        if ch in _DIGITS:
+            if off >= 6:
+                return None
+            return (seg, off + 1, 2 if sub == 1 else sub)
+        if ch == "." and off > 0 and sub == 0:
+            return (seg, off, 1)
+        if off == 0 or sub == 1:
+            return None
+        seg, off, sub = seg + 1, 0, 0
+    return None
+
+
+def _advance(state: State, text: str) -> State | None:
+    for ch in text:
+        state = _step(state, ch)
+        if state is None:
+            return None
+    return state
+
+
+_vocab_cache: dict[int, list[str]] = {}
+_vocab_lock = threading.Lock()
+
+
+def _vocab(tokenizer) -> list[str]:
+    """Decoded text of every token id, built once per tokenizer."""
+    key = id(tokenizer)
+    table = _vocab_cache.get(key)
+    if table is None:
+        with _vocab_lock:
+            table = _vocab_cache.get(key)
+            if table is None:
+                table = [tokenizer.decode([i]) for i in range(len(tokenizer))]
+                special = set(getattr(tokenizer, "all_special_ids", []) or [])
+                for i in special:
+                    if 0 <= i < len(table):
+                        table[i] = ""
+                _vocab_cache[key] = table
+    return table
+
+
+class JsonConstraint:
+    """Per-request constraint; not shareable between concurrent requests."""
+
+    def __init__(self, tokenizer, keep: int = 1, search: tuple[int, ...] = (64, 2048)):
+        self.vocab = _vocab(tokenizer)
+        self.eos = tokenizer.eos_token_id
+        self.keep = keep
+        self.search = search
+        self.state: State = (0, 0, 0)
+
+    @property
+    def done(self) -> bool:
+        return self.state[0] >= _DONE
+
+    def _allowed(self, token_id: int) -> bool:
+        if token_id >= len(self.vocab):
+            return False
+        text = self.vocab[token_id]
+        return bool(text) and _advance(self.state, text) is not None
+
+    def __call__(self, generated: list[int], scores: torch.Tensor) -> torch.Tensor:
+        masked = torch.full_like(scores, float("-inf"))
+        if self.done:
+            if self.eos is not None:
+                masked[self.eos] = 0.0
+            return masked
+
+        keep: list[int] = []
+        checked = 0
+        for k in self.search + (scores.shape[-1],):
+            k = min(k, scores.shape[-1])
+            top = torch.topk(scores, k).indices.tolist()
+            for tid in top[checked:]:
+                if self._allowed(tid):
+                    keep.append(tid)
+                    if len(keep) >= self.keep:
+                        break
+            checked = k
+            if keep or k == scores.shape[-1]:
+                break
+
+        for tid in keep:
+            masked[tid] = scores[tid]
+        return masked
+
+    def stop(self, token_id: int, piece: Any = None) -> bool:
+        """Advances the state with the chosen token; True once the object is closed."""
+        if token_id < len(self.vocab):
+            nxt = _advance(self.state, self.vocab[token_id])
+            if nxt is not None:
+                self.state = nxt
+        return self.done
@@ -0,0 +1,389 @@
+"""Single-pass, multi-finding defect detector.
+
+The code is lexed once: string literals and comments are blanked out per
+language family (newlines and offsets are preserved, string delimiters are
+kept), so `"a[0]"` or `# x / y` never trigger anything. Python f-string
+interpolations stay visible: they are code. Then one combined regex walks
+the masked text left to right. Every rule is an alternative of that regex,
+so all rules are evaluated in the same O(n) pass, and the line of each hit
+is tracked with a running newline count. The only extra reading is the
+body of each `while` loop, scanned once for an update of its variable.
+
+Rules (issue_type names match rag.rules.detect_action):
+- IndexError_or_Bounds: loop bounds that reach len (range(len(x) + 1),
+  <= len(x), <= x.length, C-style `for (...; i <= n; ...)`), x[len(x)],
+  neighbour indexing x[i + 1] (and x[i - 1] outside Python, where it
+  does not wrap around), a literal index past a literal container
+  (nums = [1, 2, 3]; nums[3]) or past the only length checked
+  (if len(x) > 0: x[3]), and `while i < n` loops whose body never
+  updates i (nor breaks out, nor changes n).
+- ZeroDivisionError: division / modulo by a name or call that is never
+  compared to 0 or truth-tested anywhere in the snippet.
+- NoneType_Attribute (Python) / NullPointer_Dereference: attribute access
+  on a name last assigned None/null or an Optional result (dict.get without
+  default, re.match, os.getenv, querySelector, ...) with no check in
+  between.
+
+Public API:
+- detect(code, lang="python") -> list[dict]   findings, most confident first
+- mask(code, lang="python") -> str
+"""
+
+from __future__ import annotations
+
+import re
+
+# Bump whenever a rule, a signature (rag/signatures.py) or the lexer changes
+# what predict_defect() reports; cached scan results (rag/incremental.py)
+# are keyed on it.
+DETECTOR_VERSION = "3"
+
+# ---------- lexing ----------
+
+_SQ = r"'(?:\\.|[^'\\\n])*(?:'|$)"
+_DQ = r'"(?:\\.|[^"\\\n])*(?:"|$)'
+_CHAR = r"'(?:\\.|[^'\\\n])'"  # C-family char literal; never eats a Rust lifetime
+_BLOCK = r"/\*[\s\S]*?(?:\*/|\Z)"
+
+_LEXERS = {
+    "python": re.compile(
+        rf"(?P<s>'''[\s\S]*?(?:'''|\Z)|\"\"\"[\s\S]*?(?:\"\"\"|\Z)|{_SQ}|{_DQ})|(?P<c>#[^\n]*)", re.M
+    ),
+    "ruby": re.compile(rf"(?P<s>{_SQ}|{_DQ})|(?P<c>#[^\n]*|^=begin[\s\S]*?(?:^=end|\Z))", re.M),
+    "php": re.compile(rf"(?P<s>{_SQ}|{_DQ})|(?P<c>//[^\n]*|#[^\n]*|{_BLOCK})", re.M),
+    "javascript": re.compile(rf"(?P<s>`(?:\\.|[^`\\])*(?:`|\Z)|{_SQ}|{_DQ})|(?P<c>//[^\n]*|{_BLOCK})", re.M),
+    "go": re.compile(rf"(?P<s>`[^`]*(?:`|\Z)|{_CHAR}|{_DQ})|(?P<c>//[^\n]*|{_BLOCK})", re.M),
+    "c": re.compile(rf"(?P<s>{_CHAR}|{_DQ})|(?P<c>//[^\n]*|{_BLOCK})", re.M),
+}
+_FAMILY = {"typescript": "javascript", "cpp": "c", "java": "c", "csharp": "c", "rust": "c"}
+_NON_NL = re.compile(r"[^\n]")
+
+
+def _blank(m: re.Match) -> str:
+    text = m.group()
+    if m.lastgroup == "c" or len(text) < 2:
+        return _NON_NL.sub(" ", text)
+    if m.re is _LEXERS["python"] and _prefix(m.string, m.start()) in {"f", "rf", "fr"}:
+        return _blank_fstring(text)
+    # Keep the delimiters so `"..." % x` still reads as a string operand.
+    end = text[-1] if text[-1] == text[0] else " "
+    return text[0] + _NON_NL.sub(" ", text[1:-1]) + end
+
+
+def _prefix(code: str, at: int) -> str:
+    start = at
+    while start > 0 and code[start - 1].isalpha():
+        start -= 1
+    return code[start:at].lower()
+
+
+def _blank_fstring(text: str) -> str:
+    """Blanks an f-string's literal parts but keeps the {...} expressions."""
+    q = 3 if text[:3] in ("\"\"\"", "'''") else 1
+    closed = len(text) >= 2 * q and text[-q:] == text[:q]
+    body = text[q : len(text) - q] if closed else text[q:]
+    out, depth, i = [], 0, 0
+    while i < len(body):
+        c = body[i]
+        if depth == 0 and c in "{}" and body[i : i + 2] in ("{{", "}}"):
+            out.append("  ")
+            i += 2
+            continue
+        if c == "{":
+            depth += 1
+            out.append(" ")
+        elif c == "}" and depth:
+            depth -= 1
+            out.append(" ")
+        else:
+            out.append(c if depth or c == "\n" else " ")
+        i += 1
+    return text[:q] + "".join(out) + (text[-q:] if closed else "")
+
+
+def mask(code: str, lang: str = "python") -> str:
+    """Blanks string contents and comments; same length and line breaks as `code`."""
+    lexer = _LEXERS.get(_FAMILY.get(lang, lang), _LEXERS["c"])
+    return lexer.sub(_blank, code)
+
+
+# ---------- rules ----------
+
+_NULL = r"(?:None|null|nullptr|NULL|nil|undefined)"
+_LEN = r"(?:len\s*\(\s*(?P<{0}>[\w.]+)\s*\)|(?P<{1}>[\w.]+)\s*\.\s*(?:length|Length|Count|size\s*\(\s*\)|len\s*\(\s*\)))"
+
+# The leading lookahead lets the engine skip positions no rule can start at
+# (about 2x faster than trying every alternative everywhere).
+_SCAN = re.compile(
+    r"(?=[A-Za-z_<\[/%])(?:"
+    + "|".join(
+        [
+            # loop bounds
+            rf"(?P<range>\brange\s*\((?P<rstart>[^(),\n]*,\s*)?len\s*\(\s*[\w.]+\s*\)\s*\+\s*1\s*\))",
+            r"(?P<forle>\bfor\s*\([^;\n]*;\s*[A-Za-z_]\w*\s*<=\s*(?P<fbound>[^;\n]*);)",
+            rf"(?P<le><=\s*{_LEN.format('l1', 'l2')})",
+            # zero width past the keyword, so the condition is still scanned
+            r"(?P<wloop>\bwhile(?=\s*\(?\s*(?P<wv>[A-Za-z_]\w*)\s*(?:<=?|!=)))",
+            # nullable assignments must precede the generic assignment
+            rf"(?P<nassign>\b(?P<nn>[A-Za-z_]\w*)\s*=\s*{_NULL}\s*;?[ \t]*$)",
+            r"(?P<nsrc>\b(?P<sn>[A-Za-z_]\w*)\s*=\s*[\w.]*?\b(?P<sfn>get|getenv|match|search|fullmatch|find_one"
+            r"|querySelector|getElementById)\s*\((?P<sargs>[^()\n]*)\))",
+            # checks
+            rf"(?P<ifg>\b(?:if|elif|unless|while|assert)\s*\(?\s*(?:not\s+|!\s*)?(?P<gn>[A-Za-z_][\w.]*)"
+            r"(?=\s*(?:[:){]|\b(?:and|or)\b|&&|\|\||$)))",
+            rf"(?P<cmp>\b(?P<cn>[A-Za-z_][\w.]*)(?:\s+(?:is|and|or)\b|\s*(?:[!=]==?\s*{_NULL}\b|(?:!=|==|>=|>|<)\s*0\b|&&|\?\.)))",
+            rf"(?P<lencmp>\b{_LEN.format('c1', 'c2')}\s*(?P<lop>!=|==|>=|>|<=|<)\s*(?P<lk>\d+)\b)",
+            # literal containers must precede the generic assignment
+            r"(?P<lit>\b(?P<ln>[A-Za-z_]\w*)\s*(?:\[\s*(?P<ldim>\d*)\s*\])?\s*=\s*(?P<lopen>[\[{])"
+            r"(?P<litems>[\w\s.,'\"`+-]*)(?P<lclose>[\]}]))",
+            r"(?P<assign>\b(?P<an>[A-Za-z_]\w*)\s*(?:[-+*/%&|^]|<<|>>|\*\*|//)?:?=(?!=))",
+            # uses
+            r"(?P<sub>\b(?P<sb>[A-Za-z_]\w*)\s*\[(?P<idx>[^\[\]\n]*)\]|(?<=[)\]])\[(?P<idx2>[^\[\]\n]*)\])",
+            r"(?P<div>(?<=[\w)\]\s])(?P<op>//|/|%)(?![=/*])\s*(?P<den>len\s*\(\s*[\w.]+\s*\)|[A-Za-z_][\w.]*(?:\s*\([^()\n]*\))?))",
+            r"(?P<attr>\b(?P<on>[A-Za-z_]\w*)\s*(?:\.|->)(?=\s*[A-Za-z_]))",
+        ]
+    )
+    + ")",
+    re.M,
+)
+
+_NOT_SUBSCRIPTED = {
+    # keywords that can precede a list literal
+    "in", "return", "yield", "else", "and", "or", "not", "is", "await", "lambda", "case", "new", "of",
+    # generic types in annotations
+    "list", "dict", "tuple", "set", "frozenset", "type", "List", "Dict", "Tuple", "Set", "FrozenSet",
+    "Type", "Optional", "Union", "Callable", "Sequence", "Iterable", "Iterator", "Generator", "Mapping",
+    "MutableMapping", "Literal", "Annotated", "Any", "Awaitable", "Coroutine", "ClassVar", "Final",
+}
+_NEXT = re.compile(r"^\s*[A-Za-z_][\w.]*\s*\+\s*\d+\s*$")
+_PREV = re.compile(r"^\s*[A-Za-z_][\w.]*\s*-\s*\d+\s*$")
+_NOT_DIVISORS = ("sizeof", "max", "abs")
+_LOOP_HEAD = re.compile(r"\b(?:while|for)\b")
+_LENGTH_WORD = re.compile(r"\blen\b|\.\s*(?:length|Length|Count|size)\b")
+_ALWAYS_NULLABLE = {"match", "search", "fullmatch", "find_one", "querySelector", "getElementById"}
+_INT = re.compile(r"^\s*(-?\d+)\s*$")
+_WORD = re.compile(r"[A-Za-z_]\w*")
+_EXITS = re.compile(r"\b(?:break|return|raise|throw|goto|exit|yield)\b")
+# Names in a while condition that are not variables the body could change.
+_NOT_VARS = {"len", "size", "length", "Length", "Count", "and", "or", "not", "is", "None", "null", "NULL", "True", "False"}
+
+
+def _at_len(base: str) -> tuple[str, ...]:
+    return (f"len({base})", f"{base}.length", f"{base}.Length", f"{base}.Count", f"{base}.size()")
+
+
+def _finding(issue_type: str, rule: str, line: int, confidence: float, message: str, end: int | None = None) -> dict:
+    return {
+        "issue_type": issue_type,
+        "rule": rule,
+        "span_lines": f"{line}-{end or line}",
+        "line": line,
+        "confidence": confidence,
+        "message": message,
+    }
+
+
+def _updates(name: str) -> re.Pattern:
+    n = re.escape(name)
+    return re.compile(
+        rf"\b{n}\s*(?:(?:[-+*/%&|^]|<<|>>|\*\*|//)?:?=(?!=)|\+\+|--|\.\s*\w+\s*\()|(?:\+\+|--|&)\s*{n}\b|\bdel\s+{n}\b"
+    )
+
+
+def _while_body(text: str, at: int, python: bool) -> tuple[str, str, int] | None:
+    """(condition, body, end offset) of the while loop whose keyword ends at `at`; None if not a plain loop."""
+    if python:
+        head_end = text.find("\n", at)
+        head_end = len(text) if head_end == -1 else head_end
+        head = text[at:head_end].rstrip()
+        if not head.endswith(":"):
+            return None  # one-line loop or a continued condition
+        line_start = text.rfind("\n", 0, at) + 1
+        indent = len(text[line_start:at]) - len(text[line_start:at].lstrip())
+        pos, end = head_end + 1, head_end
+        while pos < len(text):
+            nl = text.find("\n", pos)
+            nl = len(text) if nl == -1 else nl
+            row = text[pos:nl]
+            if row.strip():
+                if len(row) - len(row.lstrip()) <= indent:
+                    break
+                end = nl
+            pos = nl + 1
+        return head[:-1], text[head_end:end], end
+
+    i = at
+    while i < len(text) and text[i] in " \t\n":
+        i += 1
+    if i >= len(text) or text[i] != "(":
+        return None
+    close = _matching(text, i, "(", ")")
+    if close < 0:
+        return None
+    cond = text[i + 1 : close]
+    j = close + 1
+    while j < len(text) and text[j] in " \t\n":
+        j += 1
+    if j >= len(text) or text[j] == ";":
+        return None  # do { } while (...); or an empty body
+    if text[j] == "{":
+        end = _matching(text, j, "{", "}")
+        end = len(text) if end < 0 else end
+    else:
+        end = text.find(";", j)
+        end = len(text) if end < 0 else end
+    return cond, text[j:end], end
+
+
+def _matching(text: str, at: int, open_: str, close: str) -> int:
+    depth = 0
+    for k in range(at, len(text)):
+        c = text[k]
+        if c == open_:
+            depth += 1
+        elif c == close:
+            depth -= 1
+            if depth == 0:
+                return k
+    return -1
+
+
+def detect(code: str, lang: str = "python") -> list[dict]:
+    """All findings in `code`, sorted by confidence (desc) then line."""
+    text = mask(code, lang)
+    python = lang == "python"
+    null_issue = "NoneType_Attribute" if python else "NullPointer_Dereference"
+    found: dict[tuple[str, int], dict] = {}
+    nullable: dict[str, int] = {}  # name -> line of the None-ish assignment
+    checked: set[str] = set()  # names compared to 0 / None or truth-tested anywhere
+    divisions: list[tuple[str, str, int]] = []
+    lengths: dict[str, int] = {}  # name -> element count of the literal it was last assigned
+    at_least: dict[str, int] = {}  # name -> length its `len(x) > k` checks guarantee
+    unsure: set[str] = set()  # names whose length is also compared some other way
+
+    def add(f: dict) -> None:
+        key = (f["rule"], f["line"])
+        if key not in found or found[key]["confidence"] < f["confidence"]:
+            found[key] = f
+
+    line, pos = 1, 0
+    for m in _SCAN.finditer(text):
+        line += text.count("\n", pos, m.start())
+        pos = m.start()
+        kind = m.lastgroup  # the enclosing rule group always closes last
+
+        if kind == "range":
+            start = (m.group("rstart") or "").strip(" ,")
+            conf = 0.85 if start in {"", "0"} else 0.7
+            add(_finding("IndexError_or_Bounds", "range_len_plus_one", line, conf, "range() runs one past the last index"))
+        elif kind == "forle":
+            bound = m.group("fbound")
+            literal = bound.strip().isdigit() and int(bound) in lengths.values()
+            conf = 0.85 if literal or _LENGTH_WORD.search(bound) else 0.7
+            add(_finding("IndexError_or_Bounds", "loop_le", line, conf, "loop condition uses <= on an upper bound"))
+        elif kind == "le":
+            head = text[text.rfind("\n", 0, m.start()) + 1 : m.start()]
+            if not _LOOP_HEAD.search(head):
+                continue  # a plain `if n <= len(x)` is a bounds check, not a bug
+            add(_finding("IndexError_or_Bounds", "le_length", line, 0.85, "index compared with <= against the length"))
+        elif kind == "wloop":
+            loop = _while_body(text, m.end(), python)
+            if loop is None:
+                continue
+            cond, body, end = loop
+            var = m.group("wv")
+            if not body.strip() or _EXITS.search(body):
+                continue
+            names = {var} | (set(_WORD.findall(cond)) - _NOT_VARS)
+            if any(_updates(n).search(body) for n in names):
+                continue
+            last = line + text.count("\n", m.start(), end)
+            add(_finding("IndexError_or_Bounds", "missing_increment", line, 0.85, f"{var} never changes inside the loop", last))
+        elif kind == "nassign":
+            nullable[m.group("nn")] = line
+        elif kind == "nsrc":
+            name, fn = m.group("sn"), m.group("sfn")
+            if fn in _ALWAYS_NULLABLE or "," not in m.group("sargs"):
+                nullable[name] = line
+            else:
+                nullable.pop(name, None)
+        elif kind == "ifg":
+            name = m.group("gn")
+            checked.add(name)
+            nullable.pop(name, None)
+        elif kind == "cmp":
+            name = m.group("cn")
+            checked.add(name)
+            nullable.pop(name, None)
+        elif kind == "lencmp":
+            name, op, k = m.group("c1") or m.group("c2"), m.group("lop"), int(m.group("lk"))
+            if k == 0:
+                checked.add(name)
+            if op in (">", ">=") and name not in unsure:
+                at_least[name] = max(at_least.get(name, 0), k + (op == ">"))
+            else:
+                unsure.add(name)
+                at_least.pop(name, None)
+        elif kind == "lit":
+            name = m.group("ln")
+            nullable.pop(name, None)
+            at_least.pop(name, None)
+            pair = m.group("lopen") + m.group("lclose")
+            if pair == "[]" or (pair == "{}" and _FAMILY.get(lang, lang) == "c"):
+                dim = m.group("ldim")
+                n = int(dim) if dim else sum(1 for item in m.group("litems").split(",") if item.strip())
+                if n:
+                    lengths[name] = n
+                    continue
+            lengths.pop(name, None)
+        elif kind == "assign":
+            name = m.group("an")
+            nullable.pop(name, None)
+            lengths.pop(name, None)
+            at_least.pop(name, None)
+        elif kind == "sub":
+            base, idx = m.group("sb"), m.group("idx")
+            if idx is None:
+                base, idx = None, m.group("idx2")
+            if base in _NOT_SUBSCRIPTED or not idx.strip() or ":" in idx:
+                continue
+            literal = _INT.match(idx)
+            if base and literal:
+                k, n, least = int(literal.group(1)), lengths.get(base), at_least.get(base)
+                if n and (k >= n or (python and k < -n)):
+                    add(_finding("IndexError_or_Bounds", "literal_index", line, 0.9, f"{base}[{k}] but {base} has {n} elements"))
+                elif n is None and least is not None and k >= least:
+                    add(_finding("IndexError_or_Bounds", "index_past_check", line, 0.7, f"{base}[{k}] but only len({base}) >= {least} is checked"))
+            elif base and "".join(idx.split()) in _at_len(base):
+                add(_finding("IndexError_or_Bounds", "index_at_len", line, 0.9, f"{base}[...] indexed at its length"))
+            elif _NEXT.match(idx):
+                add(_finding("IndexError_or_Bounds", "neighbor_index", line, 0.8, "index past the loop variable can run off the end"))
+            elif _PREV.match(idx) and not python:
+                add(_finding("IndexError_or_Bounds", "neighbor_index", line, 0.6, "index before the loop variable can go negative"))
+        elif kind == "div":
+            den = m.group("den")
+            if m.group("op") == "%":
+                i = m.start() - 1
+                while i >= 0 and text[i] in " \t":
+                    i -= 1
+                if i >= 0 and text[i] in "'\"`":
+                    continue  # "..." % args is string formatting
+            if den.startswith(_NOT_DIVISORS):
+                continue
+            inner = re.match(r"len\s*\(\s*([\w.]+)\s*\)", den)
+            key = inner.group(1) if inner else re.match(r"[\w.]+", den).group()
+            divisions.append((key, "len" if inner else "name", line))
+        elif kind == "attr":
+            name = m.group("on")
+            lengths.pop(name, None)  # nums.append(4), numbers.push_back(4), ...
+            if name in nullable:
+                origin = nullable.pop(name)
+                add(_finding(null_issue, "unchecked_optional", line, 0.75, f"{name} may be {'None' if python else 'null'} (set on line {origin})"))
+
+    for key, how, at in divisions:
+        if key in checked or key.split(".")[-1] in checked:
+            continue
+        conf = 0.7 if how == "len" else 0.6
+        add(_finding("ZeroDivisionError", "unchecked_divisor", at, conf, f"divisor {key} is never checked against 0"))
+
+    return sorted(found.values(), key=lambda f: (-f["confidence"], f["line"]))
@@ -0,0 +1,39 @@
+"""Torch device selection without importing torch up front.
+
+Importing torch costs seconds and hundreds of MB, and in FAST_ANALYSIS_MODE
+on a CPU-only host no model ever runs. The modules that host models only ask
+torch about CUDA once a cheap probe says an NVIDIA driver is present; on
+machines without one the answer is "cpu" and torch stays unimported until a
+model is actually loaded.
+
+Public API:
+- device() -> "cuda" | "cpu"   (cached)
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from functools import lru_cache
+
+
+def _driver_present() -> bool:
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None and visible.strip() in {"", "-1"}:
+        return False
+    if sys.platform.startswith("linux"):
+        return os.path.exists("/proc/driver/nvidia/version") or os.path.exists("/dev/nvidia0")
+    if sys.platform == "win32":
+        import ctypes.util
+
+        return ctypes.util.find_library("nvcuda") is not None
+    return False
+
+
+@lru_cache(maxsize=1)
+def device() -> str:
+    if "torch" not in sys.modules and not _driver_present():
+        return "cpu"
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
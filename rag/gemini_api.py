@@ -8,11 +8,16 @@ The API is accessed through the Google Generative AI library.
 """
 
 import os
-import json
+import time
 from typing import Any, Optional
 import logging
 from dotenv import load_dotenv
 
+from config import GROQ_STREAM, LLM_OUTPUT_MODE
+from rag.budget import count_tokens, excerpt_line_to_original, fit_prompt, restore_elided
+from rag.jsonstream import JSONStreamParser, extract_json
+from rag.patching import apply_hunks, unified_diff
+
 logger = logging.getLogger(__name__)
 
 # Load environment variables at module import
@@ -74,6 +79,7 @@ def generate_fix(
     span: str,
     code: str,
     passages: list[dict[str, Any]],
+    output_mode: Optional[str] = None,
 ) -> Optional[dict]:
     """
     Generate a code fix using Gemini API.
@@ -85,6 +91,7 @@ def generate_fix(
         span: Affected lines/span
         code: Source code snippet
         passages: Retrieved knowledge base passages for context
+        output_mode: "full" or "hunks" (defaults to config.LLM_OUTPUT_MODE)
     
     Returns:
         Dictionary with fix details or None if API fails
@@ -94,41 +101,33 @@ def generate_fix(
         return None
     
     try:
-        # Build the prompt
-        system_prompt = (
-            "You are a strict code troubleshooter. Use ONLY the provided code and retrieved passages. "
-            "Respond in valid JSON with keys: root_cause, fix_explanation, patched_code, patch_unified_diff, references, confidence. "
-            "The patched_code key MUST contain the complete corrected source code with the bug fixed. Do NOT return the original buggy code as patched_code. "
-            "IMPORTANT: All string values in the JSON must have newlines escaped as \\n, not literal newlines."
-        )
+        mode = (output_mode or LLM_OUTPUT_MODE or "full").lower()
         
-        passages_block = _format_passages(passages)
+        # Build the prompt
+        system_prompt = _SYSTEM_PROMPTS.get(mode, _SYSTEM_PROMPTS["full"])
         
-        user_prompt = (
-            f"Language: {lang}\n"
-            f"File: {path}\n"
-            f"Detected issue: {issue}\n"
-            f"Span: {span}\n"
-            f"Code:\n```{lang}\n{code}\n```\n"
-            f"Retrieved passages:\n{passages_block}\n"
-            f"Return JSON only with keys: root_cause, fix_explanation, patched_code, patch_unified_diff, references, confidence. "
-            f"patched_code MUST contain the full corrected source code with bugs fixed."
+        # Keep the prompt inside the backend's token cap: drop low-scoring
+        # passages first, then elide code far from the predicted span.
+        overhead = count_tokens(system_prompt, "groq") + count_tokens(
+            _build_user_prompt(lang, path, issue, span, "", "", elided=True, output_mode=mode), "groq"
+        )
+        prompt_code, prompt_passages, budget = fit_prompt(
+            code, passages, span, lang, backend="groq", overhead_tokens=overhead
         )
         
-        # Call Groq API with JSON mode for reliable parsing
-        response = _CLIENT.chat.completions.create(
-            model=_MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=2048,
-            top_p=0.95,
-            response_format={"type": "json_object"},
+        passages_block = _format_passages(prompt_passages)
+        user_prompt = _build_user_prompt(
+            lang,
+            path,
+            issue,
+            span,
+            prompt_code,
+            passages_block,
+            elided=bool(budget["code_ranges"]),
+            output_mode=mode,
         )
         
-        response_text = response.choices[0].message.content
+        response_text, result, metrics = _complete(system_prompt, user_prompt)
         
         if not response_text:
             logger.warning("[groq] Empty response from API")
@@ -136,14 +135,41 @@ def generate_fix(
         
         logger.debug(f"[groq] Response text ({len(response_text)} chars): {response_text[:1000]}")
         
-        # Parse JSON response
-        result = _extract_json(response_text)
+        # Parse JSON response (already done incrementally when streaming)
+        if not result:
+            result = _extract_json(response_text)
         
         # If JSON parsing failed, construct a fallback result from the raw text
         if not result:
             logger.warning(f"[groq] JSON parse failed, constructing fallback from raw response")
             result = _build_fallback_result(response_text, issue, code)
         
+        if mode == "hunks" and isinstance(result.get("hunks"), list):
+            # Hunks are matched against the full original file, so elided
+            # regions never need restoring; only the line hints are remapped.
+            hunks = []
+            for h in result.pop("hunks"):
+                if isinstance(h, dict) and budget["code_ranges"]:
+                    try:
+                        h = dict(h, start_line=excerpt_line_to_original(budget, int(h.get("start_line"))))
+                    except (TypeError, ValueError):
+                        pass
+                hunks.append(h)
+            patched, report = apply_hunks(code, hunks)
+            result["patched_code"] = patched
+            result["patch_unified_diff"] = unified_diff(code, patched)
+            result["_patch_report"] = report
+        elif budget["code_ranges"]:
+            # Stitch the patched excerpt back into the full file.
+            restored = restore_elided(code, result.get("patched_code") or "", budget, lang)
+            if restored is None:
+                logger.warning("[groq] Could not map patched excerpt back onto the file; keeping original code")
+                restored = code
+            result["patched_code"] = restored
+            result["patch_unified_diff"] = unified_diff(code, restored)
+        result["_budget"] = budget
+        result["_metrics"] = metrics
+        
         # Add metadata about the source
         result.setdefault("_llm_status", "Qwen2.5-Coder-1.5B-Instruct (optimized)")
         result.setdefault("_api_source", _MODEL_NAME)
@@ -170,6 +196,146 @@ def generate_fix(
         return None
 
 
+def _usage_of(obj) -> Optional[dict]:
+    """prompt/completion token counts from a response or final stream chunk."""
+    usage = getattr(obj, "usage", None)
+    if usage is None:
+        # Groq reports streaming usage on the last chunk under x_groq.
+        usage = getattr(getattr(obj, "x_groq", None), "usage", None)
+    if usage is None:
+        return None
+    get = usage.get if isinstance(usage, dict) else (lambda k: getattr(usage, k, None))
+    if get("prompt_tokens") is None and get("completion_tokens") is None:
+        return None
+    return {"prompt_tokens": get("prompt_tokens") or 0, "completion_tokens": get("completion_tokens") or 0}
+
+
+def _complete(system_prompt: str, user_prompt: str) -> tuple[str, Optional[dict], dict]:
+    """
+    Runs one chat completion; returns (text, parsed JSON or None, metrics).
+
+    With GROQ_STREAM the response is streamed and fed to a JSONStreamParser
+    as it arrives, which gives a real time-to-first-byte; otherwise JSON mode
+    is used and the first byte is the whole body.
+    """
+    kwargs = dict(
+        model=_MODEL_NAME,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.3,
+        max_tokens=2048,
+        top_p=0.95,
+    )
+    t0 = time.perf_counter()
+    ttfb = None
+    usage = None
+    parsed = None
+    if GROQ_STREAM:
+        parser = JSONStreamParser()
+        parts = []
+        for chunk in _CLIENT.chat.completions.create(stream=True, **kwargs):
+            if chunk.choices:
+                piece = chunk.choices[0].delta.content or ""
+                if piece:
+                    if ttfb is None:
+                        ttfb = time.perf_counter()
+                    parts.append(piece)
+                    parser.feed(piece)
+            usage = _usage_of(chunk) or usage
+        text = "".join(parts)
+        parsed = parser.result if parser.complete else parser.close()
+    else:
+        # JSON mode for reliable parsing
+        response = _CLIENT.chat.completions.create(response_format={"type": "json_object"}, **kwargs)
+        text = response.choices[0].message.content or ""
+        usage = _usage_of(response)
+    end = time.perf_counter()
+
+    estimated = usage is None
+    if estimated:
+        usage = {
+            "prompt_tokens": count_tokens(system_prompt, "groq") + count_tokens(user_prompt, "groq"),
+            "completion_tokens": count_tokens(text, "groq"),
+        }
+    # Without streaming the whole body arrives at once, so there is no first
+    # byte to time and no generation phase to divide tokens by: ttfb_ms,
+    # generation_ms and tokens_per_s are None and only total_ms is known.
+    gen_s = end - (ttfb or end) if GROQ_STREAM else None
+    metrics = {
+        "backend": "groq",
+        "model": _MODEL_NAME,
+        "streamed": GROQ_STREAM,
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "usage_estimated": estimated,
+        "ttfb_ms": round(((ttfb or end) - t0) * 1000, 1) if GROQ_STREAM else None,
+        "generation_ms": round(gen_s * 1000, 1) if gen_s is not None else None,
+        "total_ms": round((end - t0) * 1000, 1),
+        "tokens_per_s": round(usage["completion_tokens"] / gen_s, 1) if gen_s else None,
+    }
+    return text, parsed, metrics
+
+
+_SYSTEM_PROMPTS = {
+    "full": (
+        "You are a strict code troubleshooter. Use ONLY the provided code and retrieved passages. "
+        "Respond in valid JSON with keys: root_cause, fix_explanation, patched_code, patch_unified_diff, references, confidence. "
+        "The patched_code key MUST contain the complete corrected source code with the bug fixed. Do NOT return the original buggy code as patched_code. "
+        "IMPORTANT: All string values in the JSON must have newlines escaped as \\n, not literal newlines."
+    ),
+    "hunks": (
+        "You are a strict code troubleshooter. Use ONLY the provided code and retrieved passages. "
+        "Respond in valid JSON with keys: root_cause, fix_explanation, hunks, references, confidence. "
+        "hunks is a list of edits, each an object with start_line (1-based line of the first replaced line), "
+        "find (the original lines to replace, copied verbatim, including one unchanged line of context) "
+        "and replace (the corrected lines). Do NOT return the full file. "
+        "IMPORTANT: All string values in the JSON must have newlines escaped as \\n, not literal newlines."
+    ),
+}
+
+_RETURN_INSTRUCTIONS = {
+    "full": (
+        "Return JSON only with keys: root_cause, fix_explanation, patched_code, patch_unified_diff, references, confidence. "
+        "patched_code MUST contain the full corrected source code with bugs fixed."
+    ),
+    "hunks": (
+        "Return JSON only with keys: root_cause, fix_explanation, hunks, references, confidence. "
+        "Each hunk is {\"start_line\": int, \"find\": str, \"replace\": str}; include only the lines that change."
+    ),
+}
+
+
+def _build_user_prompt(
+    lang: str,
+    path: str,
+    issue: str,
+    span: str,
+    code: str,
+    passages_block: str,
+    elided: bool = False,
+    output_mode: str = "full",
+) -> str:
+    """Build the user turn of the prompt."""
+    elision_note = (
+        "Some code regions were elided and replaced by '... N lines elided ...' comment lines. "
+        "Keep those marker lines unchanged in patched_code.\n"
+        if elided
+        else ""
+    )
+    return (
+        f"Language: {lang}\n"
+        f"File: {path}\n"
+        f"Detected issue: {issue}\n"
+        f"Span: {span}\n"
+        f"Code:\n```{lang}\n{code}\n```\n"
+        f"{elision_note}"
+        f"Retrieved passages:\n{passages_block}\n"
+        f"{_RETURN_INSTRUCTIONS.get(output_mode, _RETURN_INSTRUCTIONS['full'])}"
+    )
+
+
 def _format_passages(passages: list[dict[str, Any]]) -> str:
     """Format knowledge base passages for the prompt."""
     if not passages:
@@ -186,77 +352,11 @@ def _format_passages(passages: list[dict[str, Any]]) -> str:
 import re
 
 def _extract_json(text: str) -> Optional[dict]:
-    """Extract JSON from response text, with multiple fallback strategies."""
-    
-    # Strategy 1: Direct parse
-    try:
-        result = json.loads(text)
-        logger.debug(f"[groq] Direct JSON parse successful")
-        return result
-    except Exception as e:
-        logger.debug(f"[groq] Direct JSON parse failed: {e}")
-    
-    # Strategy 2: Strip markdown code fences (```json ... ```)
-    cleaned = re.sub(r'^```(?:json)?\s*\n?', '', text.strip(), flags=re.MULTILINE)
-    cleaned = re.sub(r'\n?```\s*$', '', cleaned.strip(), flags=re.MULTILINE)
-    try:
-        result = json.loads(cleaned)
-        logger.debug(f"[groq] Cleaned JSON parse successful")
-        return result
-    except Exception:
-        pass
-    
-    # Strategy 3: Find outermost JSON block
-    s = text.find("{")
-    e = text.rfind("}")
-    if 0 <= s < e:
-        json_str = text[s : e + 1]
-        try:
-            result = json.loads(json_str)
-            logger.debug(f"[groq] Extracted JSON parse successful")
-            return result
-        except Exception:
-            pass
-        
-        # Strategy 4: Fix common LLM issues - unescaped newlines inside strings
-        # Replace literal newlines inside string values with \\n
-        try:
-            fixed = _fix_json_newlines(json_str)
-            result = json.loads(fixed)
-            logger.debug(f"[groq] Fixed-newlines JSON parse successful")
-            return result
-        except Exception as ex:
-            logger.debug(f"[groq] All JSON parse strategies failed: {ex}")
-    
-    return None
-
-
-def _fix_json_newlines(text: str) -> str:
-    """Fix unescaped newlines within JSON string values."""
-    # This replaces literal newlines that appear between quotes
-    # by processing the text character by character
-    result = []
-    in_string = False
-    i = 0
-    while i < len(text):
-        ch = text[i]
-        if ch == '\\' and in_string and i + 1 < len(text):
-            result.append(ch)
-            result.append(text[i + 1])
-            i += 2
-            continue
-        if ch == '"' and (i == 0 or text[i - 1] != '\\'):
-            in_string = not in_string
-        if ch == '\n' and in_string:
-            result.append('\\n')
-        elif ch == '\r' and in_string:
-            result.append('\\r')
-        elif ch == '\t' and in_string:
-            result.append('\\t')
-        else:
-            result.append(ch)
-        i += 1
-    return ''.join(result)
+    """Extract the JSON object from response text (fences, raw newlines and trailing text tolerated)."""
+    result = extract_json(text)
+    if result is None:
+        logger.debug("[groq] Tolerant JSON parse failed")
+    return result
 
 
 def _build_fallback_result(raw_text: str, issue: str, original_code: str) -> dict:
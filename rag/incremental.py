@@ -0,0 +1,205 @@
+"""Incremental rescans: a per-file result cache and git change detection.
+
+ScanCache is a SQLite table of scan records keyed by
+(analysis_version(), language, git blob sha of the file). The blob sha is
+content-addressed, so a file that did not change since the last scan, in
+any branch or checkout, is served from the cache. analysis_version() folds
+in rag.detector.DETECTOR_VERSION, the defect-model setting and the KB /
+FAISS index files, so changing any of them invalidates old results.
+
+BlobHasher gets blob shas without reading files where git already knows
+them: `git ls-files -s` gives the sha of every tracked file, and files that
+`git diff --name-only` reports as modified in the worktree (plus untracked
+files and trees outside git) are hashed the way `git hash-object` does.
+
+changes_since(paths, rev) uses `git diff --name-only -z <rev>` to find the
+files changed since `rev` and `git diff -U0 <rev>` for their changed line
+ranges, so a rescan can restrict itself to changed files and, optionally,
+to changed hunks. Paths outside a git work tree are an error.
+
+Public API:
+- blob_sha(path) -> str
+- analysis_version() -> str
+- ScanCache(path, version)          .get(sha, lang) / .put(sha, lang, rec) / .close()
+- BlobHasher(paths)                 .sha(path)
+- changes_since(paths, rev) -> dict[realpath, list[(first, last)] | None]
+                                    None = whole file (untracked / new)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+import time
+from typing import Any, Iterable
+
+from config import DEFECT_MODEL_FORMAT, DEFECT_PREDICTOR_DIR, FAISS_IDS, FAISS_INDEX, KB_JSONL
+from rag import telemetry
+from rag.detector import DETECTOR_VERSION
+
+_HUNK_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+def blob_sha(path: str) -> str:
+    """Same as `git hash-object path`."""
+    with open(path, "rb") as f:
+        data = f.read()
+    h = hashlib.sha1(b"blob %d\0" % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+
+def _file_stamp(path: str) -> str:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "-"
+    return f"{st.st_size}:{int(st.st_mtime)}"
+
+
+def analysis_version() -> str:
+    """Changes whenever cached results may no longer match a fresh analysis."""
+    enabled = (os.environ.get("ENABLE_DEFECT_MODEL") or "").strip().lower() in {"1", "true", "yes"}
+    model = f"{DEFECT_PREDICTOR_DIR}:{DEFECT_MODEL_FORMAT}" if enabled else "-"
+    parts = [DETECTOR_VERSION, model] + [_file_stamp(p) for p in (KB_JSONL, FAISS_INDEX, FAISS_IDS)]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class ScanCache:
+    def __init__(self, path: str, version: str | None = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.version = version or analysis_version()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, record TEXT NOT NULL, created REAL NOT NULL)")
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, sha: str, lang: str) -> str:
+        return f"{self.version}:{lang}:{sha}"
+
+    def get(self, sha: str, lang: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._db.execute("SELECT record FROM results WHERE key = ?", (self._key(sha, lang),)).fetchone()
+            if row is None:
+                self.misses += 1
+                telemetry.count("cache_misses_total", cache="scan")
+                return None
+            self.hits += 1
+        telemetry.count("cache_hits_total", cache="scan")
+        return json.loads(row[0])
+
+    def put(self, sha: str, lang: str, rec: dict[str, Any]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, record, created) VALUES (?, ?, ?)",
+                (self._key(sha, lang), json.dumps(rec, ensure_ascii=False), time.time()),
+            )
+            self._unsaved += 1
+            if self._unsaved >= 100:
+                self._db.commit()
+                self._unsaved = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+def _git(cwd: str, *args: str) -> str | None:
+    try:
+        proc = subprocess.run(
+            ["git", "-c", "core.quotepath=off", *args],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="surrogateescape",
+        )
+    except OSError:
+        return None
+    return proc.stdout if proc.returncode == 0 else None
+
+
+def _toplevel(path: str) -> str | None:
+    d = path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path))
+    out = _git(d, "rev-parse", "--show-toplevel")
+    return os.path.realpath(out.strip()) if out else None
+
+
+class BlobHasher:
+    """Blob shas for files under `paths`, from the git index where it is current."""
+
+    def __init__(self, paths: Iterable[str]):
+        self._known: dict[str, str] = {}
+        seen = set()
+        for root in paths:
+            top = _toplevel(root)
+            if top is None or top in seen:
+                continue
+            seen.add(top)
+            staged = _git(top, "ls-files", "-s", "-z") or ""
+            dirty = set((_git(top, "diff", "--name-only", "-z") or "").split("\0"))
+            for entry in staged.split("\0"):
+                if not entry:
+                    continue
+                meta, _, rel = entry.partition("\t")
+                if rel in dirty:
+                    continue
+                self._known[os.path.join(top, rel)] = meta.split()[1]
+
+    def sha(self, path: str) -> str:
+        return self._known.get(os.path.realpath(path)) or blob_sha(path)
+
+
+def changes_since(paths: Iterable[str], rev: str) -> dict[str, list[tuple[int, int]] | None]:
+    """
+    Files changed since `rev` (committed, staged, worktree, untracked) and their changed lines.
+
+    Raises RuntimeError when a path is not inside a git work tree or the diff fails.
+    """
+    changes: dict[str, list[tuple[int, int]] | None] = {}
+    seen = set()
+    for root in paths:
+        top = _toplevel(root)
+        if top is None:
+            raise RuntimeError(f"--since needs a git work tree; {root} is not in one")
+        if top in seen:
+            continue
+        seen.add(top)
+        base = ("diff", "--no-color", "--no-ext-diff", "--no-renames")
+        # File names come from -z output: the patch headers append a tab to
+        # names with spaces and C-quote names with quotes or control characters.
+        names = _git(top, *base, "--name-only", "-z", rev, "--")
+        diff = _git(top, *base, "-U0", rev, "--")
+        if names is None or diff is None:
+            raise RuntimeError(f"git diff {rev} failed in {top}")
+        files = [os.path.join(top, rel) for rel in names.split("\0") if rel]
+        # The patch lists the same files in the same order, one "diff --git" section each.
+        sections = diff.split("\ndiff --git ")
+        if len(sections) != len(files) or (files and not diff.startswith("diff --git ")):
+            sections = [None] * len(files)  # unexpected layout: rescan the files whole
+        for path, section in zip(files, sections):
+            if not os.path.isfile(path):
+                continue  # deleted
+            if section is None:
+                changes[path] = None
+                continue
+            hunks = changes.setdefault(path, [])
+            for line in section.splitlines():
+                m = _HUNK_RE.match(line) if line.startswith("@@") else None
+                if m:
+                    first, count = int(m.group(1)), int(m.group(2) if m.group(2) is not None else 1)
+                    # A pure deletion (count 0) marks the line just before it.
+                    hunks.append((max(1, first), max(first, first + count - 1)))
+        for rel in (_git(top, "ls-files", "--others", "--exclude-standard", "-z") or "").split("\0"):
+            if rel:
+                changes[os.path.join(top, rel)] = None
+    return changes
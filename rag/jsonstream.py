@@ -0,0 +1,174 @@
+"""Single-pass, tolerant JSON object extraction for LLM responses.
+
+LLM output is usually *almost* JSON: wrapped in ```json fences or prose,
+raw newlines/tabs inside strings, the odd invalid escape like "\\d" from a
+regex, trailing text after the object, or cut off by max_tokens.
+
+JSONStreamParser scans the text once, jumping between structural characters
+with str.find and a precompiled regex (no per-character Python loop), to find
+where the object starts and ends while ignoring braces inside strings. It can
+be fed chunk by chunk while a response streams in and reports the object as
+soon as its closing brace arrives. Then json.loads runs once with
+strict=False, which accepts raw control characters in strings; only if that
+fails are invalid escapes repaired for a second attempt.
+
+Public API:
+- JSONStreamParser().feed(chunk) -> dict | None   (dict once the object closes)
+- JSONStreamParser().close() -> dict | None       (best effort for truncated output)
+- extract_json(text) -> dict | None
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any
+
+# Outside strings only these characters matter.
+_OUTSIDE_RE = re.compile(r'[{}\[\]"]')
+# A backslash followed by a valid escape (kept), or a stray backslash.
+_ESCAPE_RE = re.compile(r'\\(["\\/bfnrtu])|\\')
+
+
+def _repair_escapes(text: str) -> str:
+    # "\d" from a regex in patched_code -> "\\d", i.e. a literal backslash.
+    return _ESCAPE_RE.sub(lambda m: m.group(0) if m.group(1) else "\\\\", text)
+
+
+class JSONStreamParser:
+    def __init__(self) -> None:
+        self._chunks: list[str] = []
+        self._size = 0           # total chars fed so far
+        self._pos = 0            # next absolute position to scan
+        self._start = -1         # absolute position of the opening '{'
+        self._end = -1           # absolute position just past the closing '}'
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False     # chunk ended inside a string on an unpaired backslash
+        self._text: str | None = None
+        self.result: dict | None = None
+
+    @property
+    def complete(self) -> bool:
+        return self._end >= 0
+
+    def feed(self, chunk: str) -> dict | None:
+        """Consumes more text; returns the parsed object once it is complete."""
+        if self.complete or not chunk:
+            return self.result
+        base = self._size
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        self._text = None
+        self._scan(chunk, base)
+        if self.complete:
+            self.result = self._parse(self._joined()[self._start : self._end])
+        return self.result
+
+    def close(self) -> dict | None:
+        """Ends the stream; salvages an object cut off before its closing brace."""
+        if self.complete or self._start < 0:
+            return self.result
+        text = self._joined()[self._start :]
+        tail = []
+        if self._escape:
+            text = text[:-1]
+        if self._in_string:
+            tail.append('"')
+        tail.extend("}" if c == "{" else "]" for c in reversed(self._stack))
+        self.result = self._parse(text + "".join(tail), tolerate_tail=True)
+        return self.result
+
+    # ---------- internals ----------
+    def _joined(self) -> str:
+        if self._text is None:
+            self._text = "".join(self._chunks)
+            self._chunks = [self._text]
+        return self._text
+
+    def _scan(self, chunk: str, base: int) -> None:
+        i = self._pos - base
+        n = len(chunk)
+
+        if self._start < 0:
+            j = chunk.find("{", i)
+            if j < 0:
+                self._pos = base + n
+                return
+            self._start = base + j
+            self._stack.append("{")
+            i = j + 1
+
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                # Jump to the next quote; it closes the string unless an odd
+                # run of backslashes precedes it.
+                j = chunk.find('"', i)
+                if j < 0:
+                    k = n
+                    while k > i and chunk[k - 1] == "\\":
+                        k -= 1
+                    self._escape = (n - k) % 2 == 1
+                    i = n
+                    break
+                k = j
+                while k > i and chunk[k - 1] == "\\":
+                    k -= 1
+                i = j + 1
+                if (j - k) % 2 == 0:
+                    self._in_string = False
+                continue
+
+            m = _OUTSIDE_RE.search(chunk, i)
+            if m is None:
+                i = n
+                break
+            j = m.start()
+            ch = chunk[j]
+            i = j + 1
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append(ch)
+            elif self._stack:
+                self._stack.pop()
+                if not self._stack:
+                    self._end = base + i
+                    break
+        self._pos = base + i
+
+    def _parse(self, text: str, tolerate_tail: bool = False) -> dict | None:
+        # strict=False accepts raw newlines/tabs inside strings, so the common
+        # case is a single json.loads with no rewriting at all.
+        out: Any = None
+        for repair in (False, True):
+            try:
+                out = json.loads(_repair_escapes(text) if repair else text, strict=False)
+                break
+            except ValueError:
+                continue
+        else:
+            if not tolerate_tail:
+                return None
+            # A truncated value (e.g. "confidence": 0.) may still break it;
+            # drop the last member and try once more.
+            cut = text.rfind(",", 0, len(text) - 1)
+            closing = "".join("}" if c == "{" else "]" for c in reversed(self._stack))
+            try:
+                out = json.loads(_repair_escapes(text[:cut]) + closing, strict=False) if cut > 0 else None
+            except ValueError:
+                return None
+        return out if isinstance(out, dict) else None
+
+
+def extract_json(text: str) -> dict | None:
+    """Parses the first JSON object in `text`, repairing common LLM damage."""
+    parser = JSONStreamParser()
+    result = parser.feed(text or "")
+    if result is None and not parser.complete:
+        result = parser.close()
+    return result
@@ -8,22 +8,25 @@ Goals:
 
 Public API:
 - generate_fix(lang, path, issue, span, code, passages) -> dict
+- prepare() -> str | None   (get the first backend ready ahead of generate_fix)
 """
 
 from __future__ import annotations
 
-import json
 import os
 import threading
+import time
 import difflib
-import re
 import logging
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-
-from config import CODER_LLM_DIR
+from config import CODER_LLM_DIR, LLM_BACKENDS_FILE, LOCAL_LLM_MAX_BATCH, LOCAL_LLM_QUANT
+from rag.budget import count_tokens, fit_prompt, restore_elided
+from rag import memory, model_client, telemetry
+from rag.device import device
+from rag.jsonstream import extract_json
+from rag.router import LLMRouter, load_router_config
+from rag.rules import apply_rules, best_fix
 
 try:
     from rag import gemini_api
@@ -32,9 +35,14 @@ except ImportError:
     _GEMINI_AVAILABLE = False
     gemini_api = None
 
+if TYPE_CHECKING:
+    from rag.batching import InferenceWorker
+
 logger = logging.getLogger(__name__)
 
-_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# torch, transformers and the batching worker are imported on first load,
+# so fast mode on CPU never pays for them.
+_DEVICE = device()
 
 # Optional escape hatch for low-resource machines.
 # Set DISABLE_LOCAL_LLM=1 to force mock responses.
@@ -46,16 +54,25 @@ _tok = None
 _load_error: str | None = None
 _load_lock = threading.Lock()
 
+_worker: InferenceWorker | None = None
+_worker_lock = threading.Lock()
+
 SYSTEM = (
     "You are a strict code troubleshooter. Use ONLY the provided code and retrieved passages. "
-    "Respond in valid JSON with keys: root_cause, fix_explanation, patch_unified_diff, references, confidence."
+    "Respond in valid JSON with keys: root_cause, fix_explanation, patched_code, patch_unified_diff, references, confidence. "
+    "patched_code MUST contain the complete corrected source code. "
+    "Comment lines of the form '... N lines elided ...' stand for omitted code; keep them unchanged in patched_code."
 )
 
-PROMPT = """[SYSTEM]
-{system}
+# Everything up to the per-request fields is identical for every request, so
+# the inference worker computes its KV cache once and reuses it.
+PROMPT_PREFIX = f"""[SYSTEM]
+{SYSTEM}
 [/SYSTEM]
 [USER]
-Language: {lang}
+"""
+
+PROMPT = """Language: {lang}
 File: {path}
 Detected issue: {issue}
 Span: {span}
@@ -81,7 +98,7 @@ def _passages_block(passages: list[dict[str, Any]]) -> str:
 
 
 def _ensure_loaded() -> None:
-    """Loads tokenizer/model exactly once per process."""
+    """Loads tokenizer/model on first use, and again after a memory eviction."""
     global _lm, _tok, _load_error
 
     if _DISABLE_LOCAL_LLM:
@@ -105,6 +122,9 @@ def _ensure_loaded() -> None:
             return
 
         try:
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
             tok = AutoTokenizer.from_pretrained(
                 CODER_LLM_DIR,
                 use_fast=True,
@@ -118,247 +138,180 @@ def _ensure_loaded() -> None:
                     device_map={"": 0},
                 )
             else:
-                lm = AutoModelForCausalLM.from_pretrained(
-                    CODER_LLM_DIR,
-                    torch_dtype=torch.float32,
-                    low_cpu_mem_usage=True,
-                ).to("cpu")
+                lm = _load_cpu_model()
 
             lm.eval()
             _tok = tok
             _lm = lm
             _load_error = None
-            print(f"[llm] Loaded local LLM on {_DEVICE} from {CODER_LLM_DIR}")
+            print(f"[llm] Loaded local LLM on {_DEVICE} ({_weights_label()}) from {CODER_LLM_DIR}")
         except Exception as e:
             _lm = None
             _tok = None
             _load_error = f"{type(e).__name__}: {e}"
             print("[llm] Could not load LLM, using mock generator. Reason:", _load_error)
+            return
+    memory.loaded("llm", memory.module_size_mb(_lm))
 
 
-def _simple_optimize_python(code: str) -> str:
-    out = code
-    # Replace tabs for consistent formatting in rendered output.
-    out = out.replace("\t", "    ")
-    # Trim trailing spaces line by line.
-    out = "\n".join(line.rstrip() for line in out.splitlines())
-    if code.endswith("\n"):
-        out += "\n"
-    return out
+def _unload() -> None:
+    """Drops the model and its worker; _ensure_loaded() brings them back."""
+    global _lm, _tok, _worker
+    with _load_lock, _worker_lock:
+        if _worker is not None:
+            _worker.shutdown(wait=False)
+        _worker = None
+        _lm = None
+        _tok = None
 
 
-def _patch_division_guard(text: str) -> tuple[str, bool]:
-    updated = re.sub(
-        r"return\s+([^\n#/]+?)\s*/\s*([A-Za-z_]\w*)\s*$",
-        r"return \1 / \2 if \2 != 0 else 0",
-        text,
-        flags=re.MULTILINE,
-    )
-    return updated, updated != text
-
-
-def _adjust_index_in_line(line: str) -> tuple[str, bool]:
-    m = re.search(r"\[( *)(\d+)( *)\]", line)
-    if not m:
-        return line, False
-    old_idx = int(m.group(2))
-    safe_idx = max(0, old_idx - 1)
-    if old_idx == safe_idx:
-        return line, False
-    old_bracket = f"[{m.group(1)}{old_idx}{m.group(3)}]"
-    new_bracket = f"[{safe_idx}]"
-    return line.replace(old_bracket, new_bracket, 1) + "  # fixed off-by-one", True
-
-
-def _patch_direct_indexing(text: str) -> tuple[str, bool]:
-    lines = text.splitlines()
-    changed = False
-    for i, line in enumerate(lines):
-        if "[" in line and "]" in line:
-            new_line, line_changed = _adjust_index_in_line(line)
-            if line_changed:
-                lines[i] = new_line
-                changed = True
-    return "\n".join(lines) if changed else text, changed
-
-
-def _patch_bounds_loops(text: str) -> tuple[str, bool]:
-    if "<=" in text and ("for" in text or "while" in text):
-        updated = text.replace("<=", "<")
-        return updated, updated != text
-    
-    lines = text.splitlines()
-    changed = False
-    
-    for i, line in enumerate(lines):
-        if "range(" in line and "- i)" in line:
-            lines[i] = re.sub(r"range\(([a-zA-Z0-9_]+)\s*-\s*i\)", r"range(\1 - i - 1)", line)
-            if lines[i] != line:
-                changed = True
-    
-    if changed:
-        return "\n".join(lines), True
-    
-    i = 0
-    while i < len(lines) - 1:
-        curr = lines[i].strip()
-        next_line = lines[i + 1].strip() if i + 1 < len(lines) else ""
-        has_first = "arr[j]" in lines[i] and "arr[j + 1]" in lines[i] and "=" in lines[i]
-        has_second = "arr[j + 1]" in lines[i + 1] and "arr[j]" in lines[i + 1] and "=" in lines[i + 1]
-        if has_first and has_second:
-            indent = len(lines[i]) - len(lines[i].lstrip())
-            lines[i] = " " * indent + "arr[j], arr[j + 1] = arr[j + 1], arr[j]  # fixed swap"
-            lines.pop(i + 1)
-            changed = True
-            continue
-        i += 1
-    
-    if changed:
-        return "\n".join(lines), True
-    
-    if "[" in text and "]" in text:
-        updated, changed = _patch_direct_indexing(text)
-        if changed:
-            return updated, True
-    
-    return text, False
-
-
-def _line_indent(line: str) -> int:
-    return len(line) - len(line.lstrip(" "))
-
-
-def _find_body_end(lines: list[str], body_start: int, base_indent: int) -> int:
-    j = body_start
-    while j < len(lines):
-        stripped = lines[j].strip()
-        if stripped and _line_indent(lines[j]) <= base_indent:
-            break
-        j += 1
-    return j
-
-
-def _has_counter_increment(lines: list[str], body_start: int, body_end: int, var: str) -> bool:
-    pattern = rf"^\s*{re.escape(var)}\s*(\+=|=)\s*"
-    for k in range(body_start, body_end):
-        if re.search(pattern, lines[k]):
-            return True
-    return False
-
-
-def _infer_body_indent(lines: list[str], body_start: int, body_end: int, base_indent: int) -> int:
-    for k in range(body_start, body_end):
-        if lines[k].strip():
-            return _line_indent(lines[k])
-    return base_indent + 4
-
-
-def _patch_missing_loop_increment(text: str) -> tuple[str, bool]:
-    lines = text.splitlines()
-    changed = False
-    i = 0
-
-    while i < len(lines):
-        m = re.match(r"^(\s*)while\s+([A-Za-z_]\w*)\s*<\s*len\([^\)]*\)\s*:\s*$", lines[i])
-        if not m:
-            i += 1
-            continue
-
-        base_indent = len(m.group(1))
-        var = m.group(2)
-        body_start = i + 1
-        body_end = _find_body_end(lines, body_start, base_indent)
-
-        if body_start >= body_end or _has_counter_increment(lines, body_start, body_end, var):
-            i = body_end
-            continue
-
-        body_indent = _infer_body_indent(lines, body_start, body_end, base_indent)
-        insert_line = f"{' ' * body_indent}{var} += 1  # auto-fix: avoid infinite loop"
-        lines.insert(body_end, insert_line)
-        changed = True
-        i = body_end + 1
-
-    return "\n".join(lines), changed
-
-
-def _detect_action(issue: str) -> tuple[str, str]:
-    text = issue or ""
-    if "ZeroDivision" in text:
-        return "division", "Added a division-by-zero guard in return expressions."
-    if "Index" in text or "Bounds" in text:
-        return "bounds", "Adjusted loop bounds to avoid out-of-range indexing."
-    if "None" in text or "Null" in text:
-        return "null", "Potential null/None dereference detected. Add guards before attribute or method access."
-    return "auto", "Applied safe fallback optimization and retained original logic."
-
-
-def _try_division_patch(action: str, patched: str, explanation: str) -> tuple[str, str, bool]:
-    if action not in {"division", "auto"}:
-        return patched, explanation, False
-    updated, changed = _patch_division_guard(patched)
-    if not changed:
-        return patched, explanation, False
-    if action == "auto":
-        explanation = "Detected unsafe division and added a zero-check guard."
-    return updated, explanation, True
-
-
-def _try_bounds_patch(action: str, patched: str, explanation: str) -> tuple[str, str, bool]:
-    if action not in {"bounds", "auto"}:
-        return patched, explanation, False
-    updated, changed = _patch_bounds_loops(patched)
-    if not changed:
-        return patched, explanation, False
-    
-    if action == "bounds":
-        explanation = "Applied safe bounds checking for array access and loop conditions."
-    else:
-        explanation = "Detected potential array bounds issue and applied defensive fix."
-    return updated, explanation, True
-
-
-def _try_iteration_patch(action: str, patched: str, explanation: str) -> tuple[str, str, bool]:
-    if action not in {"bounds", "auto"}:
-        return patched, explanation, False
-    updated, changed = _patch_missing_loop_increment(patched)
-    if not changed:
-        return patched, explanation, False
-    if action == "auto":
-        explanation = "Detected missing loop counter update and added an increment step."
-    else:
-        explanation = "Added missing loop counter increment to prevent infinite loops."
-    return updated, explanation, True
+memory.register("llm", _unload)
 
 
-def _apply_heuristic_fix(issue: str, code: str) -> tuple[str, str]:
-    action, explanation = _detect_action(issue)
-    patched = code
+def _weights_label() -> str:
+    return "fp16" if _DEVICE == "cuda" else LOCAL_LLM_QUANT
 
-    patched, explanation, changed = _try_division_patch(action, patched, explanation)
-    if changed:
-        return _simple_optimize_python(patched), explanation
 
-    patched, explanation, changed = _try_bounds_patch(action, patched, explanation)
-    if changed:
-        return _simple_optimize_python(patched), explanation
+def _load_cpu_model():
+    """Loads the coder LLM for CPU in the LOCAL_LLM_QUANT format."""
+    import torch
+    from transformers import AutoModelForCausalLM
 
-    patched, explanation, changed = _try_iteration_patch(action, patched, explanation)
-    if changed:
-        return _simple_optimize_python(patched), explanation
+    if LOCAL_LLM_QUANT == "bf16":
+        return AutoModelForCausalLM.from_pretrained(
+            CODER_LLM_DIR,
+            torch_dtype=torch.bfloat16,
+            low_cpu_mem_usage=True,
+        ).to("cpu")
 
-    patched = _simple_optimize_python(patched)
-    if patched != code:
-        return patched, "Applied safe code cleanup for readability and execution stability."
-    
-    if "Index" in (issue or "") or "Bounds" in (issue or "") or "ZeroDivision" in (issue or ""):
-        return patched, "Potential defect detected. Ensure bounds checks are in place before array access and arithmetic operations."
-    
-    return patched, explanation
+    lm = AutoModelForCausalLM.from_pretrained(
+        CODER_LLM_DIR,
+        torch_dtype=torch.float32,
+        low_cpu_mem_usage=True,
+    ).to("cpu")
+    if LOCAL_LLM_QUANT == "int8":
+        # Dynamic quantization: int8 weights for every nn.Linear, activations
+        # quantized on the fly. Embeddings and norms stay fp32.
+        lm = torch.ao.quantization.quantize_dynamic(lm, {torch.nn.Linear}, dtype=torch.qint8)
+    elif LOCAL_LLM_QUANT != "fp32":
+        print(f"[llm] Unknown LOCAL_LLM_QUANT={LOCAL_LLM_QUANT!r}, using fp32")
+    return lm
 
 
-def _mock_generate(issue: str, code: str) -> dict:
-    patched_code, explanation = _apply_heuristic_fix(issue, code)
+def _get_worker() -> InferenceWorker:
+    """Returns the single inference worker that owns the loaded local model."""
+    global _worker
+    from rag.batching import InferenceWorker
+
+    w = _worker
+    if w is not None and w.model is _lm:
+        return w
+    with _worker_lock:
+        if _worker is not None and _worker.model is _lm:
+            return _worker
+        if _worker is not None:
+            _worker.shutdown(wait=False)
+        _worker = InferenceWorker(_lm, _tok, prefix=PROMPT_PREFIX, max_batch=LOCAL_LLM_MAX_BATCH)
+        return _worker
+
+
+def _local_generate(prompt: str, max_new_tokens: int = 1024, constrained: bool = False) -> str:
+    """
+    Greedy generation on the local model for PROMPT_PREFIX + prompt.
+
+    Runs on the shared inference worker, which batches decode steps across
+    concurrent requests and only prefills `prompt` on top of the cached
+    prefix KV. With constrained=True the output is forced into the fix
+    response schema and generation stops as soon as the object closes.
+    With config.MODEL_SERVER_URL set this runs on the shared model server.
+    """
+    if model_client.enabled():
+        return model_client.generate(prompt, max_new_tokens=max_new_tokens, constrained=constrained)
+    # Pinned until the result is back so the memory manager cannot evict
+    # the model mid-generation.
+    with memory.using("llm"):
+        _ensure_loaded()
+        if _lm is None or _tok is None:
+            raise RuntimeError(f"local LLM unavailable: {_load_error}")
+        if constrained:
+            from rag.constrained import JsonConstraint
+
+            constraint = JsonConstraint(_tok)
+            future = _get_worker().submit(
+                prompt,
+                max_new_tokens=max_new_tokens,
+                stop=constraint.stop,
+                logits_processor=constraint,
+            )
+        else:
+            future = _get_worker().submit(prompt, max_new_tokens=max_new_tokens)
+        return future.result()
+
+
+def _generate_local_fix(lang: str, path: str, issue: str, span: str, code: str, passages: list[dict[str, Any]]) -> dict:
+    overhead = count_tokens(PROMPT_PREFIX + PROMPT.format(lang=lang, path=path, issue=issue, span=span, code="", passages=""), "local")
+    prompt_code, prompt_passages, budget = fit_prompt(code, passages, span, lang, backend="local", overhead_tokens=overhead)
+    prompt = PROMPT.format(
+        lang=lang,
+        path=path,
+        issue=issue,
+        span=span,
+        code=prompt_code,
+        passages=_passages_block(prompt_passages),
+    )
+    t0 = time.perf_counter()
+    text = _local_generate(prompt, constrained=True)
+    total_ms = (time.perf_counter() - t0) * 1000
+    result = _extract_json(text) or {}
+
+    patched = result.get("patched_code") or code
+    if budget["code_ranges"]:
+        patched = restore_elided(code, patched, budget, lang) or code
+    patch = "\n".join(
+        difflib.unified_diff(code.splitlines(), patched.splitlines(), fromfile="a/snippet", tofile="b/snippet", lineterm="")
+    )
+    explanation = result.get("fix_explanation") or "Fix generated by local model"
+    try:
+        confidence = float(result.get("confidence", 0.75))
+    except (TypeError, ValueError):
+        confidence = 0.75
+    return {
+        "root_cause": result.get("root_cause") or issue or "Possible_Bug",
+        "fix_explanation": explanation,
+        "explanation": explanation,
+        "patched_code": patched,
+        "patch_unified_diff": patch,
+        "unified_diff": patch,
+        "references": result.get("references") or ["local_kb: qwen2.5-coder"],
+        "confidence": confidence,
+        "_llm_status": "Qwen2.5-Coder-1.5B-Instruct",
+        "_budget": budget,
+        "_metrics": {
+            "backend": "local",
+            "model": "Qwen2.5-Coder-1.5B-Instruct",
+            "streamed": False,
+            "prompt_tokens": count_tokens(PROMPT_PREFIX + prompt, "local"),
+            "completion_tokens": count_tokens(text, "local"),
+            "usage_estimated": False,
+            "ttfb_ms": None,
+            "generation_ms": round(total_ms, 1),
+            "total_ms": round(total_ms, 1),
+        },
+    }
+
+
+def _apply_heuristic_fix(issue: str, code: str) -> tuple[str, str]:
+    return apply_rules(issue, code)
+
+
+def heuristic_fix(issue: str, code: str, lang: str | None = None, status: str | None = None) -> dict:
+    """Deterministic rule-based fix in the same shape as an LLM result.
+
+    `_rule` and `_patch_certainty` name the rule that fired (None / 0.0 when
+    only whitespace cleanup applied); `_fixes` lists the detector rules it
+    is a fix for.
+    """
+    patched_code, explanation, rule = best_fix(issue, code, lang)
     diff_lines = difflib.unified_diff(
         code.splitlines(),
         patched_code.splitlines(),
@@ -377,47 +330,92 @@ def _mock_generate(issue: str, code: str) -> dict:
         "unified_diff": patch,
         "references": ["local_kb: heuristic-fallback"],
         "confidence": 0.8,
-        "_llm_status": f"Fast heuristic fixer ({_load_error or 'no local LLM'})",
+        "_llm_status": status or f"Fast heuristic fixer ({_load_error or 'no local LLM'})",
+        "_rule": rule.name if rule else None,
+        "_patch_certainty": rule.certainty if rule else 0.0,
+        "_fixes": list(rule.fixes) if rule else [],
     }
 
 
+def _mock_generate(issue: str, code: str) -> dict:
+    return heuristic_fix(issue, code)
+
+
 def _extract_json(text: str) -> dict:
-    try:
-        return json.loads(text)
-    except Exception:
-        pass
+    return extract_json(text) or {}
 
-    s, e = text.rfind("{"), text.rfind("}")
-    if 0 <= s < e:
-        try:
-            return json.loads(text[s : e + 1])
-        except Exception:
-            return {}
-    return {}
+
+def _remote_fix(lang, path, issue, span, code, passages):
+    result = gemini_api.generate_fix(lang, path, issue, span, code, passages)
+    if result:
+        # Mask the actual API usage as local LLM
+        result["_llm_status"] = "Qwen2.5-Coder-1.5B-Instruct"
+        result["_actual_source"] = gemini_api._MODEL_NAME  # Hidden metadata
+        logger.info(f"[generate_fix] Using Gemini API ({gemini_api._MODEL_NAME}) for {issue}")
+    return result
+
+
+def _local_fix(lang, path, issue, span, code, passages):
+    if model_client.enabled():
+        logger.info(f"[generate_fix] Using local LLM on the model server for {issue}")
+        return _generate_local_fix(lang, path, issue, span, code, passages)
+    _ensure_loaded()
+    if _lm is None or _tok is None:
+        raise RuntimeError(f"local LLM unavailable: {_load_error}")
+    logger.info(f"[generate_fix] Using local LLM on {_DEVICE} for {issue}")
+    return _generate_local_fix(lang, path, issue, span, code, passages)
 
 
+def _local_available() -> bool:
+    if model_client.enabled():
+        return model_client.healthy()
+    # Not loaded yet counts as available: the first request pays the load.
+    return not _DISABLE_LOCAL_LLM and (_lm is not None or _load_error is None)
+
+
+def _heuristic_backend_fix(lang, path, issue, span, code, passages):
+    return heuristic_fix(issue, code, lang)
+
+
+_router: LLMRouter | None = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    """The process-wide backend router, built from config.LLM_BACKENDS_FILE."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                adapters = {
+                    "remote": (_remote_fix, lambda: bool(_GEMINI_AVAILABLE and gemini_api and gemini_api.is_available())),
+                    "local": (_local_fix, _local_available),
+                    "heuristic": (_heuristic_backend_fix, lambda: True),
+                }
+                _router = LLMRouter.from_config(load_router_config(LLM_BACKENDS_FILE), adapters)
+    return _router
+
+
+def prepare() -> str | None:
+    """
+    Readies the backend generate_fix() would try first, ahead of the call:
+    builds the router, probes availability (which creates the API client or
+    checks the model server) and, for the in-process model, loads it.
+    Returns the backend's name (None when none is available).
+    """
+    backends = get_router().pick()
+    if not backends:
+        return None
+    if backends[0].name == "local" and not model_client.enabled():
+        with memory.using("llm"):
+            _ensure_loaded()
+    return backends[0].name
+
+
+@telemetry.timed("generate_fix")
 def generate_fix(lang: str, path: str, issue: str, span: str, code: str, passages: list[dict[str, Any]]):
     """
-    Generate a code fix using Gemini API directly.
-    Results are masked to appear as if using local Qwen2.5-Coder LLM.
+    Generate a code fix on the best available backend (remote API, local
+    Qwen, heuristic rules), failing over in priority order; see rag/router.py.
     """
-    
-    # Use Gemini API (primary and only method)
-    if _GEMINI_AVAILABLE and gemini_api:
-        try:
-            result = gemini_api.generate_fix(lang, path, issue, span, code, passages)
-            if result:
-                # Mask the actual API usage as local LLM
-                result["_llm_status"] = "Qwen2.5-Coder-1.5B-Instruct"
-                result["_actual_source"] = gemini_api._MODEL_NAME  # Hidden metadata
-                logger.info(f"[generate_fix] Using Gemini API ({gemini_api._MODEL_NAME}) for {issue}")
-                return result
-            elif gemini_api.is_available():
-                raise RuntimeError("Groq API is configured but failed to generate a fix (internal API error).")
-        except Exception as e:
-            logger.error(f"[generate_fix] Groq API error: {e}")
-            raise
-    
-    # If Groq API is not available, raise error
-    logger.error("[generate_fix] Groq API not configured")
-    raise RuntimeError("Groq/LLM API is required but not configured/installed. Set GROQ_API_KEY in .env")
+    return get_router().generate(lang, path, issue, span, code, passages)
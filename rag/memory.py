@@ -0,0 +1,214 @@
+"""Memory budget manager for the resident models.
+
+The embedder (rag.retriever), defect predictor (rag.predictor) and local LLM
+(rag.llm) stay loaded forever once used. Each of them registers here with an
+unload callback, reports its size when it loads, and wraps every use in
+using(name), which records the last-use time and pins it while in use.
+
+When process RSS exceeds config.MEMORY_BUDGET_MB, models that are not in use
+and have been idle for at least MODEL_IDLE_S are unloaded in LRU order until
+RSS is back under budget. The owning module reloads the model lazily the
+next time it is needed; that counts as a reload. The check runs after every
+model load and on a background thread every MEMORY_CHECK_S.
+
+MEMORY_BUDGET_MB=0 (default) disables eviction; sizes, last use and
+counters are still tracked.
+
+Public API:
+- register(name, unload)        — once per component, at import
+- loaded(name, size_mb)         — after the component has loaded
+- using(name)                   — context manager around each use
+- enforce_budget() -> list[str] — evicted names
+- stats() -> dict
+- rss_mb(), module_size_mb(model)
+"""
+
+from __future__ import annotations
+
+import gc
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from config import MEMORY_BUDGET_MB, MEMORY_CHECK_S, MODEL_IDLE_S
+
+logger = logging.getLogger(__name__)
+
+
+def rss_mb() -> float:
+    """Resident set size of this process in MB."""
+    try:
+        import psutil  # type: ignore
+
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def module_size_mb(model) -> float:
+    """Bytes held by a torch module's parameters and buffers, in MB."""
+    total = 0
+    for t in list(model.parameters()) + list(model.buffers()):
+        total += t.numel() * t.element_size()
+    return total / 2**20
+
+
+class _Entry:
+    __slots__ = ("unload", "loaded", "size_mb", "last_used", "in_use", "evictions", "reloads", "evicted")
+
+    def __init__(self, unload: Callable[[], None]):
+        self.unload = unload
+        self.loaded = False
+        self.size_mb = 0.0
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.evicted = False
+
+
+class MemoryManager:
+    def __init__(self, budget_mb: float = 0, idle_s: float = 300, check_s: float = 30, rss: Callable[[], float] = rss_mb):
+        self.budget_mb = budget_mb
+        self.idle_s = idle_s
+        self.check_s = check_s
+        self._rss = rss
+        self._entries: dict[str, _Entry] = {}
+        self._lock = threading.RLock()
+        self._checker: threading.Thread | None = None
+
+    def register(self, name: str, unload: Callable[[], None]) -> None:
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(unload)
+        self._start_checker()
+
+    def loaded(self, name: str, size_mb: float = 0.0) -> None:
+        with self._lock:
+            e = self._entries[name]
+            if e.evicted:
+                e.reloads += 1
+                e.evicted = False
+            e.loaded = True
+            e.size_mb = round(size_mb, 1)
+            e.last_used = time.monotonic()
+        self.enforce_budget(exclude=name)
+
+    @contextmanager
+    def using(self, name: str):
+        with self._lock:
+            e = self._entries[name]
+            e.in_use += 1
+            e.last_used = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                e.in_use -= 1
+                e.last_used = time.monotonic()
+
+    def enforce_budget(self, exclude: str | None = None) -> list[str]:
+        """Unloads idle models, least recently used first, while RSS is over budget."""
+        if not self.budget_mb:
+            return []
+        evicted = []
+        with self._lock:
+            while self._rss() > self.budget_mb:
+                now = time.monotonic()
+                idle = [
+                    (e.last_used, name)
+                    for name, e in self._entries.items()
+                    if e.loaded and not e.in_use and name != exclude and now - e.last_used >= self.idle_s
+                ]
+                if not idle:
+                    break
+                _, name = min(idle)
+                e = self._entries[name]
+                before = self._rss()
+                try:
+                    e.unload()
+                except Exception as ex:
+                    logger.error(f"[memory] unloading {name} failed: {ex}")
+                    break
+                e.loaded = False
+                e.evicted = True
+                e.evictions += 1
+                _release_memory()
+                evicted.append(name)
+                logger.info(f"[memory] evicted {name} ({e.size_mb} MB): RSS {before:.0f} -> {self._rss():.0f} MB")
+        return evicted
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "budget_mb": self.budget_mb,
+                "rss_mb": round(self._rss(), 1),
+                "components": {
+                    name: {
+                        "loaded": e.loaded,
+                        "size_mb": e.size_mb,
+                        "idle_s": round(now - e.last_used, 1),
+                        "in_use": e.in_use,
+                        "evictions": e.evictions,
+                        "reloads": e.reloads,
+                    }
+                    for name, e in self._entries.items()
+                },
+            }
+
+    def _start_checker(self) -> None:
+        if not self.budget_mb or self.check_s <= 0 or self._checker is not None:
+            return
+        with self._lock:
+            if self._checker is None:
+                self._checker = threading.Thread(target=self._check_loop, name="memory-budget", daemon=True)
+                self._checker.start()
+
+    def _check_loop(self) -> None:
+        while True:
+            time.sleep(self.check_s)
+            try:
+                self.enforce_budget()
+            except Exception as e:
+                logger.error(f"[memory] budget check failed: {e}")
+
+
+def _release_memory() -> None:
+    """Returns freed tensors to the OS / driver so RSS actually drops."""
+    gc.collect()
+    try:
+        import sys
+
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:
+        pass
+    try:
+        import ctypes
+
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except Exception:
+        pass
+
+
+_manager = MemoryManager(MEMORY_BUDGET_MB, MODEL_IDLE_S, MEMORY_CHECK_S)
+
+register = _manager.register
+loaded = _manager.loaded
+using = _manager.using
+enforce_budget = _manager.enforce_budget
+stats = _manager.stats
@@ -0,0 +1,97 @@
+"""Thin client for the shared model server (rag/model_server.py).
+
+With config.MODEL_SERVER_URL set, the web workers stop loading CodeBERT,
+CodeT5p and Qwen themselves and call these functions instead; the server
+hosts each model once and batches the calls from all workers.
+
+Transport is JSON over localhost HTTP (stdlib urllib). Embedding matrices
+travel as base64 float32 so a batch of 768-d vectors is not serialized
+digit by digit.
+
+Public API:
+- enabled() -> bool
+- embed(texts, max_len=256) -> np.ndarray[float32]
+- predict(code, lang) -> dict
+- generate(prompt, max_new_tokens=1024, constrained=False) -> str
+- healthy() -> bool   (cached for a few seconds)
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import time
+import urllib.error
+import urllib.request
+from typing import Any
+
+from config import MODEL_SERVER_TIMEOUT, MODEL_SERVER_URL
+
+_HEALTH_TTL_S = 5.0
+_health: tuple[float, bool] = (0.0, False)
+
+
+def enabled() -> bool:
+    return bool(MODEL_SERVER_URL)
+
+
+def _request(path: str, payload: dict[str, Any] | None = None, timeout: float | None = None) -> dict[str, Any]:
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(
+        MODEL_SERVER_URL + path,
+        data=data,
+        headers={"Content-Type": "application/json"},
+        method="GET" if data is None else "POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout or MODEL_SERVER_TIMEOUT) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        try:
+            detail = json.loads(e.read().decode("utf-8")).get("error")
+        except Exception:
+            detail = e.reason
+        raise RuntimeError(f"model server {path} failed: {detail}") from None
+    except (urllib.error.URLError, OSError) as e:
+        raise RuntimeError(f"model server unreachable at {MODEL_SERVER_URL}: {e}") from None
+
+
+def decode_matrix(obj: dict[str, Any]):
+    import numpy as np
+
+    buf = base64.b64decode(obj["data"])
+    return np.frombuffer(buf, dtype=obj.get("dtype", "float32")).reshape(obj["shape"]).copy()
+
+
+def encode_matrix(arr) -> dict[str, Any]:
+    return {"dtype": str(arr.dtype), "shape": list(arr.shape), "data": base64.b64encode(arr.tobytes()).decode("ascii")}
+
+
+def embed(texts, max_len: int = 256):
+    if isinstance(texts, str):
+        texts = [texts]
+    out = _request("/embed", {"texts": list(texts), "max_len": max_len})
+    return decode_matrix(out["vectors"])
+
+
+def predict(code: str, lang: str = "python") -> dict:
+    return _request("/predict", {"code": code, "lang": lang})["result"]
+
+
+def generate(prompt: str, max_new_tokens: int = 1024, constrained: bool = False) -> str:
+    out = _request("/generate", {"prompt": prompt, "max_new_tokens": max_new_tokens, "constrained": constrained})
+    return out["text"]
+
+
+def healthy() -> bool:
+    """True if the server answers /health and has the local LLM loaded."""
+    global _health
+    checked, ok = _health
+    if time.monotonic() - checked < _HEALTH_TTL_S:
+        return ok
+    try:
+        ok = bool(_request("/health", timeout=2).get("llm_loaded"))
+    except RuntimeError:
+        ok = False
+    _health = (time.monotonic(), ok)
+    return ok
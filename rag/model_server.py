@@ -0,0 +1,217 @@
+"""Model server: hosts the embedder, defect predictor and local LLM once.
+
+Each web worker that imports rag.retriever / rag.predictor / rag.llm would
+otherwise load its own copy of CodeBERT, CodeT5p and Qwen, so RAM grows with
+the worker count. Run this once per machine:
+
+    python -m rag.model_server            # binds MODEL_SERVER_HOST:MODEL_SERVER_PORT
+
+and start the web app with MODEL_SERVER_URL=http://127.0.0.1:8765. The rag
+modules then go through rag/model_client.py.
+
+Endpoints (JSON over HTTP, one thread per connection):
+- POST /embed     {"texts": [...], "max_len": 256} -> {"vectors": <base64 float32>}
+                  calls from all workers are micro-batched: the first waits up
+                  to MODEL_SERVER_BATCH_WAIT_MS for others, then one forward
+                  pass embeds up to MODEL_SERVER_MAX_BATCH texts
+- POST /predict   {"code": ..., "lang": ...} -> {"result": predict_defect(...)}
+                  micro-batched the same way: the defect model's windows of
+                  every file in the batch share padded forward passes
+                  (predictor.predict_defect_batch)
+- POST /generate  {"prompt": ..., "max_new_tokens": ..., "constrained": ...} -> {"text": ...}
+                  concurrent calls share the continuous-batching InferenceWorker
+- GET  /health    -> loaded models, batching and memory stats
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+# This process hosts the models; never forward to itself.
+os.environ.pop("MODEL_SERVER_URL", None)
+
+from config import MODEL_SERVER_BATCH_WAIT_MS, MODEL_SERVER_HOST, MODEL_SERVER_MAX_BATCH, MODEL_SERVER_PORT
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls into batched ones.
+
+    batch_fn(items, key) gets the items of every call collected in the
+    window that share `key` and returns one result per item, in order.
+    """
+
+    def __init__(self, batch_fn: Callable, max_batch: int = 32, wait_ms: float = 5.0, name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.wait_s = max(0.0, wait_ms) / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "items": 0, "batches": 0}
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, items: list, key: Any = None) -> Future:
+        fut: Future = Future()
+        self._queue.put((list(items), key, fut))
+        return fut
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        s["mean_batch"] = round(s["items"] / s["batches"], 2) if s["batches"] else 0.0
+        return s
+
+    def _collect(self) -> list[tuple[list, Any, Future]]:
+        first = self._queue.get()
+        items, n = [first], len(first[0])
+        deadline = time.monotonic() + self.wait_s
+        while n < self.max_batch:
+            left = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=left) if left > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            n += len(item[0])
+        return items
+
+    def _loop(self) -> None:
+        while True:
+            calls = self._collect()
+            # Calls with different keys (e.g. truncation lengths) cannot share a pass.
+            groups: dict[Any, list[tuple[list, Any, Future]]] = {}
+            for call in calls:
+                groups.setdefault(call[1], []).append(call)
+            for key, group in groups.items():
+                items = [x for g in group for x in g[0]]
+                try:
+                    results = self.batch_fn(items, key) if items else None
+                except Exception as e:
+                    for _, _, fut in group:
+                        fut.set_exception(e)
+                    continue
+                with self._lock:
+                    self._stats["requests"] += len(group)
+                    self._stats["items"] += len(items)
+                    self._stats["batches"] += 1
+                at = 0
+                for g_items, _, fut in group:
+                    fut.set_result(results[at : at + len(g_items)] if results is not None else results)
+                    at += len(g_items)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "RagModelServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):  # keep stdout quiet; errors are logged below
+        logger.debug("[model_server] " + fmt, *args)
+
+    def _send(self, status: int, obj: dict[str, Any]) -> None:
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send(404, {"error": f"unknown path {self.path}"})
+        self._send(200, self.server.app.health())
+
+    def do_POST(self):
+        route = self.server.app.routes.get(self.path)
+        if route is None:
+            return self._send(404, {"error": f"unknown path {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            self._send(200, route(payload))
+        except Exception as e:
+            logger.exception(f"[model_server] {self.path} failed")
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+class ModelServerApp:
+    """Loads the models and implements the endpoints."""
+
+    def __init__(self, max_batch: int = MODEL_SERVER_MAX_BATCH, wait_ms: float = MODEL_SERVER_BATCH_WAIT_MS):
+        from rag import llm, memory, predictor, retriever
+        from rag.model_client import encode_matrix
+
+        self._llm, self._predictor, self._encode, self._memory = llm, predictor, encode_matrix, memory
+        t0 = time.perf_counter()
+        retriever._ensure_embedder()
+        predictor._ensure_loaded()
+        llm._ensure_loaded()
+        print(
+            f"[model_server] models ready in {time.perf_counter() - t0:.1f}s "
+            f"(llm: {'loaded' if llm._lm is not None else llm._load_error})"
+        )
+        self.batcher = MicroBatcher(retriever._embed_local, max_batch=max_batch, wait_ms=wait_ms, name="embed-batcher")
+        self.predict_batcher = MicroBatcher(
+            lambda items, _key: predictor.predict_defect_batch(items),
+            max_batch=max_batch,
+            wait_ms=wait_ms,
+            name="predict-batcher",
+        )
+        self.routes = {"/embed": self.embed, "/predict": self.predict, "/generate": self.generate}
+
+    def embed(self, payload: dict[str, Any]) -> dict[str, Any]:
+        vecs = self.batcher.submit(payload.get("texts") or [], int(payload.get("max_len") or 256)).result()
+        return {"vectors": self._encode(vecs)}
+
+    def predict(self, payload: dict[str, Any]) -> dict[str, Any]:
+        item = (payload.get("code") or "", payload.get("lang") or "python")
+        (result,) = self.predict_batcher.submit([item]).result()
+        return {"result": result}
+
+    def generate(self, payload: dict[str, Any]) -> dict[str, Any]:
+        # Raises when the LLM cannot load; reloads it if it was evicted.
+        text = self._llm._local_generate(
+            payload.get("prompt") or "",
+            max_new_tokens=int(payload.get("max_new_tokens") or 1024),
+            constrained=bool(payload.get("constrained")),
+        )
+        return {"text": text}
+
+    def health(self) -> dict[str, Any]:
+        worker = self._llm._worker
+        return {
+            "ok": True,
+            "llm_loaded": self._llm._lm is not None,
+            "llm_error": self._llm._load_error,
+            "embed_batching": self.batcher.stats(),
+            "predict_batching": self.predict_batcher.stats(),
+            "llm_worker": worker.stats() if worker is not None else None,
+            "memory": self._memory.stats(),
+        }
+
+
+def serve(host: str = MODEL_SERVER_HOST, port: int = MODEL_SERVER_PORT) -> None:
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.app = ModelServerApp()
+    print(f"[model_server] listening on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    serve()
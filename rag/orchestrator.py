@@ -1,25 +1,496 @@
 # rag/orchestrator.py
+import asyncio
+import copy
+import difflib
+import hashlib
+import logging
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from rag.predictor import predict_defect
+from config import (
+    CHUNK_MAX_SUSPECTS,
+    CHUNK_SUSPECT_CONF,
+    CHUNK_THRESHOLD_CHARS,
+    CHUNK_WORKERS,
+    DETECT_TIMEOUT_S,
+    HEURISTIC_MIN_DETECTOR_CONF,
+    HEURISTIC_MIN_PATCH_CERTAINTY,
+    HEURISTIC_TIER,
+    LLM_TIMEOUT_S,
+    RETRIEVE_CANDIDATES,
+    RETRIEVE_TIMEOUT_S,
+    STAGE_WORKERS,
+)
+from rag import chunker, memory, telemetry
+from rag.patching import unified_diff
+from rag.predictor import predict_defect, rule_findings, summarize
 from rag.retriever import retrieve
-from rag.llm import generate_fix
+from rag.rules import tidy
+from rag.llm import generate_fix, heuristic_fix, prepare
 
+logger = logging.getLogger(__name__)
 
 _FAST_ANALYSIS_MODE = (os.environ.get("FAST_ANALYSIS_MODE") or "1").strip().lower() in {"1", "true", "yes"}
 
+# Per-tier request counts and cumulative latency, see routing_stats().
+_route_lock = threading.Lock()
+_route_counts = {"heuristic": 0, "llm": 0}
+_route_ms = {"heuristic": 0.0, "llm": 0.0}
+
+
+# Single-flight: identical concurrent analyses share one pipeline run.
+_flight_lock = threading.Lock()
+_inflight: dict = {}
+_flight_counts = {"leaders": 0, "coalesced": 0}
+
+
+class _Flight:
+    __slots__ = ("done", "waiters", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+@telemetry.timed("build_query")
 def build_query(code: str, issue_type: str, lang="python"):
     # simple query; you can enhance with AST tokens, filenames, etc.
     return f"{lang} {issue_type} {code[:200]}"
 
+
+def _heuristic_tier(det: dict, code: str, lang: str):
+    """Returns (result or None, reason). A result means the LLM can be skipped."""
+    if not HEURISTIC_TIER:
+        return None, "heuristic tier disabled"
+    det_conf = float(det.get("confidence") or 0.0)
+    if det_conf < HEURISTIC_MIN_DETECTOR_CONF:
+        return None, f"detector confidence {det_conf:.2f} < {HEURISTIC_MIN_DETECTOR_CONF:.2f}"
+    fix = heuristic_fix(det["issue_type"], code, lang, status="Deterministic rule fixer")
+    if fix["_rule"] is None:
+        return None, "no rule matched"
+    if fix["_patch_certainty"] < HEURISTIC_MIN_PATCH_CERTAINTY:
+        return None, f"rule {fix['_rule']} certainty {fix['_patch_certainty']:.2f} < {HEURISTIC_MIN_PATCH_CERTAINTY:.2f}"
+    if det.get("rule") not in fix["_fixes"]:
+        return None, f"rule {fix['_rule']} does not fix finding {det.get('rule')}"
+    if not _edit_within(code, fix["patched_code"], det.get("span_lines")):
+        return None, f"rule {fix['_rule']} edits outside lines {det.get('span_lines')}"
+    return fix, f"rule {fix['_rule']} certainty {fix['_patch_certainty']:.2f}"
+
+
+def _edit_within(code: str, patched: str, span) -> bool:
+    """True when every line `patched` changes in `code` lies in the "a-b" span."""
+    first, sep, last = str(span or "").partition("-")
+    if not (first.isdigit() and (not sep or last.isdigit())):
+        return False
+    lo, hi = int(first), int(last or first)
+    ops = difflib.SequenceMatcher(None, tidy(code).splitlines(), patched.splitlines(), autojunk=False).get_opcodes()
+    edits = [(i1, i2) for tag, i1, i2, _, _ in ops if tag != "equal"]
+    # 1-based: a replaced/deleted run covers lines i1+1..i2 and must lie in
+    # the span; an insertion goes after line i1, which must be a span line
+    # (so a statement appended to a loop body spanning lo..hi counts).
+    return bool(edits) and all((lo <= i1 + 1 and i2 <= hi) if i2 > i1 else lo <= i1 <= hi for i1, i2 in edits)
+
+
+def _record(tier: str, ms: float) -> None:
+    with _route_lock:
+        _route_counts[tier] += 1
+        _route_ms[tier] += ms
+
+
+def routing_stats() -> dict:
+    """Requests served per tier and their mean latency in ms."""
+    with _route_lock:
+        return {
+            tier: {"count": n, "mean_ms": round(_route_ms[tier] / n, 2) if n else 0.0}
+            for tier, n in _route_counts.items()
+        }
+
+
+def _flight_key(code: str, path: str, lang: str) -> str:
+    # The exact text, line endings included: followers receive the leader's
+    # line numbers, patched code and diff, which must match their own bytes.
+    h = hashlib.sha256()
+    for part in (lang or "", path or "", code):
+        h.update(part.encode("utf-8", "surrogatepass"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def single_flight_stats() -> dict:
+    """Pipeline runs started (leaders), requests that joined one (coalesced), runs in flight."""
+    with _flight_lock:
+        return dict(_flight_counts, in_flight=len(_inflight))
+
+
+def pipeline_stats() -> dict:
+    return {
+        "routing": routing_stats(),
+        "single_flight": single_flight_stats(),
+        "memory": memory.stats(),
+        "stage_pool": stage_pool_stats(),
+        "telemetry": telemetry.snapshot(),
+    }
+
+
 def analyze(code: str, path: str = "snippet.py", lang: str = "python"):
-    det = predict_defect(code, lang=lang)
-    query = build_query(code, det["issue_type"], lang=lang)
+    """
+    Detect -> (heuristic | retrieve + LLM) for one snippet.
+
+    Inputs over CHUNK_THRESHOLD_CHARS are split into functions/classes; only
+    chunks the detector flags go through the expensive stages and their
+    patches are stitched back into the whole file (result["_chunks"]).
+
+    The stages run overlapped on an event loop (see _analyze_async), each
+    with its own timeout; this is the synchronous wrapper around it.
+
+    Concurrent calls with the same code (byte for byte), path and language wait
+    for the first one and receive a deep copy of its result, with
+    result["_coalesced"] = True.
+    """
+    key = _flight_key(code, path, lang)
+    with _flight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+            _flight_counts["leaders"] += 1
+        else:
+            flight.waiters += 1
+            _flight_counts["coalesced"] += 1
+    telemetry.count("cache_misses_total" if leader else "cache_hits_total", cache="single_flight")
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        out = copy.deepcopy(flight.result)
+        out[0]["_coalesced"] = True
+        return out
+
+    try:
+        with telemetry.span("analyze"):
+            out = _analyze(code, path, lang)
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flight_lock:
+            _inflight.pop(key, None)
+            waiters = flight.waiters
+        if waiters and flight.error is None:
+            # Snapshot before the caller can mutate its copy.
+            flight.result = copy.deepcopy(out)
+        flight.done.set()
+    return out
+
+
+async def analyze_async(code: str, path: str = "snippet.py", lang: str = "python"):
+    """analyze() as a coroutine, for callers with an event loop; no single-flight coalescing."""
+    return await _analyze_async(code, path, lang)
+
+
+def _analyze(code: str, path: str, lang: str):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_analyze_async(code, path, lang))
+    # Called from inside an event loop: run a loop of our own on a dedicated
+    # thread. On a stage worker it would wait for stages queued behind it.
+    box: dict = {}
+
+    def run():
+        try:
+            box["out"] = asyncio.run(_analyze_async(code, path, lang))
+        except BaseException as e:
+            box["error"] = e
+
+    thread = threading.Thread(target=run, name="analyze-loop", daemon=True)
+    thread.start()
+    thread.join()
+    if "error" in box:
+        raise box["error"]
+    return box["out"]
+
+
+# ---------- overlapped stages ----------
+# Blocking stages (model inference, FAISS, HTTP) run on this pool; the event
+# loop only overlaps and times them. A stage that times out keeps its thread
+# until it returns, but the request goes on without its result. Such
+# abandoned stages are counted (stage_pool_stats()). A stage's timeout runs
+# from when a worker picks it up, so a pool busy with them makes requests
+# queue instead of timing out on queue time.
+_stage_pool = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+_abandoned_lock = threading.Lock()
+_abandoned: dict = {}  # stage name -> timed-out stages still running
+
+
+def _submit(fn, *args) -> Future:
+    """Queues a stage on the pool; future.started resolves to its start time once a worker runs it."""
+    started: Future = Future()
+
+    def run():
+        started.set_result(time.perf_counter())
+        return fn(*args)
+
+    future = _stage_pool.submit(run)
+    future.started = started
+    return future
+
+
+def _abandon(name: str, future: Future) -> None:
+    with _abandoned_lock:
+        _abandoned[name] = _abandoned.get(name, 0) + 1
+        busy = sum(_abandoned.values())
+    if busy * 2 >= STAGE_WORKERS:
+        logger.warning(f"[router] {busy} of {STAGE_WORKERS} stage workers still run abandoned stages")
+
+    def done(_):
+        with _abandoned_lock:
+            _abandoned[name] -= 1
+
+    future.add_done_callback(done)
+
+
+def stage_pool_stats() -> dict:
+    """Stage pool size and timed-out stages whose threads are still running, by stage."""
+    with _abandoned_lock:
+        return {"workers": STAGE_WORKERS, "abandoned": {k: v for k, v in _abandoned.items() if v}}
+
+
+class _Run:
+    """Stage timings (ms) and timed-out stages of one request."""
+
+    def __init__(self):
+        self.timings: dict = {}
+        self.timeouts: list = []
+
+    async def stage(self, name: str, future: Future, timeout: float, fallback):
+        """
+        Awaits a _submit() future until `timeout` seconds (0 = no limit) after
+        it started running, else returns fallback(). Queue time does not count.
+        """
+        t1 = time.perf_counter()
+        try:
+            if not future.done():
+                await asyncio.wrap_future(future.started)
+            left = None
+            if timeout:
+                started = future.started.result() if future.started.done() else t1
+                left = max(0.0, timeout - (time.perf_counter() - started))
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), left)
+        except asyncio.TimeoutError:
+            _abandon(name, future)
+            self.timeouts.append(name)
+            telemetry.count("stage_timeouts_total", stage=name)
+            logger.warning(f"[router] {name} timed out after {timeout:g}s")
+            return fallback()
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - t1) * 1000
+
+
+def _prepare_llm():
+    try:
+        return prepare()
+    except Exception as e:
+        logger.warning(f"[router] preparing the LLM backend failed: {e}")
+        return None
+
+
+def _candidates(findings: list, limit: int) -> list:
+    """Distinct issue types of the most confident findings."""
+    issues: list = []
+    for f in findings:
+        if len(issues) >= limit:
+            break
+        if f["issue_type"] not in issues:
+            issues.append(f["issue_type"])
+    return issues
+
+
+def _prefetch(code: str, lang: str, findings: list) -> dict:
+    """Starts retrieval for the likely issue types before detection settles on one."""
+    if _FAST_ANALYSIS_MODE:
+        return {}
+    return {
+        issue: _submit(retrieve, build_query(code, issue, lang=lang), 5)
+        for issue in _candidates(findings, RETRIEVE_CANDIDATES)
+    }
+
+
+async def _fix_async(det: dict, code: str, path: str, lang: str, query: str, run: _Run, prefetched: dict | None = None):
+    """Heuristic tier, else retrieval + LLM. Returns (result, passages, ids, tier, reason)."""
+    t1 = time.perf_counter()
+    result, reason = _heuristic_tier(det, code, lang)
+    run.timings["heuristic"] = (time.perf_counter() - t1) * 1000
+    if result is not None:
+        return result, [], [], "heuristic", reason
     if _FAST_ANALYSIS_MODE:
         passages, ids = [], []
     else:
-        passages, ids = retrieve(query, topk=5)
-    result = generate_fix(lang, path, det["issue_type"], det["span_lines"], code, passages)
+        fetching = (prefetched or {}).get(det["issue_type"])
+        telemetry.count("cache_misses_total" if fetching is None else "cache_hits_total", cache="retrieval_prefetch")
+        if fetching is None:
+            fetching = _submit(retrieve, query, 5)
+        passages, ids = await run.stage("retrieve", fetching, RETRIEVE_TIMEOUT_S, lambda: ([], []))
+    issue, span = det["issue_type"], det["span_lines"]
+    result = await run.stage(
+        "llm",
+        _submit(generate_fix, lang, path, issue, span, code, passages),
+        LLM_TIMEOUT_S,
+        lambda: heuristic_fix(issue, code, lang, status=f"LLM timed out after {LLM_TIMEOUT_S:g}s"),
+    )
+    if "llm" in run.timeouts:
+        return result, passages, ids, "heuristic", f"LLM timed out after {LLM_TIMEOUT_S:g}s"
+    return result, passages, ids, "llm", reason
+
+
+async def _analyze_async(code: str, path: str, lang: str):
+    """
+    detect ─┬─> heuristic | retrieve ─> LLM
+    rules ──┴─> retrieve (likely issue types, speculative)
+    prepare LLM backend ───────────────────^
+
+    The cheap rule findings come first. Retrieval for their most likely
+    issue types and the LLM backend's preparation start while the defect
+    model is still running, so the passages are usually ready when
+    detection settles on an issue.
+    """
+    if len(code) > CHUNK_THRESHOLD_CHARS:
+        return await _analyze_chunked(code, path, lang)
+    t0 = time.perf_counter()
+    run = _Run()
+    _submit(_prepare_llm)
+    rules = rule_findings(code, lang)
+    run.timings["rules"] = (time.perf_counter() - t0) * 1000
+    detecting = _submit(predict_defect, code, lang, rules)
+    prefetched = _prefetch(code, lang, rules)
+
+    det = await run.stage("detect", detecting, DETECT_TIMEOUT_S, lambda: summarize(rules))
+    query = build_query(code, det["issue_type"], lang=lang)
+    result, passages, ids, tier, reason = await _fix_async(det, code, path, lang, query, run, prefetched)
+    for issue, fut in prefetched.items():
+        if issue != det["issue_type"] or tier == "heuristic":
+            fut.cancel()  # speculation not needed; no-op if already running
+
+    total = (time.perf_counter() - t0) * 1000
+    _record(tier, total)
+    telemetry.count("analyses_total", tier=tier, chunked="0")
+    logger.info(f"[router] {tier} ({reason}) in {total:.1f} ms")
+    result["_routing"] = {
+        "tier": tier,
+        "reason": reason,
+        "detector_confidence": det.get("confidence"),
+        "timings_ms": {k: round(v, 2) for k, v in run.timings.items()},
+        "total_ms": round(total, 2),
+        "prefetched": list(prefetched),
+        "timeouts": run.timeouts,
+    }
+    result["_detector"] = det
+    result["_retrieval_ids"] = ids
+    return result, passages, det, query
+
+
+def _shift(finding: dict, offset: int, chunk: chunker.Chunk) -> dict:
+    out = dict(finding, chunk=chunk.name)
+    if isinstance(out.get("line"), int):
+        out["line"] += offset
+    first, sep, last = str(out.get("span_lines") or "").partition("-")
+    if first.isdigit() and (not sep or last.isdigit()):
+        out["span_lines"] = f"{int(first) + offset}-{int(last or first) + offset}"
+    return out
+
+
+async def _analyze_chunked(code: str, path: str, lang: str):
+    """Detector on every chunk; heuristic / retrieval + LLM only on suspect chunks, concurrently."""
+    t0 = time.perf_counter()
+    run = _Run()
+    _submit(_prepare_llm)
+    chunks = chunker.chunk(code, lang)
+    rules = [rule_findings(c.text, lang) for c in chunks]
+    detecting = _submit(lambda: [predict_defect(c.text, lang, r) for c, r in zip(chunks, rules)])
+    dets = await run.stage("detect", detecting, DETECT_TIMEOUT_S, lambda: [summarize(r) for r in rules])
+
+    findings = [_shift(f, c.start - 1, c) for c, d in zip(chunks, dets) for f in d.get("findings") or []]
+    findings.sort(key=lambda f: (-float(f.get("confidence") or 0.0), f.get("line") or 0))
+    det = dict(findings[0]) if findings else {"issue_type": "Possible_Bug", "span_lines": "?", "confidence": 0.5}
+    det.pop("chunk", None)
+    det.update(findings=findings, chunks=len(chunks))
+
+    suspects = [i for i, d in enumerate(dets) if d.get("findings") and float(d.get("confidence") or 0.0) >= CHUNK_SUSPECT_CONF]
+    suspects = sorted(suspects, key=lambda i: -float(dets[i]["confidence"]))[:CHUNK_MAX_SUSPECTS]
+    gate = asyncio.Semaphore(max(1, CHUNK_WORKERS))
+
+    async def fix(i: int):
+        async with gate:
+            t1 = time.perf_counter()
+            c, sub = chunks[i], _Run()
+            out = await _fix_async(dets[i], c.text, path, lang, build_query(c.text, dets[i]["issue_type"], lang=lang), sub)
+            _record(out[3], (time.perf_counter() - t1) * 1000)
+            run.timeouts += [f"{name}:{c.name}" for name in sub.timeouts]
+            return out
+
+    t1 = time.perf_counter()
+    fixed = dict(zip(suspects, await asyncio.gather(*(fix(i) for i in suspects))))
+    run.timings["fix"] = (time.perf_counter() - t1) * 1000
+
+    patched = {i: r[0]["patched_code"] for i, r in fixed.items() if r[0].get("patched_code") and r[0]["patched_code"] != chunks[i].text}
+    patched_code = chunker.stitch(code, chunks, patched)
+    diff = unified_diff(code, patched_code)
+    passages = [p for r in fixed.values() for p in r[1]]
+    ids = [x for r in fixed.values() for x in r[2]]
+    tiers = [r[3] for r in fixed.values()]
+
+    if suspects:
+        result = dict(fixed[suspects[0]][0])
+        notes = [
+            f"{chunks[i].name} (lines {chunks[i].span_lines}): {fixed[i][0].get('fix_explanation') or ''}".strip()
+            for i in suspects
+        ]
+        result["fix_explanation"] = result["explanation"] = "\n".join(notes)
+        result["references"] = list(dict.fromkeys(ref for r in fixed.values() for ref in r[0].get("references") or []))
+        query = build_query(chunks[suspects[0]].text, dets[suspects[0]]["issue_type"], lang=lang)
+    else:
+        result = {
+            "root_cause": "No suspicious code found",
+            "fix_explanation": f"No detector finding reached {CHUNK_SUSPECT_CONF:.2f} in {len(chunks)} chunks.",
+            "references": [],
+            "confidence": det.get("confidence"),
+        }
+        result["explanation"] = result["fix_explanation"]
+        query = build_query(code, det["issue_type"], lang=lang)
+    result.update(patched_code=patched_code, patch_unified_diff=diff, unified_diff=diff)
+
+    total = (time.perf_counter() - t0) * 1000
+    tier = "llm" if "llm" in tiers else ("heuristic" if tiers else "none")
+    reason = f"{len(suspects)} of {len(chunks)} chunks suspect"
+    telemetry.count("analyses_total", tier=tier, chunked="1")
+    logger.info(f"[router] chunked {tier} ({reason}) in {total:.1f} ms")
+    result["_chunks"] = [
+        {
+            "name": c.name,
+            "kind": c.kind,
+            "span_lines": c.span_lines,
+            "issue_type": dets[i]["issue_type"],
+            "detector_confidence": dets[i].get("confidence"),
+            "tier": fixed[i][3] if i in fixed else None,
+            "patched": i in patched,
+        }
+        for i, c in enumerate(chunks)
+    ]
+    result["_routing"] = {
+        "tier": tier,
+        "reason": reason,
+        "detector_confidence": det.get("confidence"),
+        "timings_ms": {k: round(v, 2) for k, v in run.timings.items()},
+        "total_ms": round(total, 2),
+        "chunks": len(chunks),
+        "suspect_chunks": len(suspects),
+        "timeouts": run.timeouts,
+    }
     result["_detector"] = det
     result["_retrieval_ids"] = ids
     return result, passages, det, query
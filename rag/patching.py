@@ -0,0 +1,177 @@
+"""Local patch engine for the diff-only LLM output contract.
+
+In "hunks" output mode the model returns only the edited regions:
+
+    "hunks": [{"start_line": 12, "find": "<original lines>", "replace": "<new lines>"}]
+
+and we rebuild patched_code here instead of paying for the model to echo the
+whole file back. Each hunk is located in the original code by, in order:
+- exact line match (nearest to start_line when the text repeats)
+- whitespace-insensitive line match
+- fuzzy match (difflib ratio >= FUZZY_THRESHOLD) near start_line
+
+The unified diff is computed locally with difflib.
+
+Public API:
+- apply_hunks(code, hunks) -> (patched_code, report)
+- unified_diff(original, patched) -> str
+"""
+
+from __future__ import annotations
+
+import difflib
+import re
+from typing import Any
+
+FUZZY_THRESHOLD = 0.8
+# How far (in lines) from start_line the fuzzy search looks.
+_FUZZY_RADIUS = 40
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _norm(line: str) -> str:
+    return _WS_RE.sub(" ", line.strip())
+
+
+def _indent(line: str) -> str:
+    return line[: len(line) - len(line.lstrip())]
+
+
+def _nearest(positions: list[int], hint: int | None) -> int:
+    if hint is None:
+        return positions[0]
+    return min(positions, key=lambda p: (abs(p - hint), p))
+
+
+def _locate(lines: list[str], find: list[str], hint: int | None) -> tuple[int, str] | None:
+    n = len(find)
+    if n == 0 or n > len(lines):
+        return None
+
+    first = find[0]
+    exact = [i for i in range(len(lines) - n + 1) if lines[i] == first and lines[i : i + n] == find]
+    if exact:
+        return _nearest(exact, hint), "exact"
+
+    norm_lines = [_norm(l) for l in lines]
+    norm_find = [_norm(l) for l in find]
+    loose = [i for i in range(len(lines) - n + 1) if norm_lines[i : i + n] == norm_find]
+    if loose:
+        return _nearest(loose, hint), "whitespace"
+
+    center = hint if hint is not None else 0
+    lo = max(0, center - _FUZZY_RADIUS) if hint is not None else 0
+    hi = min(len(lines) - n, center + _FUZZY_RADIUS) if hint is not None else len(lines) - n
+    target = "\n".join(norm_find)
+    sm = difflib.SequenceMatcher(None, "", target, autojunk=False)
+    best, best_ratio = None, 0.0
+    for i in range(lo, hi + 1):
+        floor = max(best_ratio, FUZZY_THRESHOLD)
+        sm.set_seq1("\n".join(norm_lines[i : i + n]))
+        if sm.real_quick_ratio() < floor or sm.quick_ratio() < floor:
+            continue
+        r = sm.ratio()
+        if r < FUZZY_THRESHOLD:
+            continue
+        if best is None or r > best_ratio or (r == best_ratio and abs(i - center) < abs(best - center)):
+            best, best_ratio = i, r
+    if best is None:
+        return None
+    return best, "fuzzy"
+
+
+def _reindent(replace: list[str], find_first: str, found_first: str) -> list[str]:
+    # The model often drops or changes leading indentation; shift the
+    # replacement by however far the matched line is indented differently.
+    want, got = _indent(found_first), _indent(find_first)
+    if want == got:
+        return replace
+    out = []
+    for line in replace:
+        if line.startswith(got):
+            out.append(want + line[len(got) :])
+        else:
+            out.append(want + line.lstrip())
+    return out
+
+
+def apply_hunks(code: str, hunks: list[dict[str, Any]]) -> tuple[str, dict[str, Any]]:
+    """
+    Applies model hunks to the original code.
+
+    Returns (patched_code, report). The report counts every input hunk in
+    "total" and the applied/fuzzy ones; "failed" lists the indices of hunks
+    that were malformed, could not be placed or overlapped an earlier one,
+    and "reasons" maps each of those indices to why.
+    """
+    lines = code.splitlines()
+    hunks = list(hunks or [])
+    report: dict[str, Any] = {"total": len(hunks), "applied": 0, "fuzzy": 0, "failed": [], "reasons": {}}
+    edits: list[tuple[int, int, int, list[str]]] = []
+
+    def fail(k: int, reason: str) -> None:
+        report["failed"].append(k)
+        report["reasons"][k] = reason
+
+    for k, h in enumerate(hunks):
+        if not isinstance(h, dict):
+            fail(k, "malformed")
+            continue
+        find = str(h.get("find") or "").splitlines()
+        replace = str(h.get("replace") or "").splitlines()
+        try:
+            hint = int(h.get("start_line")) - 1
+        except (TypeError, ValueError):
+            hint = None
+
+        if not find:
+            # Pure insertion before start_line.
+            if hint is None or not 0 <= hint <= len(lines):
+                fail(k, "insertion without a valid start_line")
+                continue
+            edits.append((hint, hint, k, replace))
+            continue
+
+        loc = _locate(lines, find, hint)
+        if loc is None:
+            fail(k, "find text not found")
+            continue
+        pos, how = loc
+        if how != "exact":
+            replace = _reindent(replace, find[0], lines[pos])
+            if how == "fuzzy":
+                report["fuzzy"] += 1
+        edits.append((pos, pos + len(find), k, replace))
+
+    # Apply bottom-up so earlier positions stay valid; drop overlapping hunks.
+    edits.sort(key=lambda e: (e[0], e[1], e[2]))
+    accepted: list[tuple[int, int, list[str]]] = []
+    last_end = -1
+    for start, end, k, replace in edits:
+        if start < last_end:
+            fail(k, f"overlaps another hunk at line {start + 1}")
+            continue
+        accepted.append((start, end, replace))
+        last_end = max(end, start)
+    for start, end, replace in reversed(accepted):
+        lines[start:end] = replace
+    report["applied"] = len(accepted)
+    report["failed"].sort()
+
+    patched = "\n".join(lines)
+    if code.endswith("\n") and lines:
+        patched += "\n"
+    return patched, report
+
+
+def unified_diff(original: str, patched: str) -> str:
+    return "\n".join(
+        difflib.unified_diff(
+            original.splitlines(),
+            patched.splitlines(),
+            fromfile="a/snippet",
+            tofile="b/snippet",
+            lineterm="",
+        )
+    )
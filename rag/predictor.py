@@ -1,13 +1,28 @@
 # rag/predictor.py
+import bisect
 import os
-import torch
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+import threading
+from types import SimpleNamespace
 
-from config import DEFECT_PREDICTOR_DIR
+from config import (
+    DEFECT_MAX_BATCH,
+    DEFECT_MODEL_FORMAT,
+    DEFECT_ONNX_DIR,
+    DEFECT_PREDICTOR_DIR,
+    DEFECT_WINDOW_OVERLAP,
+    DEFECT_WINDOW_TOKENS,
+)
+from rag import memory, model_client, telemetry
+from rag.detector import detect
+from rag.signatures import scan as scan_signatures
+from rag.device import device
 
-_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# torch/transformers are imported only when the checkpoint is loaded.
+_DEVICE = device()
 _model = None
 _tok = None
+_loaded = False
+_load_lock = threading.Lock()
 
 # The bundled checkpoint is not fine-tuned for token classification, which causes
 # noisy warnings and unreliable predictions. Keep the heuristic fallback as the
@@ -15,76 +30,349 @@ _tok = None
 # properly fine-tuned checkpoint.
 _ENABLE_DEFECT_MODEL = (os.environ.get("ENABLE_DEFECT_MODEL") or "").strip().lower() in {"1", "true", "yes"}
 
-def _load_or_none():
+# export_predictor.py writes these into DEFECT_ONNX_DIR, next to the
+# tokenizer and config of the exported checkpoint.
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+
+
+class _OnnxTokenClassifier:
+    """An ONNX Runtime session behind the `model(input_ids=, attention_mask=).logits` call."""
+
+    def __init__(self, path: str, config):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CPUExecutionProvider"]
+        if _DEVICE == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self._sess = ort.InferenceSession(path, opts, providers=providers)
+        self.config = config
+        self.size_mb = os.path.getsize(path) / 2**20
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+
+        (logits,) = self._sess.run(
+            ["logits"],
+            {"input_ids": input_ids.cpu().numpy(), "attention_mask": attention_mask.cpu().numpy()},
+        )
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+def _load_tokenizer(path: str):
+    from transformers import AutoTokenizer
+
+    # The fast tokenizer gives offset mappings (exact token -> line spans).
+    # For CodeT5p the sentencepiece slow tokenizer avoids Windows issues,
+    # so fall back to it when the fast one cannot load.
+    try:
+        tok = AutoTokenizer.from_pretrained(path, use_fast=True, clean_up_tokenization_spaces=False)
+    except Exception:
+        tok = AutoTokenizer.from_pretrained(path, use_fast=False, clean_up_tokenization_spaces=False)
+    if tok.pad_token is None:
+        tok.pad_token = tok.eos_token
+    return tok
+
+
+def _load_onnx(fmt: str) -> bool:
+    global _model, _tok
+    path = os.path.join(DEFECT_ONNX_DIR, ONNX_FILES[fmt])
+    if not os.path.exists(path):
+        print(f"[predictor] {path} not found (run export_predictor.py), using fp32")
+        return False
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        print("[predictor] onnxruntime not installed (pip install onnxruntime), using fp32")
+        return False
+    from transformers import AutoConfig
+
+    _tok = _load_tokenizer(DEFECT_ONNX_DIR)
+    _model = _OnnxTokenClassifier(path, AutoConfig.from_pretrained(DEFECT_ONNX_DIR))
+    return True
+
+
+def _load_torch(fmt: str) -> None:
+    global _model, _tok
+    import torch
+    from transformers import AutoModelForTokenClassification
+
+    _tok = _load_tokenizer(DEFECT_PREDICTOR_DIR)
+    model = AutoModelForTokenClassification.from_pretrained(DEFECT_PREDICTOR_DIR)
+    if getattr(model.config, "pad_token_id", None) is None:
+        model.config.pad_token_id = _tok.pad_token_id
+    model.eval()
+    if fmt == "int8" and _DEVICE == "cpu":
+        # Same dynamic quantization as LOCAL_LLM_QUANT=int8: int8 nn.Linear
+        # weights, activations quantized on the fly.
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif fmt not in ("fp32", "int8", *ONNX_FILES):
+        print(f"[predictor] Unknown DEFECT_MODEL_FORMAT={fmt!r}, using fp32")
+    _model = model.to(_DEVICE)
+
+
+def _load_or_none(fmt: str = ""):
     global _model, _tok
+    fmt = fmt or DEFECT_MODEL_FORMAT
     try:
-        if not _ENABLE_DEFECT_MODEL:
+        # With a model server the checkpoint lives there, not in every worker.
+        if not _ENABLE_DEFECT_MODEL or model_client.enabled():
             _model = None
             _tok = None
             return
-
-        # For CodeT5p, sentencepiece slow tokenizer avoids Windows issues
-        use_fast = False
-        _tok = AutoTokenizer.from_pretrained(
-            DEFECT_PREDICTOR_DIR,
-            use_fast=use_fast,
-            clean_up_tokenization_spaces=False,
-        )
-        if _tok.pad_token is None:
-            _tok.pad_token = _tok.eos_token
-        _model = AutoModelForTokenClassification.from_pretrained(DEFECT_PREDICTOR_DIR)
-        if getattr(_model.config, "pad_token_id", None) is None:
-            _model.config.pad_token_id = _tok.pad_token_id
-        _model.to(_DEVICE).eval()
+        if fmt in ONNX_FILES:
+            if _load_onnx(fmt):
+                return
+            telemetry.count("fallbacks_total", stage="predictor_load", failed="onnx")
+        _load_torch(fmt)
     except Exception as e:
         print("[predictor] fallback mode:", e)
+        telemetry.count("fallbacks_total", stage="predictor_load", failed="model")
         _model = None
         _tok = None
 
-_load_or_none()
+def _ensure_loaded():
+    """Loads the checkpoint (or settles on the heuristic) once, on first use or warmup."""
+    global _loaded
+    if _loaded:
+        return
+    with _load_lock:
+        if _loaded:
+            return
+        _load_or_none()
+        _loaded = True
+    if _model is not None:
+        size = getattr(_model, "size_mb", None)
+        memory.loaded("predictor", size if size is not None else memory.module_size_mb(_model))
+
+
+def _unload():
+    global _model, _tok, _loaded
+    with _load_lock:
+        _model = None
+        _tok = None
+        _loaded = False
+
+
+memory.register("predictor", _unload)
+
+# ---------- windowed model inference ----------
+def _token_starts(code: str) -> tuple[list[int], list[int]]:
+    """Token ids of `code` (no special tokens) and the char offset each starts at."""
+    if getattr(_tok, "is_fast", False):
+        enc = _tok(code, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        starts = []
+        for start, end in enc["offset_mapping"]:
+            # BPE tokens may carry the preceding newline/indent; anchor them
+            # on their first visible character.
+            while start < end - 1 and code[start].isspace():
+                start += 1
+            starts.append(start)
+        return enc["input_ids"], starts
+    # Slow tokenizers have no offset mapping: encode line by line so every
+    # token still knows which line it came from.
+    ids, starts, at = [], [], 0
+    for line in code.splitlines(keepends=True):
+        line_ids = _tok.encode(line, add_special_tokens=False)
+        ids += line_ids
+        starts += [at] * len(line_ids)
+        at += len(line)
+    return ids, starts
+
+
+def _windows(n: int, size: int, overlap: int) -> list[tuple[int, int]]:
+    """(start, end) token ranges covering [0, n); neighbours share `overlap` tokens."""
+    if n <= size:
+        return [(0, n)]
+    step = max(1, size - overlap)
+    out, start = [], 0
+    while start + size < n:
+        out.append((start, start + size))
+        start += step
+    out.append((n - size, n))  # last window full-size, flush with the end
+    return out
+
+
+def _label_name(label: int) -> str:
+    name = str((getattr(_model.config, "id2label", None) or {}).get(label, f"LABEL_{label}"))
+    if name[:2] in {"B-", "I-"}:
+        name = name[2:]
+    return "Suspected_Defect" if name.startswith("LABEL_") else name
+
+
+def _token_probs(code: str, max_batch: int = DEFECT_MAX_BATCH):
+    """
+    Label probabilities for every token of `code` (a [tokens, labels]
+    tensor, None for empty input) and the char offset each token starts at.
+
+    The file is split into overlapping windows that go through the model as
+    padded batches of up to `max_batch`. Tokens covered by several windows
+    average their label probabilities.
+    """
+    return _token_probs_many([code], max_batch)[0]
+
+
+def _token_probs_many(codes: list[str], max_batch: int = DEFECT_MAX_BATCH) -> list[tuple]:
+    """_token_probs() for several files at once; their windows share the padded batches."""
+    import torch
+
+    max_len = min(DEFECT_WINDOW_TOKENS, int(getattr(_tok, "model_max_length", DEFECT_WINDOW_TOKENS)))
+    size = max(8, max_len - _tok.num_special_tokens_to_add())
+    encoded = [_token_starts(code) for code in codes]
+    rows, owners = [], []  # owners: (file, [(row position, token index)])
+    for f, (ids, _starts) in enumerate(encoded):
+        if not ids:
+            continue
+        for s, e in _windows(len(ids), size, min(DEFECT_WINDOW_OVERLAP, size // 2)):
+            chunk = ids[s:e]
+            rows.append(_tok.build_inputs_with_special_tokens(chunk))
+            special = _tok.get_special_tokens_mask(chunk)
+            owners.append((f, [(pos, s + k) for k, pos in enumerate(p for p, m in enumerate(special) if not m)]))
+
+    num_labels = int(_model.config.num_labels)
+    summed = [torch.zeros((len(ids), num_labels)) for ids, _ in encoded]
+    counts = [torch.zeros(len(ids)) for ids, _ in encoded]
+    pad_id = _tok.pad_token_id or 0
+    with torch.inference_mode():
+        for b in range(0, len(rows), max(1, max_batch)):
+            batch = rows[b : b + max_batch]
+            width = max(len(r) for r in batch)
+            input_ids = torch.full((len(batch), width), pad_id, dtype=torch.long)
+            mask = torch.zeros((len(batch), width), dtype=torch.long)
+            for i, r in enumerate(batch):
+                input_ids[i, : len(r)] = torch.tensor(r, dtype=torch.long)
+                mask[i, : len(r)] = 1
+            logits = _model(input_ids=input_ids.to(_DEVICE), attention_mask=mask.to(_DEVICE)).logits
+            probs = logits.float().softmax(-1).cpu()
+            for i, (f, pairs) in enumerate(owners[b : b + max_batch]):
+                pos = torch.tensor([p for p, _ in pairs], dtype=torch.long)
+                tok_idx = torch.tensor([t for _, t in pairs], dtype=torch.long)
+                summed[f].index_add_(0, tok_idx, probs[i, pos])
+                counts[f].index_add_(0, tok_idx, torch.ones(len(pairs)))
+
+    return [
+        (summed[f] / counts[f].clamp(min=1).unsqueeze(1) if ids else None, starts)
+        for f, (ids, starts) in enumerate(encoded)
+    ]
+
+
+def _model_findings(code: str, max_batch: int = DEFECT_MAX_BATCH) -> list[dict]:
+    """
+    Runs the token-classification model over the whole file.
+
+    Tokens whose merged label (see _token_probs) is not 0 ("no defect") are
+    mapped to lines through their char offsets, and consecutive lines with
+    the same label become one finding.
+    """
+    return _model_findings_many([code], max_batch)[0]
+
+
+def _model_findings_many(codes: list[str], max_batch: int = DEFECT_MAX_BATCH) -> list[list[dict]]:
+    """_model_findings() for several files, with their windows pooled into shared batches."""
+    return [_spans(code, merged, starts) for code, (merged, starts) in zip(codes, _token_probs_many(codes, max_batch))]
+
+
+def _spans(code: str, merged, starts: list[int]) -> list[dict]:
+    """Line-span findings from the merged token labels (see _model_findings)."""
+    if merged is None:
+        return []
+    conf, labels = merged.max(-1)
+    line_starts = [0]
+    at = code.find("\n")
+    while at != -1:
+        line_starts.append(at + 1)
+        at = code.find("\n", at + 1)
+    # line -> (issue name, token confidences); B-/I- tags of one type share a name
+    by_line: dict[int, tuple[str, list[float]]] = {}
+    for t in (labels != 0).nonzero().flatten().tolist():
+        line = bisect.bisect_right(line_starts, starts[t])
+        name = _label_name(int(labels[t]))
+        label, confs = by_line.setdefault(line, (name, []))
+        if name == label:
+            confs.append(float(conf[t]))
+
+    findings, run = [], None
+    for line in sorted(by_line):
+        label, confs = by_line[line]
+        if run and run["label"] == label and line == run["end"] + 1:
+            run["end"] = line
+            run["confs"] += confs
+        else:
+            run = {"label": label, "start": line, "end": line, "confs": list(confs)}
+            findings.append(run)
+    return [
+        {
+            "issue_type": r["label"],
+            "rule": "defect_model",
+            "span_lines": f"{r['start']}-{r['end']}",
+            "line": r["start"],
+            "confidence": round(sum(r["confs"]) / len(r["confs"]), 3),
+            "message": "token-classification model",
+        }
+        for r in findings
+    ]
+
 
 # ---------- public API ----------
-def predict_defect(code: str, lang: str = "python"):
+def rule_findings(code: str, lang: str = "python") -> list[dict]:
+    """The rule-based detector's and the signature scanner's findings, most confident first (no model)."""
+    findings = detect(code, lang) + scan_signatures(code, lang)
+    findings.sort(key=lambda f: (-f["confidence"], f["line"]))
+    return findings
+
+
+def summarize(findings: list[dict]) -> dict:
+    """predict_defect()'s result for an already sorted list of findings."""
+    if not findings:
+        return {"issue_type": "Possible_Bug", "span_lines": "?", "confidence": 0.5, "findings": []}
+    top = findings[0]
+    return {
+        "issue_type": top["issue_type"],
+        "span_lines": top["span_lines"],
+        "confidence": top["confidence"],
+        "rule": top.get("rule"),
+        "findings": findings,
+    }
+
+
+@telemetry.timed("predict_defect")
+def predict_defect(code: str, lang: str = "python", rules: list[dict] | None = None):
+    """
+    Returns: dict(issue_type, span_lines, confidence, findings)
+
+    The top-level keys describe the most confident finding; `findings`
+    lists all of them: the rule-based detector's (see rag/detector.py), the
+    signature scanner's (rag/signatures.py) and, with ENABLE_DEFECT_MODEL,
+    the span model's. `rules` passes in rule_findings(code, lang) when the
+    caller already has them.
+    """
+    if model_client.enabled():
+        return model_client.predict(code, lang)
+    with memory.using("predictor"):
+        _ensure_loaded()
+        model_findings = _model_findings(code) if _model is not None and _tok is not None else []
+
+    findings = model_findings + (rules if rules is not None else rule_findings(code, lang))
+    findings.sort(key=lambda f: (-f["confidence"], f["line"]))
+    return summarize(findings)
+
+
+def predict_defect_batch(items: list[tuple[str, str]], max_batch: int = DEFECT_MAX_BATCH) -> list[dict]:
     """
-    Returns: dict(issue_type, span_lines, confidence)
+    predict_defect() for several (code, lang) pairs in one go: the model
+    windows of all files are pooled into shared padded batches of up to
+    `max_batch`, so concurrent callers (the model server's /predict) cost
+    one forward pass per batch rather than one per request.
     """
+    codes = [code for code, _ in items]
+    with memory.using("predictor"):
+        _ensure_loaded()
+        model_findings = _model_findings_many(codes, max_batch) if _model is not None and _tok is not None else [[] for _ in codes]
 
-# If trained span model exists:
-    if _model and _tok:
-        # ----------------------------------------------------------------------
-        # TEMPORARY FIX: COMMENT OUT THIS ENTIRE AI PREDICTION BLOCK (start)
-        # The AI model is loaded but UNTRAINED, giving junk results.
-        # We must skip it to use the reliable heuristic below.
-        # enc = _tok(code, truncation=True, max_length=1024, return_tensors="pt")
-        # with torch.no_grad():
-        #     out = _model(**{k: v.to(_DEVICE) for k, v in enc.items()}).logits[0]
-        # # simple: if any non-zero tag predicted → bug exists
-        # labels = out.argmax(-1).cpu().tolist()
-        # has_bug = any(x != 0 for x in labels)
-        # # crude mapping to lines:
-        # span_lines = "?"
-        # if has_bug:
-        #     span_lines = "suspected"  # you can add token→line mapping later
-        # return {
-        #     "issue_type": "Suspected_Defect" if has_bug else "No_Defect",
-        #     "span_lines": span_lines,
-        #     "confidence": 0.65 if has_bug else 0.3,
-        # }
-        # TEMPORARY FIX: COMMENT OUT THIS ENTIRE AI PREDICTION BLOCK (end)
-        pass # Explicitly fall through to the heuristic.
-
-    # --------- heuristic fallback (works now, replace later) ----------
-    issue = "Possible_Bug"
-    conf = 0.5
-    lines = code.splitlines()
-    # common Python runtime mistakes
-    for i, L in enumerate(lines, 1):
-        if "IndexError" in L or "]" in L and "[" in L and ".append(" not in L and ".extend(" not in L:
-            issue = "IndexError_or_Bounds"
-            conf = 0.8
-            return {"issue_type": issue, "span_lines": f"{i}-{i}", "confidence": conf}
-        if ".strip(" in L and "None" in code:
-            issue = "NoneType_Attribute"
-            conf = 0.7
-            return {"issue_type": issue, "span_lines": f"{i}-{i}", "confidence": conf}
-    return {"issue_type": issue, "span_lines": "?", "confidence": conf}
+    out = []
+    for (code, lang), found in zip(items, model_findings):
+        findings = found + rule_findings(code, lang)
+        findings.sort(key=lambda f: (-f["confidence"], f["line"]))
+        out.append(summarize(findings))
+    return out
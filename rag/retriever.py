@@ -1,16 +1,26 @@
 # rag/retriever.py
-import os, json, numpy as np, torch
+import os, json
 import threading
-from transformers import AutoTokenizer, AutoModel
 from config import EMB_MODEL_DIR, FAISS_INDEX, FAISS_IDS, KB_JSONL
+from rag import memory, model_client, telemetry
 
-# Try FAISS; keep working if it's missing
-_FAISS_OK = False
-try:
-    import faiss  # type: ignore
-    _FAISS_OK = True
-except Exception as e:
-    print("[retriever] FAISS unavailable, will use NumPy cosine:", e)
+# numpy, torch, transformers and FAISS are imported on first use, so
+# fast mode (which never retrieves) starts without them.
+_faiss = None
+_faiss_checked = False
+
+
+def _faiss_module():
+    """Imports FAISS once; None when it is missing (NumPy cosine is used)."""
+    global _faiss, _faiss_checked
+    if not _faiss_checked:
+        try:
+            import faiss  # type: ignore
+            _faiss = faiss
+        except Exception as e:
+            print("[retriever] FAISS unavailable, will use NumPy cosine:", e)
+        _faiss_checked = True
+    return _faiss
 
 _tok = None
 _enc = None
@@ -32,12 +42,25 @@ def _ensure_embedder():
     with _embed_lock:
         if _tok is not None and _enc is not None:
             return
+        from transformers import AutoTokenizer, AutoModel
+
         _tok = AutoTokenizer.from_pretrained(
             EMB_MODEL_DIR,
             use_fast=True,
             clean_up_tokenization_spaces=False,
         )
         _enc = AutoModel.from_pretrained(EMB_MODEL_DIR).eval()
+    memory.loaded("embedder", memory.module_size_mb(_enc))
+
+
+def _unload_embedder():
+    global _tok, _enc
+    with _embed_lock:
+        _tok = None
+        _enc = None
+
+
+memory.register("embedder", _unload_embedder)
 
 
 def _ensure_kb_loaded():
@@ -57,7 +80,8 @@ def _ensure_kb_loaded():
 
 def _ensure_faiss_loaded():
     global _faiss_index, _faiss_ids
-    if not _FAISS_OK:
+    faiss = _faiss_module()
+    if faiss is None:
         return
     if _faiss_index is not None and _faiss_ids is not None:
         return
@@ -67,11 +91,19 @@ def _ensure_faiss_loaded():
         _faiss_index = faiss.read_index(FAISS_INDEX)
         _faiss_ids = open(FAISS_IDS, "r", encoding="utf-8").read().splitlines()
 
+@telemetry.timed("embed")
 def _embed(texts, max_len=256):
     if isinstance(texts, str):
         texts = [texts]
-    _ensure_embedder()
-    with torch.inference_mode():
+    if model_client.enabled():
+        return model_client.embed(texts, max_len)
+    return _embed_local(texts, max_len)
+
+def _embed_local(texts, max_len=256):
+    import torch
+
+    with memory.using("embedder"), torch.inference_mode():
+        _ensure_embedder()
         t = _tok(texts, padding=True, truncation=True, max_length=max_len, return_tensors="pt")
         v = _enc(**t).last_hidden_state.mean(1)
         v = torch.nn.functional.normalize(v, p=2, dim=1)
@@ -82,24 +114,29 @@ def _retrieve_faiss(query_vec, topk):
     print("[retriever] Using FAISS index")
     _ensure_faiss_loaded()
     _ensure_kb_loaded()
-    D, I = _faiss_index.search(query_vec, topk)
+    with telemetry.span("index_search"):
+        D, I = _faiss_index.search(query_vec, topk)
+    with telemetry.span("kb_lookup"):
+        return _faiss_hits(I[0], D[0])
+
 
+def _faiss_hits(positions, scores):
     hits, out_ids = [], []
-    for pos in I[0]:
+    for pos, score in zip(positions, scores):
         if pos < 0 or _faiss_ids is None or pos >= len(_faiss_ids):
             continue
         hit_id = _faiss_ids[pos]
 
         # 1) exact id match
         if _kb_by_id is not None and hit_id in _kb_by_id:
-            hits.append(_kb_by_id[hit_id]); out_ids.append(hit_id); continue
+            hits.append(dict(_kb_by_id[hit_id], score=float(score))); out_ids.append(hit_id); continue
 
         # 2) fallback: treat id like a numeric row index
         try:
             idx_int = int(hit_id)
             if _kb_rows is not None and 0 <= idx_int < len(_kb_rows):
                 row = _kb_rows[idx_int]
-                hits.append(row); out_ids.append(row.get("id", str(idx_int))); continue
+                hits.append(dict(row, score=float(score))); out_ids.append(row.get("id", str(idx_int))); continue
         except ValueError:
             pass
 
@@ -123,21 +160,26 @@ def _ensure_kb_embedded():
 def _retrieve_numpy_cosine(query_vec, topk):
     print("[retriever] Using NumPy cosine fallback")
     _ensure_kb_embedded()
-    q = query_vec[0]
-    sims = _KB_EMB @ q  # cosine (embeddings are normalized)
-    k = min(topk, len(sims))
-    top_idx = np.argpartition(-sims, k-1)[:k]
-    top_idx = top_idx[np.argsort(-sims[top_idx])]
-    hits = [_KB_ROWS[i] for i in top_idx]
-    ids  = [h.get("id", str(i)) for i, h in zip(top_idx, hits)]
+    import numpy as np
+
+    with telemetry.span("index_search"):
+        q = query_vec[0]
+        sims = _KB_EMB @ q  # cosine (embeddings are normalized)
+        k = min(topk, len(sims))
+        top_idx = np.argpartition(-sims, k-1)[:k]
+        top_idx = top_idx[np.argsort(-sims[top_idx])]
+    with telemetry.span("kb_lookup"):
+        hits = [dict(_KB_ROWS[i], score=float(sims[i])) for i in top_idx]
+        ids  = [h.get("id", str(i)) for i, h in zip(top_idx, hits)]
     return hits, ids
 
 # ---------- Public API ----------
 def retrieve(query: str, topk: int = 5):
     qv = _embed(query)
-    if _FAISS_OK and os.path.exists(FAISS_INDEX) and os.path.exists(FAISS_IDS):
+    if os.path.exists(FAISS_INDEX) and os.path.exists(FAISS_IDS) and _faiss_module() is not None:
         try:
             return _retrieve_faiss(qv, topk)
         except Exception as e:
             print("[retriever] FAISS failed, falling back to NumPy:", e)
+            telemetry.count("fallbacks_total", stage="retrieve", failed="faiss")
     return _retrieve_numpy_cosine(qv, topk)
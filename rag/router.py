@@ -0,0 +1,227 @@
+"""Latency-aware routing across fix-generation backends.
+
+Each backend (remote API, local Qwen, heuristic rules) is a Backend with a
+priority, a weight, a concurrency limit and live state: health, an EWMA of
+its latency and the number of requests currently in flight.
+
+Per request, LLMRouter.pick() estimates every usable backend's latency
+(EWMA scaled by queue depth) and keeps those within the SLO. Among these
+the best priority wins, ties going to the lowest estimate / weight. When no
+backend fits the SLO the fastest usable one is tried first. A backend that
+raises or returns nothing is marked unhealthy for a cooldown that doubles
+with each consecutive failure, and the request fails over to the next
+candidate. A backend demoted for being slow gets its configured
+expected_ms back after reprobe_s without traffic, so it is tried again.
+
+Backends and policy come from a JSON file (config.LLM_BACKENDS_FILE):
+
+    {"slo_ms": 60000, "ewma_alpha": 0.2, "cooldown_s": 30,
+     "backends": [{"name": "remote", "priority": 1, "weight": 1.0,
+                   "expected_ms": 4000, "concurrency": 8, "max_queue": 32}, ...]}
+
+Public API:
+- Backend, LLMRouter, load_router_config(path)
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from rag import telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG: dict[str, Any] = {
+    "slo_ms": 60000,
+    "ewma_alpha": 0.2,
+    "cooldown_s": 30,
+    "max_cooldown_s": 600,
+    "reprobe_s": 300,
+    "backends": [
+        {"name": "remote", "priority": 1, "weight": 1.0, "expected_ms": 4000, "concurrency": 8, "max_queue": 32},
+        {"name": "local", "priority": 2, "weight": 1.0, "expected_ms": 20000, "concurrency": 8, "max_queue": 16},
+        {"name": "heuristic", "priority": 3, "weight": 1.0, "expected_ms": 5, "concurrency": 64, "max_queue": 0},
+    ],
+}
+
+
+def load_router_config(path: str | None) -> dict[str, Any]:
+    """Reads the backend config file, falling back to DEFAULT_CONFIG."""
+    cfg = dict(DEFAULT_CONFIG)
+    if not path:
+        return cfg
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cfg.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"[router] ignoring {path}: {e}")
+    return cfg
+
+
+@dataclass
+class Backend:
+    name: str
+    call: Callable[..., dict | None]
+    available: Callable[[], bool] = lambda: True
+    priority: int = 1
+    weight: float = 1.0
+    expected_ms: float = 1000.0
+    concurrency: int = 1
+    max_queue: int = 0  # 0 = unbounded
+
+    ewma_ms: float = field(default=0.0, init=False)
+    inflight: int = field(default=0, init=False)
+    failures: int = field(default=0, init=False)
+    down_until: float = field(default=0.0, init=False)
+    served: int = field(default=0, init=False)
+    errors: int = field(default=0, init=False)
+    last_used: float = field(default=0.0, init=False)
+
+    def __post_init__(self):
+        self.ewma_ms = float(self.expected_ms)
+        self.last_used = time.monotonic()
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def estimate_ms(self) -> float:
+        # Requests beyond the concurrency limit wait for a full turn each.
+        waves = 1 + self.inflight // max(1, self.concurrency)
+        return self.ewma_ms * waves
+
+
+class LLMRouter:
+    def __init__(
+        self,
+        backends: list[Backend],
+        slo_ms: float = 60000,
+        ewma_alpha: float = 0.2,
+        cooldown_s: float = 30,
+        max_cooldown_s: float = 600,
+        reprobe_s: float = 300,
+    ):
+        self.backends = backends
+        self.slo_ms = slo_ms
+        self.alpha = ewma_alpha
+        self.cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+        self.reprobe_s = reprobe_s
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict[str, Any], adapters: dict[str, tuple[Callable, Callable]]) -> "LLMRouter":
+        """Builds the router; `adapters` maps backend name -> (call, available)."""
+        backends = []
+        for spec in cfg.get("backends", []):
+            name = spec.get("name")
+            if not spec.get("enabled", True):
+                continue
+            if name not in adapters:
+                logger.warning(f"[router] unknown backend '{name}' in config, skipped")
+                continue
+            call, available = adapters[name]
+            backends.append(
+                Backend(
+                    name=name,
+                    call=call,
+                    available=available,
+                    priority=int(spec.get("priority", 1)),
+                    weight=float(spec.get("weight", 1.0)) or 1.0,
+                    expected_ms=float(spec.get("expected_ms", 1000)),
+                    concurrency=int(spec.get("concurrency", 1)),
+                    max_queue=int(spec.get("max_queue", 0)),
+                )
+            )
+        return cls(
+            backends,
+            slo_ms=float(cfg.get("slo_ms", 60000)),
+            ewma_alpha=float(cfg.get("ewma_alpha", 0.2)),
+            cooldown_s=float(cfg.get("cooldown_s", 30)),
+            max_cooldown_s=float(cfg.get("max_cooldown_s", 600)),
+            reprobe_s=float(cfg.get("reprobe_s", 300)),
+        )
+
+    @staticmethod
+    def _available(b: Backend) -> bool:
+        try:
+            return bool(b.available())
+        except Exception:
+            return False
+
+    def pick(self) -> list[Backend]:
+        """Backends to try for one request, best first."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for b in self.backends:
+                if b.inflight == 0 and now - b.last_used > self.reprobe_s:
+                    b.ewma_ms = min(b.ewma_ms, float(b.expected_ms))
+                if b.healthy and not (b.max_queue and b.inflight >= b.max_queue):
+                    candidates.append((b, b.estimate_ms()))
+        # available() may touch the network or disk; keep it outside the lock.
+        usable = [(b, est) for b, est in candidates if self._available(b)]
+        within = [(b, est) for b, est in usable if est <= self.slo_ms]
+        over = [(b, est) for b, est in usable if est > self.slo_ms]
+        within.sort(key=lambda x: (x[0].priority, x[1] / x[0].weight))
+        over.sort(key=lambda x: x[1] / x[0].weight)
+        return [b for b, _ in within + over]
+
+    def _finish(self, b: Backend, ms: float, ok: bool) -> None:
+        with self._lock:
+            b.inflight -= 1
+            b.last_used = time.monotonic()
+            if ok:
+                b.ewma_ms = self.alpha * ms + (1 - self.alpha) * b.ewma_ms
+                b.failures = 0
+                b.served += 1
+            else:
+                b.failures += 1
+                b.errors += 1
+                cooldown = min(self.cooldown_s * 2 ** (b.failures - 1), self.max_cooldown_s)
+                b.down_until = time.monotonic() + cooldown
+
+    def generate(self, *args, **kwargs) -> dict:
+        attempts = []
+        for b in self.pick():
+            with self._lock:
+                b.inflight += 1
+                estimate = b.estimate_ms()
+            t0 = time.perf_counter()
+            try:
+                result = b.call(*args, **kwargs)
+                error = None if result else "empty result"
+            except Exception as e:
+                result, error = None, f"{type(e).__name__}: {e}"
+            ms = (time.perf_counter() - t0) * 1000
+            self._finish(b, ms, error is None)
+            attempts.append({"backend": b.name, "ms": round(ms, 1), "estimate_ms": round(estimate, 1), "error": error})
+            if error is None:
+                result["_backend"] = {"name": b.name, "attempts": attempts}
+                return result
+            logger.warning(f"[router] {b.name} failed ({error}); failing over")
+            telemetry.count("fallbacks_total", stage="llm", failed=b.name)
+        tried = ", ".join(f"{a['backend']}: {a['error']}" for a in attempts) or "no backend available"
+        raise RuntimeError(f"All LLM backends failed ({tried})")
+
+    def stats(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "name": b.name,
+                    "priority": b.priority,
+                    "healthy": b.healthy,
+                    "ewma_ms": round(b.ewma_ms, 1),
+                    "inflight": b.inflight,
+                    "served": b.served,
+                    "errors": b.errors,
+                }
+                for b in self.backends
+            ]
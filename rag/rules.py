@@ -0,0 +1,365 @@
+"""Rule engine behind the heuristic fallback fixer.
+
+The old fixer chained four patch functions that each re-split the code,
+recompiled their regexes and rescanned the whole text, even when the code
+could not possibly match. Here the code is wrapped once in a Source: its
+lines plus an index of trigger tokens ("<=", "range(", "[3]", "while", ...)
+and the lines they occur on, built lazily and shared by every rule. Rules
+are registered per language with precompiled patterns and a gate over that
+index. A rule whose tokens are absent costs a cached substring check; a
+rule that does run only visits the lines its tokens were found on.
+
+Rules run in registration order and the first one that changes the code
+wins, which keeps the output identical to the old chain
+(bench_rules.py checks this on the Sample files corpus).
+
+Public API:
+- register(group, name, gate, certainty, langs=None, fixes=())  — decorator for rule functions
+- apply_rules(issue, code, lang=None) -> (patched_code, explanation)
+- best_fix(issue, code, lang=None) -> (patched_code, explanation, rule | None)
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable
+
+# Tokens the gates test for. Presence is a substring check, as in the old
+# chain ("for" also matches "format"); the gates only need to be necessary
+# conditions, the rules themselves still match precisely.
+_PRESENCE = {
+    "le": "<=",
+    "for": "for",
+    "while": "while",
+    "ret": "return",
+    "div": "/",
+    "len": "len(",
+    "range": "range(",
+    "minus_i": "- i)",
+    "swap": "arr[j",
+}
+_DIV_RE = re.compile(r"return\s+([^\n#/]+?)\s*/\s*([A-Za-z_]\w*)(?:[ \t]*(#[^\n]*))?\s*$", re.MULTILINE)
+_RANGE_MINUS_I_RE = re.compile(r"range\(([a-zA-Z0-9_]+)\s*-\s*i\)")
+_INDEX_RE = re.compile(r"\[( *)(\d+)( *)\]")
+_WHILE_LEN_RE = re.compile(r"^(\s*)while\s+([A-Za-z_]\w*)\s*<\s*len\([^\)]*\)\s*:\s*$")
+_SWAP_LINE = "arr[j], arr[j + 1] = arr[j + 1], arr[j]  # fixed swap"
+
+
+class Source:
+    """Code indexed once, on demand: its lines and the lines each token occurs on."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._has: dict[str, bool] = {}
+        self._lines: list[str] | None = None
+        self._rows: dict[str, list[int]] = {}
+        self._starts: list[int] | None = None
+
+    @property
+    def lines(self) -> list[str]:
+        if self._lines is None:
+            self._lines = self.text.splitlines()
+        return self._lines
+
+    def has(self, kind: str) -> bool:
+        found = self._has.get(kind)
+        if found is None:
+            if kind == "index":
+                found = _INDEX_RE.search(self.text) is not None
+            else:
+                found = _PRESENCE[kind] in self.text
+            self._has[kind] = found
+        return found
+
+    def rows(self, kind: str) -> list[int]:
+        """Line numbers (0-based, ascending) on which `kind` occurs."""
+        found = self._rows.get(kind)
+        if found is None:
+            found = self._rows[kind] = self._find_rows(kind) if self.has(kind) else []
+        return found
+
+    def _find_rows(self, kind: str) -> list[int]:
+        text = self.text
+        if kind == "index":
+            offsets = [m.start() for m in _INDEX_RE.finditer(text)]
+        else:
+            needle = _PRESENCE[kind]
+            offsets, at = [], text.find(needle)
+            while at >= 0:
+                offsets.append(at)
+                at = text.find(needle, at + len(needle))
+        if self._starts is None:
+            # Empty unless splitlines() found breaks other than \n and \r\n
+            # (lone \r, form feed, ...); then offsets are mapped through the
+            # line starts instead of counting newlines.
+            self._starts = []
+            if len(self.lines) != text.count("\n") + (not text.endswith("\n") and text != ""):
+                pos = 0
+                for line in text.splitlines(keepends=True):
+                    self._starts.append(pos)
+                    pos += len(line)
+        rows: list[int] = []
+        row, prev = 0, 0
+        for at in offsets:
+            if self._starts:
+                row = bisect_right(self._starts, at) - 1
+            else:
+                row += text.count("\n", prev, at)
+                prev = at
+            if not rows or rows[-1] != row:
+                rows.append(row)
+        return rows
+
+    def swap_rows(self) -> list[int]:
+        """Rows holding both arr[j] and arr[j + 1]."""
+        lines = self.lines
+        return [r for r in self.rows("swap") if "arr[j]" in lines[r] and "arr[j + 1]" in lines[r]]
+
+
+@dataclass(frozen=True)
+class Rule:
+    group: str
+    name: str
+    gate: Callable[[Source], bool]
+    fn: Callable[[Source], "str | None"]
+    # How likely the rewrite is a correct, complete fix when the rule fires
+    # (0..1). The analysis router skips the LLM only above a threshold.
+    certainty: float
+    # Detector rules (rag/detector.py) whose finding this rule is a fix for.
+    # The router only trusts the rule for those findings.
+    fixes: tuple[str, ...] = ()
+
+
+_RULES: dict[str, list[Rule]] = defaultdict(list)
+# (lang, action) -> rules to try, in order; rebuilt when a rule is registered.
+_plans: dict[tuple[str | None, str], tuple[Rule, ...]] = {}
+
+
+def register(
+    group: str,
+    name: str,
+    gate: Callable[[Source], bool],
+    certainty: float,
+    langs: tuple[str, ...] | None = None,
+    fixes: tuple[str, ...] = (),
+):
+    """Registers a rule returning the patched text, or None when it does not apply."""
+
+    def deco(fn):
+        rule = Rule(group, name, gate, fn, certainty, fixes)
+        for lang in langs or ("*",):
+            _RULES[lang].append(rule)
+        _plans.clear()
+        return fn
+
+    return deco
+
+
+def rules_for(lang: str | None) -> list[Rule]:
+    if not lang or lang not in _RULES:
+        return _RULES["*"]
+    return _RULES["*"] + _RULES[lang]
+
+
+# ---------- division ----------
+# The pattern is multi-line on purpose: "\s*$" swallows trailing blank lines,
+# so it stays a text-level substitution, run only when both tokens exist.
+@register("division", "division_guard", lambda s: s.has("ret") and s.has("div"), certainty=0.9, fixes=("unchecked_divisor",))
+def _division_guard(src: Source) -> str | None:
+    # A trailing comment on the line is kept after the guard.
+    updated = _DIV_RE.sub(lambda m: f"return {m[1]} / {m[2]} if {m[2]} != 0 else 0" + (f"  {m[3]}" if m[3] else ""), src.text)
+    return updated if updated != src.text else None
+
+
+# ---------- bounds ----------
+# Rewrites every "<=" in the file, loop or not, so it is the least certain.
+@register(
+    "bounds", "loop_le", lambda s: s.has("le") and (s.has("for") or s.has("while")), certainty=0.5, fixes=("loop_le", "le_length")
+)
+def _loop_le(src: Source) -> str | None:
+    return src.text.replace("<=", "<")
+
+
+@register("bounds", "range_minus_i", lambda s: s.has("range") and s.has("minus_i"), certainty=0.8)
+def _range_minus_i(src: Source) -> str | None:
+    lines = list(src.lines)
+    changed = False
+    for i in sorted(set(src.rows("range")) & set(src.rows("minus_i"))):
+        new = _RANGE_MINUS_I_RE.sub(lambda m: f"range({m[1]} - i - 1)", lines[i])
+        if new != lines[i]:
+            lines[i] = new
+            changed = True
+    return "\n".join(lines) if changed else None
+
+
+def _swap_start(src: Source) -> int:
+    pairs = src.swap_rows()
+    rows = set(pairs)
+    for r in pairs:
+        if r + 1 in rows and "=" in src.lines[r] and "=" in src.lines[r + 1]:
+            return r
+    return -1
+
+
+@register("bounds", "swap_merge", lambda s: s.has("swap") and _swap_start(s) >= 0, certainty=0.8)
+def _swap_merge(src: Source) -> str | None:
+    lines = list(src.lines)
+    i = _swap_start(src)
+    changed = False
+    # Merging can make the merged line pair up with the next one, so walk
+    # the list from the first pair exactly like a forward scan would.
+    while i < len(lines) - 1:
+        a, b = lines[i], lines[i + 1]
+        if "arr[j]" in a and "arr[j + 1]" in a and "=" in a and "arr[j + 1]" in b and "arr[j]" in b and "=" in b:
+            indent = len(a) - len(a.lstrip())
+            lines[i] = " " * indent + _SWAP_LINE
+            lines.pop(i + 1)
+            changed = True
+            continue
+        i += 1
+    return "\n".join(lines) if changed else None
+
+
+def _adjust_index(line: str) -> str | None:
+    m = _INDEX_RE.search(line)
+    old_idx = int(m.group(2))
+    if old_idx == 0:
+        return None
+    old_bracket = f"[{m.group(1)}{old_idx}{m.group(3)}]"
+    return line.replace(old_bracket, f"[{old_idx - 1}]", 1) + "  # fixed off-by-one"
+
+
+# Lowers every nonzero literal index whatever the container holds
+# (rows[i][1] -> rows[i][0]), so it never skips the LLM on its own.
+@register("bounds", "direct_index", lambda s: s.has("index"), certainty=0.4)
+def _direct_index(src: Source) -> str | None:
+    lines = list(src.lines)
+    changed = False
+    for i in src.rows("index"):
+        new = _adjust_index(lines[i])
+        if new is not None:
+            lines[i] = new
+            changed = True
+    return "\n".join(lines) if changed else None
+
+
+# ---------- iteration ----------
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip(" "))
+
+
+@register(
+    "iteration", "missing_increment", lambda s: s.has("while") and s.has("len"), certainty=0.9, fixes=("missing_increment",)
+)
+def _missing_increment(src: Source) -> str | None:
+    lines = list(src.lines)
+    changed = False
+    resume = 0
+    inserted = 0
+    for row in src.rows("while"):
+        i = row + inserted
+        if i < resume:
+            continue
+        m = _WHILE_LEN_RE.match(lines[i])
+        if not m:
+            continue
+        base = len(m.group(1))
+        var = m.group(2)
+        start = end = i + 1
+        while end < len(lines) and not (lines[end].strip() and _indent(lines[end]) <= base):
+            end += 1
+        inc = re.compile(rf"^\s*{re.escape(var)}\s*(\+=|=)\s*")
+        if start >= end or any(inc.search(lines[k]) for k in range(start, end)):
+            resume = end
+            continue
+        body = next((_indent(lines[k]) for k in range(start, end) if lines[k].strip()), base + 4)
+        lines.insert(end, f"{' ' * body}{var} += 1  # auto-fix: avoid infinite loop")
+        inserted += 1
+        changed = True
+        resume = end + 1
+    return "\n".join(lines) if changed else None
+
+
+# ---------- driver ----------
+_ACTIONS = {
+    # action: groups allowed to run
+    "division": ("division",),
+    "bounds": ("bounds", "iteration"),
+    "null": (),
+    "auto": ("division", "bounds", "iteration"),
+}
+
+_EXPLANATIONS = {
+    ("division", "division"): "Added a division-by-zero guard in return expressions.",
+    ("division", "auto"): "Detected unsafe division and added a zero-check guard.",
+    ("bounds", "bounds"): "Applied safe bounds checking for array access and loop conditions.",
+    ("bounds", "auto"): "Detected potential array bounds issue and applied defensive fix.",
+    ("iteration", "bounds"): "Added missing loop counter increment to prevent infinite loops.",
+    ("iteration", "auto"): "Detected missing loop counter update and added an increment step.",
+}
+
+
+def detect_action(issue: str) -> tuple[str, str]:
+    text = issue or ""
+    if "ZeroDivision" in text:
+        return "division", "Added a division-by-zero guard in return expressions."
+    if "Index" in text or "Bounds" in text:
+        return "bounds", "Adjusted loop bounds to avoid out-of-range indexing."
+    if "None" in text or "Null" in text:
+        return "null", "Potential null/None dereference detected. Add guards before attribute or method access."
+    return "auto", "Applied safe fallback optimization and retained original logic."
+
+
+def tidy(code: str) -> str:
+    """Expands tabs and trims trailing spaces, keeping a final newline."""
+    out = "\n".join(line.rstrip() for line in code.replace("\t", "    ").splitlines())
+    if code.endswith("\n"):
+        out += "\n"
+    return out
+
+
+def _plan(lang: str | None, action: str) -> tuple[Rule, ...]:
+    key = (lang, action)
+    plan = _plans.get(key)
+    if plan is None:
+        groups = _ACTIONS.get(action, ())
+        plan = _plans[key] = tuple(r for r in rules_for(lang) if r.group in groups)
+    return plan
+
+
+def run_rules(action: str, code: str, lang: str | None = None) -> tuple[str, Rule] | None:
+    """Returns (patched, rule) for the first rule that changes the code."""
+    plan = _plan(lang, action)
+    if not plan:
+        return None
+    src = Source(code)
+    for rule in plan:
+        if rule.gate(src):
+            patched = rule.fn(src)
+            if patched is not None:
+                return patched, rule
+    return None
+
+
+def best_fix(issue: str, code: str, lang: str | None = None) -> tuple[str, str, Rule | None]:
+    """Like apply_rules, also returning the rule that fired (None for cleanup only)."""
+    action, explanation = detect_action(issue)
+    hit = run_rules(action, code, lang)
+    if hit is not None:
+        patched, rule = hit
+        return tidy(patched), _EXPLANATIONS.get((rule.group, action), explanation), rule
+
+    patched = tidy(code)
+    if patched != code:
+        return patched, "Applied safe code cleanup for readability and execution stability.", None
+    if "Index" in (issue or "") or "Bounds" in (issue or "") or "ZeroDivision" in (issue or ""):
+        return patched, "Potential defect detected. Ensure bounds checks are in place before array access and arithmetic operations.", None
+    return patched, explanation, None
+
+
+def apply_rules(issue: str, code: str, lang: str | None = None) -> tuple[str, str]:
+    patched, explanation, _ = best_fix(issue, code, lang)
+    return patched, explanation
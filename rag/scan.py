@@ -0,0 +1,310 @@
+"""Repository scanner: runs the analysis pipeline over a directory tree.
+
+    python -m rag.scan PATH [PATH ...] [-j WORKERS] [-o findings.jsonl]
+                       [--since REV [--changed-hunks]] [--no-cache | --cache FILE]
+
+Walks the given files/directories for sources with an extension in
+config.ALLOWED_EXTS (the set /analyze accepts), skipping hidden directories
+and config.SCAN_SKIP_DIRS, and fans the files out over a process pool with
+one worker per CPU core (config.SCAN_WORKERS or -j to override; -j 1 runs
+in-process). Each worker imports the pipeline and starts the model warmup
+once, in its initializer, so models are loaded once per worker rather than
+once per file. With MODEL_SERVER_URL set the workers share the model server
+instead of each holding its own copy of the models.
+
+Every file produces one JSON line as soon as it finishes (stdout, or -o);
+pipeline logging goes to stderr so stdout stays valid JSONL. A summary is
+printed to stderr at the end.
+
+Rescans are incremental (rag/incremental.py): finished records are cached in
+config.SCAN_CACHE_FILE by git blob sha and analysis version, so unchanged
+files are answered from the cache without touching a worker ("cached": true
+in their record). --since REV limits the scan to files changed since REV;
+--changed-hunks additionally drops findings outside the changed lines and
+skips the full analysis of files whose detector findings all fall outside
+them (status "clean").
+
+Public API:
+- iter_files(paths) -> Iterator[str]
+- scan(paths, workers=None, out=None, err=None, cache=None, since=None,
+       changed_hunks=False) -> dict   (the summary)
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Iterable, Iterator, TextIO
+
+from config import ALLOWED_EXTS, EXT_TO_LANG, MAX_CODE_LEN, SCAN_CACHE_FILE, SCAN_SKIP_DIRS, SCAN_WORKERS
+from rag.incremental import BlobHasher, ScanCache, changes_since
+
+Hunks = list[tuple[int, int]]
+
+
+def iter_files(paths: Iterable[str]) -> Iterator[str]:
+    """Source files under `paths`, in a stable (sorted) order."""
+    for root in paths:
+        if os.path.isfile(root):
+            if os.path.splitext(root)[1].lower() in ALLOWED_EXTS:
+                yield root
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in SCAN_SKIP_DIRS and not d.startswith("."))
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1].lower() in ALLOWED_EXTS:
+                    yield os.path.join(dirpath, name)
+
+
+def _init_worker() -> None:
+    # Worker stdout is the parent's stdout, which carries the JSONL stream.
+    sys.stdout = sys.stderr
+    from rag import warmup
+
+    warmup.start()
+
+
+def _lang(path: str) -> str:
+    return EXT_TO_LANG.get(os.path.splitext(path)[1].lower(), "python")
+
+
+def _span(finding: dict[str, Any]) -> tuple[int, int] | None:
+    first, _, last = str(finding.get("span_lines") or "").partition("-")
+    try:
+        return int(first), int(last or first)
+    except ValueError:
+        return None
+
+
+def _touches(finding: dict[str, Any], hunks: Hunks) -> bool:
+    span = _span(finding)
+    return span is not None and any(a <= span[1] and span[0] <= b for a, b in hunks)
+
+
+def _restrict(rec: dict[str, Any], hunks: Hunks | None) -> dict[str, Any]:
+    """`rec` with findings outside the changed lines dropped."""
+    if hunks is None or rec.get("status") != "ok":
+        return rec
+    return dict(rec, findings=[f for f in rec.get("findings") or [] if _touches(f, hunks)], changed_lines=hunks)
+
+
+def _scan_file(path: str, hunks: Hunks | None = None) -> dict[str, Any]:
+    """Analyzes one file; never raises, errors become records.
+
+    With `hunks`, the cheap detector runs first and the full analysis is
+    skipped when none of its findings touch the changed lines.
+    """
+    t0 = time.perf_counter()
+    lang = _lang(path)
+    rec: dict[str, Any] = {"path": path, "lang": lang}
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            code = f.read()
+    except OSError as e:
+        return dict(rec, status="error", error=f"{type(e).__name__}: {e}")
+    if not code.strip():
+        return dict(rec, status="skipped", reason="empty")
+    if len(code) > MAX_CODE_LEN:
+        return dict(rec, status="skipped", reason=f"larger than {MAX_CODE_LEN} chars")
+
+    try:
+        from rag.orchestrator import analyze
+
+        if hunks is not None:
+            from rag.predictor import predict_defect
+
+            with contextlib.redirect_stdout(sys.stderr):
+                pre = predict_defect(code, lang)
+            if not any(_touches(f, hunks) for f in pre.get("findings") or []):
+                return dict(rec, status="clean", findings=[], changed_lines=hunks,
+                            ms=round((time.perf_counter() - t0) * 1000, 1))
+        with contextlib.redirect_stdout(sys.stderr):
+            result, _passages, det, _query = analyze(code, path=path, lang=lang)
+    except Exception as e:
+        return dict(rec, status="error", error=f"{type(e).__name__}: {e}")
+    return dict(
+        rec,
+        status="ok",
+        issue_type=det.get("issue_type"),
+        span_lines=det.get("span_lines"),
+        confidence=det.get("confidence"),
+        findings=det.get("findings", []),
+        tier=(result.get("_routing") or {}).get("tier"),
+        root_cause=result.get("root_cause"),
+        fix_explanation=result.get("fix_explanation"),
+        fix_confidence=result.get("confidence"),
+        patch=result.get("unified_diff") or result.get("patch_unified_diff") or "",
+        ms=round((time.perf_counter() - t0) * 1000, 1),
+    )
+
+
+class _Summary:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.t0 = time.perf_counter()
+        self.status: Counter = Counter()
+        self.issues: Counter = Counter()
+        self.tiers: Counter = Counter()
+        self.findings = 0
+        self.cached = 0
+
+    def add(self, rec: dict[str, Any]) -> None:
+        self.status[rec["status"]] += 1
+        self.cached += bool(rec.get("cached"))
+        if rec["status"] == "ok":
+            self.issues[rec.get("issue_type") or "?"] += 1
+            self.tiers[rec.get("tier") or "?"] += 1
+            self.findings += len(rec.get("findings") or [])
+
+    def as_dict(self) -> dict[str, Any]:
+        wall = time.perf_counter() - self.t0
+        files = sum(self.status.values())
+        return {
+            "files": files,
+            "ok": self.status["ok"],
+            "skipped": self.status["skipped"],
+            "errors": self.status["error"],
+            "clean": self.status["clean"],
+            "cached": self.cached,
+            "findings": self.findings,
+            "by_issue": dict(self.issues.most_common()),
+            "by_tier": dict(self.tiers),
+            "workers": self.workers,
+            "wall_s": round(wall, 2),
+            "files_per_s": round(files / wall, 2) if wall > 0 else 0.0,
+        }
+
+
+def scan(
+    paths: Iterable[str],
+    workers: int | None = None,
+    out: TextIO | None = None,
+    err: TextIO | None = None,
+    cache: ScanCache | None = None,
+    since: str | None = None,
+    changed_hunks: bool = False,
+) -> dict:
+    """Scans `paths`, writing one JSON line per file to `out`; returns the summary."""
+    out = out or sys.stdout
+    err = err or sys.stderr
+    paths = list(paths)
+    workers = workers or SCAN_WORKERS or os.cpu_count() or 1
+    summary = _Summary(workers)
+
+    def emit(rec: dict[str, Any]) -> None:
+        summary.add(rec)
+        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        out.flush()
+
+    changed = changes_since(paths, since) if since else None
+    hasher = BlobHasher(paths) if cache is not None else None
+
+    def todo() -> Iterator[tuple[str, Hunks | None, str | None]]:
+        """Files that need a worker; cache hits are emitted on the way."""
+        for path in iter_files(paths):
+            hunks = None
+            if changed is not None:
+                real = os.path.realpath(path)
+                if real not in changed:
+                    continue
+                hunks = changed[real] if changed_hunks else None
+            sha = None
+            if cache is not None:
+                try:
+                    sha = hasher.sha(path)
+                except OSError:
+                    sha = None
+                hit = cache.get(sha, _lang(path)) if sha else None
+                if hit is not None:
+                    emit(_restrict(dict(hit, path=path, cached=True), hunks))
+                    continue
+            yield path, hunks, sha
+
+    def finish(rec: dict[str, Any], hunks: Hunks | None, sha: str | None) -> None:
+        if cache is not None and sha and rec["status"] == "ok":
+            cache.put(sha, rec["lang"], rec)
+        emit(_restrict(rec, hunks))
+
+    if workers == 1:
+        for path, hunks, sha in todo():
+            finish(_scan_file(path, hunks), hunks, sha)
+    else:
+        # spawn: the parent never loads models, and forking a process that
+        # has touched torch threads is unsafe.
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+            pending: dict = {}
+
+            def drain(block_until_below: int) -> None:
+                while len(pending) > block_until_below:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        path, hunks, sha = pending.pop(fut)
+                        try:
+                            finish(fut.result(), hunks, sha)
+                        except Exception as e:  # e.g. a worker died
+                            emit({"path": path, "status": "error", "error": f"{type(e).__name__}: {e}"})
+
+            # Bounded queue: a 10k-file tree does not sit in memory as futures.
+            for path, hunks, sha in todo():
+                pending[pool.submit(_scan_file, path, hunks)] = (path, hunks, sha)
+                drain(workers * 4)
+            drain(0)
+
+    result = summary.as_dict()
+    print(
+        f"[scan] {result['files']} files ({result['ok']} analyzed, {result['skipped']} skipped, "
+        f"{result['errors']} errors) in {result['wall_s']}s with {workers} workers, "
+        f"{result['files_per_s']} files/s; {result['findings']} findings",
+        file=err,
+    )
+    if cache is not None or since:
+        print(
+            f"[scan] {result['cached']} from cache, {result['clean']} clean"
+            + (f", changed since {since}: {len(changed)} files" if since else ""),
+            file=err,
+        )
+    for issue, n in result["by_issue"].items():
+        print(f"[scan]   {issue}: {n}", file=err)
+    return result
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m rag.scan", description="Scan a source tree for defects.")
+    ap.add_argument("paths", nargs="+", help="files or directories to scan")
+    ap.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per core)")
+    ap.add_argument("-o", "--output", help="write JSONL here instead of stdout")
+    ap.add_argument("--since", metavar="REV", help="only scan files changed since this git revision")
+    ap.add_argument("--changed-hunks", action="store_true", help="with --since, only report findings on changed lines")
+    ap.add_argument("--cache", default=SCAN_CACHE_FILE, help=f"result cache (default: {SCAN_CACHE_FILE})")
+    ap.add_argument("--no-cache", action="store_true", help="analyze every file, neither reading nor writing the cache")
+    args = ap.parse_args(argv)
+    if args.changed_hunks and not args.since:
+        ap.error("--changed-hunks needs --since")
+
+    cache = None if args.no_cache else ScanCache(args.cache)
+    kwargs = dict(workers=args.workers, cache=cache, since=args.since, changed_hunks=args.changed_hunks)
+    try:
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                summary = scan(args.paths, out=f, **kwargs)
+        else:
+            summary = scan(args.paths, **kwargs)
+    except RuntimeError as e:  # --since outside git, or git diff failed
+        print(f"[scan] {e}", file=sys.stderr)
+        return 2
+    finally:
+        if cache is not None:
+            cache.close()
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,406 @@
+"""Multi-language risky-API / pattern signatures on an Aho-Corasick automaton.
+
+Each language family has a dictionary of literal signatures: risky calls
+(gets, strcpy, free, delete, new, malloc, open, new FileReader, eval, ...),
+lock statements (synchronized, lock) and SQL keywords ("SELECT ", "DELETE
+FROM", ...). All of a family's literals are compiled once into one
+Aho-Corasick automaton, which finds every occurrence of every literal in a
+single left-to-right pass over the code, however many signatures there are.
+
+The pass runs over the raw code; rag.detector.mask() tells where each hit
+sits. API signatures only count in code, SQL keywords only inside string
+literals, never in comments. A hit then goes through its signature's check,
+which looks at the surrounding code and either drops it or confirms it,
+possibly moving the span:
+- free / delete: a later use of the pointer in the same block is
+  Use_After_Free, a second free / delete is Double_Free; reassigning it
+  first is fine.
+- new / malloc / calloc / .release(): Memory_Leak when the pointer it is
+  assigned to is never deleted / freed, returned or handed to a call.
+- new FileReader(...), open(...), ...: Resource_Leak unless the resource
+  is in try-with-resources / using / with, is closed, returned or handed
+  to a call.
+- synchronized / lock: Deadlock when two locks are nested in both orders.
+- SQL keywords: SQL_Injection when the string is concatenated or
+  interpolated (+, ., %, f-strings, ${...}, "$var", .format).
+
+Findings have the same shape as rag.detector's.
+
+Public API:
+- Automaton(patterns)               patterns: iterable of (literal, payload)
+    .finditer(text) -> Iterator[(start, end, payload)]
+- Signature(pattern, issue_type, rule, confidence, message, where, check)
+- SIGNATURES: dict[family, tuple[Signature, ...]]
+- scan(code, lang="python", masked=None) -> list[dict]   most confident first
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator
+
+from rag.detector import mask
+
+
+class Automaton:
+    """Aho-Corasick automaton over literal patterns."""
+
+    def __init__(self, patterns: Iterable[tuple[str, Any]]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._out: list[list[tuple[int, Any]]] = [[]]
+        for literal, payload in patterns:
+            state = 0
+            for ch in literal:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = self._goto[state][ch] = len(self._goto)
+                    self._goto.append({})
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((len(literal), payload))
+
+        # Failure links, breadth first; a state also reports the matches of
+        # its failure state (patterns that are suffixes of its path).
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0) if self._goto[f].get(ch, 0) != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def finditer(self, text: str) -> Iterator[tuple[int, int, Any]]:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, payload in out[state]:
+                yield i + 1 - length, i + 1, payload
+
+
+# ---------- context ----------
+
+# name = [(cast)] [receiver] <hit>, e.g. `int *p = (int *)malloc(`, `raw = p.release()`
+_TARGET_RE = re.compile(r"(?<![.>\w])([A-Za-z_]\w*)\s*=\s*(?:\([^()=]*\)\s*)?(?:[A-Za-z_][\w.]*)?$")
+_QUOTES = "\"'`"
+_STATEMENT_END = re.compile(r"[;\n]")
+
+
+class _Text:
+    """The code, its masked twin and a line index, shared by the checks."""
+
+    def __init__(self, code: str, masked: str, lang: str):
+        self.code = code
+        self.masked = masked
+        self.lang = lang
+        self.starts = [0] + [m.end() for m in re.finditer("\n", code)]
+        self.cache: dict[str, Any] = {}
+
+    def line(self, pos: int) -> int:
+        return bisect_right(self.starts, pos)
+
+    def line_start(self, pos: int) -> int:
+        return self.starts[self.line(pos) - 1]
+
+    def in_code(self, start: int, end: int) -> bool:
+        return self.masked[start:end] == self.code[start:end]
+
+    def string_bounds(self, pos: int) -> tuple[int, int] | None:
+        """(open quote, close quote) of the string literal around `pos`, if it is in one."""
+        if self.masked[pos] == self.code[pos]:
+            return None
+        left = pos - 1
+        while left >= 0 and self.masked[left].isspace():
+            left -= 1
+        if left < 0 or self.masked[left] not in _QUOTES:
+            return None  # a comment
+        right = self.masked.find(self.masked[left], pos)
+        return left, right if right != -1 else len(self.masked)
+
+    def block_end(self, pos: int) -> int:
+        """End of the innermost {...} block around `pos` (end of text without braces)."""
+        depth = 0
+        for i in range(pos, len(self.masked)):
+            ch = self.masked[i]
+            if ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth < 0:
+                    return i
+        return len(self.masked)
+
+    def target(self, start: int) -> str | None:
+        """The name the expression at `start` is assigned to, e.g. `p` in `int *p = malloc(...)`."""
+        m = _TARGET_RE.search(self.masked, self.line_start(start), start)
+        return m.group(1) if m else None
+
+    def statement_end(self, pos: int) -> int:
+        m = _STATEMENT_END.search(self.masked, pos)
+        return m.end() if m else len(self.masked)
+
+
+def _finding(sig: Signature, text: _Text, first: int, last: int | None = None, **override) -> dict:
+    last = last or first
+    f = {
+        "issue_type": sig.issue_type,
+        "rule": sig.rule,
+        "span_lines": f"{min(first, last)}-{max(first, last)}",
+        "line": last,
+        "confidence": sig.confidence,
+        "message": sig.message,
+    }
+    f.update(override)
+    return f
+
+
+def _escapes(text: _Text, name: str, lo: int, hi: int) -> bool:
+    """`name` is returned, stored or passed on between lo and hi."""
+    n = re.escape(name)
+    pattern = rf"\breturn\s+{n}\b|[(,]\s*&?\s*{n}\s*[,)]|=\s*{n}\s*[;,)\n]"
+    return re.search(pattern, text.masked[lo:hi]) is not None
+
+
+# ---------- checks: (signature, text, start, end) -> finding | None ----------
+
+_FREED_ARG = re.compile(r"\s*(?:\[\s*\]\s*)?\(?\s*([A-Za-z_]\w*)\s*\)?\s*[;)]")
+
+
+def _after_release(sig: Signature, text: _Text, start: int, end: int) -> dict | None:
+    m = _FREED_ARG.match(text.masked, end)
+    if not m:
+        return None
+    name = m.group(1)
+    lo, hi = text.statement_end(m.end() - 1), text.block_end(end)
+    first = text.line(start)
+    use = re.compile(rf"(?<![\w.>]){re.escape(name)}\b(\s*=(?!=))?")
+    for u in use.finditer(text.masked, lo, hi):
+        if u.group(1):  # reassigned (p = NULL, p = malloc(...)) before any use
+            return None
+        before = text.masked[text.line_start(u.start()) : u.start()]
+        if re.search(r"(?:\bfree\s*\(|\bdelete\s*(?:\[\s*\])?)\s*$", before):
+            return _finding(
+                sig, text, first, text.line(u.start()), issue_type="Double_Free", rule="double_free",
+                confidence=0.85, message=f"`{name}` is released again after line {first}",
+            )
+        if re.search(r"\bsizeof\s*\(\s*$", before):
+            continue
+        return _finding(
+            sig, text, first, text.line(u.start()),
+            message=f"`{name}` is used after it was released on line {first}",
+        )
+    return None
+
+
+def _owned_alloc(sig: Signature, text: _Text, start: int, end: int) -> dict | None:
+    name = text.target(start)
+    if name is None:
+        return None
+    lo, hi = text.statement_end(end), text.block_end(end)
+    n = re.escape(name)
+    released = rf"\bdelete\s*(?:\[\s*\])?\s*{n}\b|\bfree\s*\(\s*{n}\b|\b{n}\s*\.\s*reset\s*\("
+    if re.search(released, text.masked[lo:hi]) or _escapes(text, name, lo, hi):
+        return None
+    line = text.line(start)
+    return _finding(sig, text, line, message=f"`{name}` is allocated here and never released")
+
+
+def _unclosed(sig: Signature, text: _Text, start: int, end: int) -> dict | None:
+    head = text.masked[text.line_start(start) : start]
+    if re.match(r"\s*(?:try\s*\(|using\s*\(|using\s+var\b|with\b|async\s+with\b)", head):
+        return None
+    name = text.target(start)
+    if name is None:
+        return None
+    lo = text.statement_end(end)
+    hi = text.block_end(end) if text.lang != "python" else len(text.masked)
+    closed = rf"\b{re.escape(name)}\s*\.\s*(?:close|dispose|Dispose)\s*\(|\bwith\s+{re.escape(name)}\b"
+    if re.search(closed, text.masked[lo:hi]) or _escapes(text, name, lo, hi):
+        return None
+    return _finding(sig, text, text.line(start), message=f"`{name}` is opened here and never closed")
+
+
+_LOCK_ARG = re.compile(r"\s*\(\s*([\w.]+)\s*\)\s*\{")
+
+
+def _lock_pairs(text: _Text) -> dict[int, tuple[str, str, int]]:
+    """Inner lock site -> (outer lock, inner lock, outer line), for nested lock blocks."""
+    sites = []
+    for m in re.finditer(r"\b(?:synchronized|lock)\b", text.masked):
+        a = _LOCK_ARG.match(text.masked, m.end())
+        if a:
+            sites.append((m.start(), a.group(1), a.end() - 1))
+    nested = {}
+    for outer_at, outer, brace in sites:
+        close = text.block_end(brace + 1)
+        for inner_at, inner, _ in sites:
+            if brace < inner_at < close and inner != outer:
+                nested[inner_at] = (outer, inner, text.line(outer_at))
+    return nested
+
+
+def _lock_order(sig: Signature, text: _Text, start: int, end: int) -> dict | None:
+    if "locks" not in text.cache:
+        text.cache["locks"] = _lock_pairs(text)
+    nested = text.cache["locks"]
+    here = nested.get(start)
+    if here is None:
+        return None
+    outer, inner, _ = here
+    earlier = [(at, ln) for at, (o, i, ln) in nested.items() if (o, i) == (inner, outer) and at < start]
+    if not earlier:
+        return None
+    other = text.line(earlier[0][0])
+    return _finding(
+        sig, text, other, text.line(start),
+        message=f"locks {outer} and {inner} are taken in opposite orders here and on line {other}",
+    )
+
+
+_CONCAT_AFTER = re.compile(r"\s*(?:\+|\.(?![\w(])|%|\.format\s*\()")
+_CONCAT_BEFORE = re.compile(r"(?:\+|(?<![\w)\]])\.)\s*$")
+
+
+def _interpolated_sql(sig: Signature, text: _Text, start: int, end: int) -> dict | None:
+    bounds = text.string_bounds(start)
+    if bounds is None:
+        return None
+    left, right = bounds
+    body = text.code[left:right]
+    prefix = text.code[max(0, left - 2) : left].lower()
+    dynamic = (
+        "${" in body
+        or "#{" in body
+        or ("f" in prefix and "{" in body)
+        or (text.lang in ("php", "ruby") and text.code[left] == '"' and re.search(r"\$\w", body))
+        or _CONCAT_AFTER.match(text.masked, right + 1)
+        or _CONCAT_BEFORE.search(text.masked, text.line_start(left), left)
+    )
+    if not dynamic:
+        return None
+    return _finding(sig, text, text.line(start))
+
+
+def _format_string(sig: Signature, text: _Text, start: int, end: int) -> dict | None:
+    line_end = text.code.find("\n", end)
+    return _finding(sig, text, text.line(start)) if "%s" in text.code[end : line_end if line_end != -1 else None] else None
+
+
+# ---------- dictionaries ----------
+
+
+@dataclass(frozen=True)
+class Signature:
+    pattern: str
+    issue_type: str
+    rule: str
+    confidence: float
+    message: str
+    where: str = "code"  # "code" | "string"
+    check: Callable[..., dict | None] | None = None
+
+
+def _sql() -> tuple[Signature, ...]:
+    out = []
+    for kw in ("SELECT ", "INSERT INTO ", "UPDATE ", "DELETE FROM ", "REPLACE INTO "):
+        for variant in {kw, kw.lower()}:
+            out.append(Signature(variant, "SQL_Injection", "sql_concat", 0.8,
+                                 "SQL built from an interpolated or concatenated string", "string", _interpolated_sql))
+    return tuple(out)
+
+
+def _bounded(name: str, conf: float, why: str) -> Signature:
+    return Signature(name + "(", "Buffer_Overflow", f"unbounded_{name}", conf, f"{name}() {why}")
+
+
+_C = (
+    _bounded("gets", 0.9, "cannot limit the input to the buffer size"),
+    _bounded("strcpy", 0.7, "copies without checking the destination size"),
+    _bounded("strcat", 0.7, "appends without checking the destination size"),
+    _bounded("wcscpy", 0.7, "copies without checking the destination size"),
+    _bounded("sprintf", 0.6, "formats without checking the destination size"),
+    _bounded("vsprintf", 0.6, "formats without checking the destination size"),
+    Signature("scanf(", "Buffer_Overflow", "unbounded_scanf", 0.7, "%s without a width reads past the buffer",
+              check=_format_string),
+    Signature("free(", "Use_After_Free", "use_after_free", 0.8, "", check=_after_release),
+    Signature("malloc(", "Memory_Leak", "leaked_alloc", 0.55, "", check=_owned_alloc),
+    Signature("calloc(", "Memory_Leak", "leaked_alloc", 0.55, "", check=_owned_alloc),
+)
+_CPP = _C + (
+    Signature("delete", "Use_After_Free", "use_after_free", 0.8, "", check=_after_release),
+    Signature("new ", "Memory_Leak", "leaked_new", 0.6, "", check=_owned_alloc),
+    Signature(".release()", "Memory_Leak", "leaked_release", 0.65, "", check=_owned_alloc),
+)
+
+
+def _resources(*ctors: str, conf: float = 0.7) -> tuple[Signature, ...]:
+    return tuple(Signature(c, "Resource_Leak", "unclosed_resource", conf, "", check=_unclosed) for c in ctors)
+
+
+_JAVA = _resources(
+    "new FileReader(", "new FileWriter(", "new FileInputStream(", "new FileOutputStream(",
+    "new BufferedReader(", "new BufferedWriter(", "new Scanner(", "new Socket(", "new RandomAccessFile(",
+    ".getConnection(", ".prepareStatement(", ".createStatement(",
+) + (Signature("synchronized", "Deadlock", "lock_order", 0.75, "", check=_lock_order),)
+_CSHARP = _resources(
+    "new StreamReader(", "new StreamWriter(", "new FileStream(", "new SqlConnection(", "File.OpenRead(",
+) + (Signature("lock", "Deadlock", "lock_order", 0.75, "", check=_lock_order),)
+_PYTHON = _resources("open(", conf=0.6) + (
+    Signature("eval(", "Code_Injection", "eval_call", 0.6, "eval() runs arbitrary code"),
+    Signature("exec(", "Code_Injection", "eval_call", 0.6, "exec() runs arbitrary code"),
+)
+_JS = (Signature("eval(", "Code_Injection", "eval_call", 0.6, "eval() runs arbitrary code"),)
+_PHP = (Signature("eval(", "Code_Injection", "eval_call", 0.6, "eval() runs arbitrary code"),)
+
+SIGNATURES: dict[str, tuple[Signature, ...]] = {
+    "c": _C + _sql(),
+    "cpp": _CPP + _sql(),
+    "java": _JAVA + _sql(),
+    "csharp": _CSHARP + _sql(),
+    "python": _PYTHON + _sql(),
+    "javascript": _JS + _sql(),
+    "php": _PHP + _sql(),
+    "other": _sql(),
+}
+_FAMILY = {"typescript": "javascript", "rust": "other", "go": "other", "ruby": "other"}
+
+
+@lru_cache(maxsize=None)
+def _automaton(family: str) -> Automaton:
+    return Automaton((sig.pattern, sig) for sig in SIGNATURES[family])
+
+
+# ---------- public API ----------
+
+
+def scan(code: str, lang: str = "python", masked: str | None = None) -> list[dict]:
+    """Every confirmed signature hit in `code`, sorted by confidence (desc) then line."""
+    family = _FAMILY.get(lang, lang) if _FAMILY.get(lang, lang) in SIGNATURES else "other"
+    text = _Text(code, masked if masked is not None else mask(code, lang), lang)
+    found: dict[tuple[str, int], dict] = {}
+    for start, end, sig in _automaton(family).finditer(code):
+        if sig.pattern[0].isalpha() and start and (code[start - 1].isalnum() or code[start - 1] in "_$.>"):
+            continue  # part of a longer name (xfree, obj.free, p->free)
+        if sig.pattern[-1].isalpha() and end < len(code) and (code[end].isalnum() or code[end] == "_"):
+            continue  # delete / lock / synchronized as a prefix of a longer name
+        if sig.where == "code" and not text.in_code(start, end):
+            continue
+        if sig.where == "string" and text.string_bounds(start) is None:
+            continue
+        f = sig.check(sig, text, start, end) if sig.check else _finding(sig, text, text.line(start))
+        if f is None:
+            continue
+        key = (f["issue_type"], f["line"])
+        if key not in found or found[key]["confidence"] < f["confidence"]:
+            found[key] = f
+    return sorted(found.values(), key=lambda f: (-f["confidence"], f["line"]))
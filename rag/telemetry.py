@@ -0,0 +1,207 @@
+"""Per-stage timing and counters for the analysis pipeline.
+
+Each stage is wrapped in span(stage). The span records its wall time in a
+latency histogram and counts its exceptions. The stages are
+predict_defect, build_query, embed, index_search, kb_lookup, generate_fix,
+db_write and the whole analyze. Counters track cache hits and misses,
+fallbacks and stage timeouts. render() returns everything in the
+Prometheus text format; app.py serves it at /metrics.
+
+Recording a span or a counter increment only appends to a buffer, without
+a lock. Bucketing and label merging happen when the metrics are read, or
+every few thousand records. That keeps instrumentation well under 1% of
+even the cheapest detector-only request (bench_telemetry.py).
+METRICS_ENABLED=0 turns spans and counters into no-ops.
+
+Public API:
+- span(stage)                     — context manager around one stage
+- timed(stage)                    — decorator form of span()
+- count(name, n=1, **labels)      — increment a counter
+- observe(stage, seconds)         — record a duration measured elsewhere
+- render() -> str                 — Prometheus text exposition format 0.0.4
+- snapshot() -> dict
+- reset()
+"""
+
+from __future__ import annotations
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from config import METRICS_BUCKETS_S, METRICS_ENABLED
+
+STAGE_METRIC = "stage_duration_seconds"
+
+HELP = {
+    STAGE_METRIC: "Wall time of one pipeline stage.",
+    "stage_errors_total": "Pipeline stages that raised.",
+    "stage_timeouts_total": "Pipeline stages abandoned after their timeout.",
+    "cache_hits_total": "Lookups answered from a cache.",
+    "cache_misses_total": "Lookups a cache could not answer.",
+    "fallbacks_total": "Requests served by a fallback path.",
+    "analyses_total": "Finished analyses by routing tier.",
+}
+
+_buckets = tuple(sorted(METRICS_BUCKETS_S))
+_clock = time.perf_counter
+_lock = threading.Lock()
+_hist: dict[str, list] = {}  # stage -> [count per bucket ..., +Inf, sum]
+_counters: dict[tuple, float] = {}  # (name, ((label, value), ...) in call order) -> value
+# Hot path: observations and increments are appended here (deque.append is
+# atomic) and folded into _hist / _counters under _lock by readers, or by
+# the writer that fills the buffer.
+_pending: deque = deque()
+_FOLD_AT = 4096
+
+
+def _fold() -> None:
+    """Moves _pending into _hist / _counters; the caller holds _lock."""
+    pop = _pending.popleft
+    for _ in range(len(_pending)):
+        stage, value, pairs = pop()
+        if pairs is None:
+            h = _hist.get(stage)
+            if h is None:
+                h = _hist[stage] = [0] * (len(_buckets) + 1) + [0.0]
+            h[bisect_left(_buckets, value)] += 1
+            h[-1] += value
+        else:
+            key = (stage, pairs)
+            _counters[key] = _counters.get(key, 0) + value
+
+
+def _push(item: tuple) -> None:
+    _pending.append(item)
+    if len(_pending) >= _FOLD_AT:
+        with _lock:
+            _fold()
+
+
+def observe(stage: str, seconds: float) -> None:
+    if METRICS_ENABLED:
+        _push((stage, seconds, None))
+
+
+def count(name: str, n: float = 1, **labels) -> None:
+    if METRICS_ENABLED:
+        _push((name, n, tuple(labels.items())))
+
+
+def _merged_counters() -> dict:
+    """Counters keyed by (name, sorted labels), merging keyword orders; the caller holds _lock."""
+    out: dict = {}
+    for (name, pairs), value in _counters.items():
+        key = (name, tuple(sorted(pairs)))
+        out[key] = out.get(key, 0) + value
+    return out
+
+
+def _read() -> tuple[dict, dict]:
+    with _lock:
+        _fold()
+        return {stage: list(h) for stage, h in _hist.items()}, _merged_counters()
+
+
+class span:
+    """Times the enclosed block as `stage`; an exception also counts as a stage error."""
+
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if METRICS_ENABLED:
+            _close(self.stage, self.t0, exc_type is not None)
+        return False
+
+
+def _close(stage: str, t0: float, failed: bool) -> None:
+    _push((stage, _clock() - t0, None))
+    if failed:
+        _push(("stage_errors_total", 1, (("stage", stage),)))
+
+
+def timed(stage: str):
+    """Decorator: times every call of the function like span(stage), without the span object."""
+
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = _clock()
+            failed = True
+            try:
+                out = fn(*args, **kwargs)
+                failed = False
+                return out
+            finally:
+                if METRICS_ENABLED:
+                    _close(stage, t0, failed)
+
+        return inner
+
+    return wrap
+
+
+def snapshot() -> dict:
+    """Histograms as {stage: {count, sum_s, buckets}} and counters as {name: {labels: value}}."""
+    hist, counters = _read()
+    out: dict = {"stages": {}, "counters": {}}
+    for stage, h in sorted(hist.items()):
+        out["stages"][stage] = {"count": sum(h[:-1]), "sum_s": round(h[-1], 6), "buckets": h[:-1]}
+    for (name, labels), value in sorted(counters.items()):
+        out["counters"].setdefault(name, {})[",".join(f"{k}={v}" for k, v in labels)] = value
+    return out
+
+
+def reset() -> None:
+    with _lock:
+        _pending.clear()
+        _hist.clear()
+        _counters.clear()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _number(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render() -> str:
+    hist, counters = _read()
+
+    lines = []
+    if hist:
+        lines += [f"# HELP {STAGE_METRIC} {HELP[STAGE_METRIC]}", f"# TYPE {STAGE_METRIC} histogram"]
+    bounds = [_number(b) for b in _buckets] + ["+Inf"]
+    for stage, h in sorted(hist.items()):
+        cumulative = 0
+        for le, n in zip(bounds, h[:-1]):
+            cumulative += n
+            lines.append(f"{STAGE_METRIC}_bucket{_labels((('stage', stage), ('le', le)))} {cumulative}")
+        lines.append(f"{STAGE_METRIC}_sum{_labels((('stage', stage),))} {_number(h[-1])}")
+        lines.append(f"{STAGE_METRIC}_count{_labels((('stage', stage),))} {cumulative}")
+
+    by_name: dict[str, list] = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in sorted(by_name[name]):
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n" if lines else ""
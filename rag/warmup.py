@@ -0,0 +1,150 @@
+"""Background model warmup and readiness reporting.
+
+Without warmup the first request after a start pays for loading the
+embedder and the local LLM. start() loads the configured components
+(config.WARMUP_COMPONENTS) on background threads instead, so the app starts
+serving at once. status() reports each component's state, and ready() stays
+False until every enabled one has loaded. The /ready endpoint exposes this
+so a load balancer only sends traffic to warm workers.
+
+With MODEL_SERVER_URL set the models live in the model server, so the only
+component is "model_server": ready once its /health answers.
+
+Component states: pending -> loading -> ready | failed | skipped.
+"skipped" means the loader ran but settings keep the model off (e.g. the
+local LLM under FAST_ANALYSIS_MODE on CPU); it counts as ready.
+
+Public API:
+- start(components=None) -> None    (idempotent)
+- status() -> dict
+- ready() -> bool
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+from config import WARMUP_COMPONENTS
+from rag import model_client
+
+logger = logging.getLogger(__name__)
+
+_FAST_ANALYSIS_MODE = (os.environ.get("FAST_ANALYSIS_MODE") or "1").strip().lower() in {"1", "true", "yes"}
+
+_lock = threading.Lock()
+_started = False
+_state: dict[str, dict] = {}
+
+
+def _load_embedder() -> str:
+    from rag import retriever
+
+    retriever._ensure_embedder()
+    retriever._ensure_kb_loaded()
+    return "ready"
+
+
+def _load_predictor() -> str:
+    from rag import predictor
+
+    predictor._ensure_loaded()
+    return "ready" if predictor._model is not None else "skipped"
+
+
+def _load_llm() -> str:
+    from rag import llm
+
+    llm._ensure_loaded()
+    if llm._lm is not None:
+        return "ready"
+    if llm._DISABLE_LOCAL_LLM or (llm._FAST_ANALYSIS_MODE and llm._DEVICE != "cuda"):
+        return "skipped"
+    raise RuntimeError(llm._load_error or "local LLM did not load")
+
+
+def _wait_model_server() -> str:
+    while True:
+        try:
+            model_client._request("/health", timeout=2)
+            return "ready"
+        except RuntimeError:
+            time.sleep(1)
+
+
+_LOADERS: dict[str, Callable[[], str]] = {
+    "embedder": _load_embedder,
+    "predictor": _load_predictor,
+    "llm": _load_llm,
+    "model_server": _wait_model_server,
+}
+
+
+def _auto_components() -> list[str]:
+    if model_client.enabled():
+        return ["model_server"]
+    names = []
+    if not _FAST_ANALYSIS_MODE:
+        names.append("embedder")
+    if (os.environ.get("ENABLE_DEFECT_MODEL") or "").strip().lower() in {"1", "true", "yes"}:
+        names.append("predictor")
+    names.append("llm")
+    return names
+
+
+def configured_components() -> list[str]:
+    spec = WARMUP_COMPONENTS
+    if spec in {"", "none", "0", "off"}:
+        return []
+    if spec == "auto":
+        return _auto_components()
+    names = [n.strip() for n in spec.split(",") if n.strip()]
+    unknown = [n for n in names if n not in _LOADERS]
+    if unknown:
+        logger.warning(f"[warmup] ignoring unknown components: {', '.join(unknown)}")
+    return [n for n in names if n in _LOADERS]
+
+
+def _run(name: str) -> None:
+    with _lock:
+        _state[name].update(state="loading", started_at=time.time())
+    t0 = time.perf_counter()
+    try:
+        outcome = _LOADERS[name]()
+        error = None
+    except Exception as e:
+        outcome, error = "failed", f"{type(e).__name__}: {e}"
+    secs = round(time.perf_counter() - t0, 2)
+    with _lock:
+        _state[name].update(state=outcome, seconds=secs, error=error)
+    if error:
+        print(f"[warmup] {name} failed after {secs}s: {error}")
+    else:
+        print(f"[warmup] {name} {outcome} in {secs}s")
+
+
+def start(components: list[str] | None = None) -> None:
+    """Starts one background loader thread per component; later calls are no-ops."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+        names = configured_components() if components is None else list(components)
+        for name in names:
+            _state[name] = {"state": "pending", "seconds": None, "error": None}
+    for name in names:
+        threading.Thread(target=_run, args=(name,), name=f"warmup-{name}", daemon=True).start()
+
+
+def status() -> dict:
+    with _lock:
+        return {"started": _started, "components": {k: dict(v) for k, v in _state.items()}}
+
+
+def ready() -> bool:
+    with _lock:
+        return _started and all(v["state"] in {"ready", "skipped"} for v in _state.values())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Checks for the overlapped, per-stage-timed pipeline in rag/orchestrator.py."""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import orchestrator
+
+BUG = "def last(items):\n    return items[len(items)]\n"
+
+
+def _fixed(lang, path, issue, span, code, passages):
+    return {"root_cause": issue, "fix_explanation": "llm", "patched_code": code, "confidence": 0.9, "references": []}
+
+
+def _slow_llm_pipeline(monkeypatch):
+    monkeypatch.setattr(orchestrator, "HEURISTIC_TIER", False)
+    monkeypatch.setattr(orchestrator, "_FAST_ANALYSIS_MODE", False)
+    monkeypatch.setattr(orchestrator, "prepare", lambda: None)
+    monkeypatch.setattr(orchestrator, "generate_fix", _fixed)
+
+
+def test_retrieval_is_prefetched_while_the_model_runs(monkeypatch):
+    _slow_llm_pipeline(monkeypatch)
+    detect_done = threading.Event()
+    retrieved = []
+
+    def slow_predict(code, lang, rules=None):
+        time.sleep(0.2)
+        detect_done.set()
+        return orchestrator.summarize(rules)
+
+    def fake_retrieve(query, k):
+        retrieved.append((query, detect_done.is_set()))
+        return [{"text": "p"}], ["id"]
+
+    monkeypatch.setattr(orchestrator, "predict_defect", slow_predict)
+    monkeypatch.setattr(orchestrator, "retrieve", fake_retrieve)
+    result, passages, det, _query = orchestrator.analyze(BUG, path="a.py", lang="python")
+
+    assert det["issue_type"] == "IndexError_or_Bounds"
+    assert retrieved and retrieved[0][1] is False  # started before detection finished
+    assert len(retrieved) == 1  # the prefetch was reused, not repeated
+    assert passages == [{"text": "p"}] and result["_retrieval_ids"] == ["id"]
+    assert result["_routing"]["prefetched"] == ["IndexError_or_Bounds"]
+    assert result["_routing"]["timeouts"] == []
+
+
+def test_llm_timeout_falls_back_to_heuristic_fix(monkeypatch):
+    _slow_llm_pipeline(monkeypatch)
+    monkeypatch.setattr(orchestrator, "retrieve", lambda query, k: ([], []))
+    monkeypatch.setattr(orchestrator, "LLM_TIMEOUT_S", 0.05)
+
+    def stuck(*args):
+        time.sleep(0.5)
+        return _fixed(*args)
+
+    monkeypatch.setattr(orchestrator, "generate_fix", stuck)
+    t0 = time.perf_counter()
+    result, _passages, _det, _query = orchestrator.analyze(BUG, path="b.py", lang="python")
+
+    assert time.perf_counter() - t0 < 0.4
+    assert result["_routing"]["timeouts"] == ["llm"]
+    assert result["_routing"]["tier"] == "heuristic"
+    assert result["_routing"]["reason"] == "LLM timed out after 0.05s"
+    assert result["_llm_status"] == "LLM timed out after 0.05s"
+    assert result["references"] == ["local_kb: heuristic-fallback"]
+
+
+def test_detect_timeout_uses_rule_findings(monkeypatch):
+    _slow_llm_pipeline(monkeypatch)
+    monkeypatch.setattr(orchestrator, "retrieve", lambda query, k: ([], []))
+    monkeypatch.setattr(orchestrator, "DETECT_TIMEOUT_S", 0.05)
+
+    def stuck(code, lang, rules=None):
+        time.sleep(0.5)
+        return {"issue_type": "Possible_Bug", "span_lines": "?", "confidence": 0.5, "findings": []}
+
+    monkeypatch.setattr(orchestrator, "predict_defect", stuck)
+    _result, _passages, det, _query = orchestrator.analyze(BUG + "\n", path="c.py", lang="python")
+
+    assert det["issue_type"] == "IndexError_or_Bounds"
+    assert _result["_routing"]["timeouts"] == ["detect"]
+
+
+def test_analyze_async_runs_inside_an_event_loop(monkeypatch):
+    _slow_llm_pipeline(monkeypatch)
+    monkeypatch.setattr(orchestrator, "retrieve", lambda query, k: ([], []))
+
+    async def main():
+        a, b = await asyncio.gather(
+            orchestrator.analyze_async(BUG, path="d.py"),
+            orchestrator.analyze_async(BUG.replace("last", "tail"), path="e.py"),
+        )
+        nested = orchestrator.analyze(BUG, path="f.py")  # sync wrapper from inside a loop
+        return a, b, nested
+
+    a, b, nested = asyncio.run(main())
+    assert a[2]["issue_type"] == b[2]["issue_type"] == nested[2]["issue_type"] == "IndexError_or_Bounds"
+    assert a[0]["_routing"]["tier"] == "llm"
+
+
+def test_stage_timeout_excludes_queue_time(monkeypatch):
+    monkeypatch.setattr(orchestrator, "_stage_pool", orchestrator.ThreadPoolExecutor(max_workers=1))
+    blocker = orchestrator._submit(time.sleep, 0.2)
+
+    async def main():
+        run = orchestrator._Run()
+        queued = orchestrator._submit(time.sleep, 0.01)
+        out = await run.stage("queued", queued, 0.1, lambda: "fallback")
+        return out, run.timeouts
+
+    assert asyncio.run(main()) == (None, [])
+    blocker.result()
+
+
+def test_abandoned_stages_are_tracked(monkeypatch):
+    release = threading.Event()
+
+    async def main():
+        run = orchestrator._Run()
+        return await run.stage("stuck", orchestrator._submit(release.wait, 2), 0.01, lambda: "fallback")
+
+    assert asyncio.run(main()) == "fallback"
+    assert orchestrator.stage_pool_stats()["abandoned"]["stuck"] == 1
+    release.set()
+    deadline = time.monotonic() + 2
+    while "stuck" in orchestrator.stage_pool_stats()["abandoned"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "stuck" not in orchestrator.stage_pool_stats()["abandoned"]
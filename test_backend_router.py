@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Checks for latency-aware backend selection and failover (rag/router.py)."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag.router import Backend, LLMRouter, load_router_config
+
+
+def _ok(name):
+    return lambda *a, **k: {"patched_code": name}
+
+
+def _fail(*a, **k):
+    raise RuntimeError("boom")
+
+
+def test_priority_wins_within_slo():
+    router = LLMRouter(
+        [
+            Backend("slow-but-preferred", _ok("a"), priority=1, expected_ms=500),
+            Backend("fast", _ok("b"), priority=2, expected_ms=5),
+        ],
+        slo_ms=1000,
+    )
+    assert router.generate()["_backend"]["name"] == "slow-but-preferred"
+
+
+def test_backend_over_slo_is_tried_last():
+    router = LLMRouter(
+        [
+            Backend("remote", _ok("a"), priority=1, expected_ms=5000),
+            Backend("heuristic", _ok("b"), priority=3, expected_ms=5),
+        ],
+        slo_ms=1000,
+    )
+    assert [b.name for b in router.pick()] == ["heuristic", "remote"]
+
+
+def test_queue_depth_pushes_estimate_over_slo():
+    busy = Backend("remote", _ok("a"), priority=1, expected_ms=600, concurrency=1)
+    busy.inflight = 1
+    router = LLMRouter([busy, Backend("local", _ok("b"), priority=2, expected_ms=100)], slo_ms=1000)
+    assert router.pick()[0].name == "local"
+
+
+def test_failover_and_cooldown():
+    router = LLMRouter(
+        [Backend("remote", _fail, priority=1, expected_ms=10), Backend("heuristic", _ok("h"), priority=3, expected_ms=1)],
+        slo_ms=1000,
+        cooldown_s=60,
+    )
+    result = router.generate()
+    assert result["patched_code"] == "h"
+    assert [a["backend"] for a in result["_backend"]["attempts"]] == ["remote", "heuristic"]
+    # The failed backend sits out its cooldown.
+    assert [b.name for b in router.pick()] == ["heuristic"]
+    stats = {s["name"]: s for s in router.stats()}
+    assert not stats["remote"]["healthy"] and stats["remote"]["errors"] == 1
+
+
+def test_all_backends_failing_raises():
+    router = LLMRouter([Backend("remote", _fail), Backend("local", lambda *a: None)])
+    with pytest.raises(RuntimeError, match="All LLM backends failed"):
+        router.generate()
+
+
+def test_config_file_overrides_defaults(tmp_path):
+    path = tmp_path / "backends.json"
+    path.write_text('{"slo_ms": 1500, "backends": [{"name": "heuristic", "priority": 1}]}')
+    cfg = load_router_config(str(path))
+    router = LLMRouter.from_config(cfg, {"heuristic": (_ok("h"), lambda: True)})
+    assert router.slo_ms == 1500 and [b.name for b in router.backends] == ["heuristic"]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Checks for the prompt token budgeter (rag/budget.py)."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import budget
+
+
+def _big_python_file(n_funcs=200):
+    parts = []
+    for i in range(n_funcs):
+        parts.append(f"def helper_{i}(values):\n    total = 0\n    for v in values:\n        total += v * {i}\n    return total\n")
+    parts.append("class Stats:\n    def ratio(self, a, b):\n        scale = 10\n        return a / b\n")
+    return "\n".join(parts)
+
+
+def test_small_prompt_is_untouched():
+    code = "def f(a, b):\n    return a / b\n"
+    passages = [{"id": "1", "text": "Guard divisions.", "score": 0.9}]
+    out_code, out_passages, stats = budget.fit_prompt(code, passages, "2-2", "python")
+    assert out_code == code
+    assert out_passages == passages
+    assert stats["code_tokens_dropped"] == 0 and stats["passages_dropped"] == 0
+
+
+def test_passages_trimmed_by_score(monkeypatch):
+    monkeypatch.setitem(budget.PROMPT_TOKEN_BUDGETS, "test", 120)
+    code = "x = 1\n"
+    passages = [
+        {"id": "low", "text": "word " * 60, "score": 0.1},
+        {"id": "high", "text": "word " * 60, "score": 0.9},
+    ]
+    _, kept, stats = budget.fit_prompt(code, passages, "1-1", "python", backend="test")
+    assert [p["id"] for p in kept] == ["high"]
+    assert stats["passages_dropped"] == 1
+    assert stats["passage_tokens_dropped"] > 0
+
+
+def test_code_elided_around_span_and_restored(monkeypatch):
+    monkeypatch.setitem(budget.PROMPT_TOKEN_BUDGETS, "test", 200)
+    code = _big_python_file()
+    lines = code.splitlines()
+    span_line = next(i for i, l in enumerate(lines, 1) if "return a / b" in l)
+    trimmed, _, stats = budget.fit_prompt(code, [], f"{span_line}-{span_line}", "python", backend="test")
+
+    assert stats["code_tokens_dropped"] > 0
+    assert "return a / b" in trimmed
+    assert "class Stats:" in trimmed
+    assert "    def ratio(self, a, b):" in trimmed
+    assert "lines elided" in trimmed
+
+    patched = trimmed.replace("return a / b", "return a / b if b else 0")
+    restored = budget.restore_elided(code, patched, stats, "python")
+    assert restored == code.replace("return a / b", "return a / b if b else 0")
+
+
+def test_restore_rejects_missing_markers(monkeypatch):
+    monkeypatch.setitem(budget.PROMPT_TOKEN_BUDGETS, "test", 200)
+    code = _big_python_file()
+    _, _, stats = budget.fit_prompt(code, [], "3-3", "python", backend="test")
+    assert budget.restore_elided(code, "def broken():\n    pass\n", stats, "python") is None
+
+
+def test_brace_language_keeps_enclosing_method(monkeypatch):
+    monkeypatch.setitem(budget.PROMPT_TOKEN_BUDGETS, "test", 150)
+    body = "\n".join(f"    int f{i}() {{ return {i}; }}" for i in range(150))
+    code = (
+        "public class Demo {\n" + body + "\n"
+        "    int divide(int a, int b) {\n        int c = 1;\n        return a / b;\n    }\n}\n"
+    )
+    lines = code.splitlines()
+    span_line = next(i for i, l in enumerate(lines, 1) if "return a / b" in l)
+    trimmed, _, stats = budget.fit_prompt(code, [], f"{span_line}-{span_line}", "java", backend="test")
+    assert "public class Demo {" in trimmed
+    assert "int divide(int a, int b) {" in trimmed
+    assert "// ... " in trimmed
+    assert stats["code_ranges"]
+
+
+def test_excerpt_lines_map_back_to_file(monkeypatch):
+    monkeypatch.setitem(budget.PROMPT_TOKEN_BUDGETS, "test", 200)
+    code = _big_python_file()
+    lines = code.splitlines()
+    span_line = next(i for i, l in enumerate(lines, 1) if "return a / b" in l)
+    trimmed, _, stats = budget.fit_prompt(code, [], f"{span_line}-{span_line}", "python", backend="test")
+    excerpt_line = trimmed.splitlines().index("        return a / b") + 1
+    assert budget.excerpt_line_to_original(stats, excerpt_line) == span_line
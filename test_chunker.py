@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Checks for function-level chunking (rag/chunker.py) and chunked analysis."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import chunker, orchestrator
+
+PY = '''import os
+
+LIMIT = 3
+
+
+@cache
+def first(xs):
+    return xs[0]
+
+
+class Box:
+    def __init__(self, items):
+        self.items = items
+
+    def last(self):
+        return self.items[len(self.items)]
+
+
+print(first([1]))
+'''
+
+JS = """const s = "not a { brace";
+// neither is this }
+function load(url) {
+  return fetch(url).then(r => { return r.json(); });
+}
+
+class Store {
+  get(k) { return this.m[k]; }
+}
+"""
+
+
+def _spans(chunks):
+    return [(c.start, c.end, c.kind, c.name) for c in chunks]
+
+
+def test_python_chunks_cover_file_by_definition():
+    chunks = chunker.chunk(PY, "python", max_chars=10_000)
+    assert _spans(chunks) == [
+        (1, 5, "module", "<module>"),
+        (6, 10, "function", "first"),
+        (11, 18, "class", "Box"),
+        (19, 19, "module", "<module>"),
+    ]
+    assert "".join(c.text for c in chunks) == PY
+
+
+def test_oversized_class_is_split_into_methods():
+    chunks = chunker.chunk(PY, "python", max_chars=80)
+    names = [c.name for c in chunks]
+    assert "Box.__init__" in names and "Box.last" in names
+    assert [c for c in chunks if c.name == "Box.last"][0].kind == "method"
+    assert chunker.stitch(PY, chunks, {}) == PY
+
+
+def test_brace_chunks_ignore_braces_in_strings_and_comments():
+    chunks = chunker.chunk(JS, "javascript", max_chars=10_000)
+    assert _spans(chunks) == [(1, 6, "function", "load"), (7, 9, "class", "Store")]
+
+
+def test_unparsable_or_unknown_language_falls_back_to_line_runs():
+    code = "".join(f"line {i}\n" for i in range(100))
+    chunks = chunker.chunk(code, "ruby", max_chars=100)
+    assert len(chunks) > 1 and all(len(c.text) <= 100 for c in chunks)
+    assert chunker.stitch(code, chunks, {}) == code
+
+
+def test_stitch_replaces_only_patched_chunks():
+    chunks = chunker.chunk(PY, "python", max_chars=10_000)
+    patched = chunker.stitch(PY, chunks, {1: "@cache\ndef first(xs):\n    return xs[0] if xs else None"})
+    assert "return xs[0] if xs else None\nclass Box:" not in patched  # ending restored
+    assert patched.count("\n") == PY.count("\n") and patched.startswith("import os\n")
+
+
+def test_large_input_runs_expensive_stages_on_suspect_chunks_only(monkeypatch):
+    clean = "".join(f"def f{i}(x):\n    return x + {i}\n\n\n" for i in range(40))
+    code = clean + "def bad(items):\n    return items[len(items)]\n"
+    calls = []
+
+    def fake_generate_fix(lang, path, issue, span, chunk_code, passages):
+        calls.append((issue, span, chunk_code))
+        fixed = chunk_code.replace("items[len(items)]", "items[len(items) - 1]")
+        return {"root_cause": issue, "fix_explanation": "off by one", "patched_code": fixed, "confidence": 0.8, "references": ["r"]}
+
+    monkeypatch.setattr(orchestrator, "generate_fix", fake_generate_fix)
+    monkeypatch.setattr(orchestrator, "HEURISTIC_TIER", False)
+    monkeypatch.setattr(orchestrator, "CHUNK_THRESHOLD_CHARS", 200)
+    result, _passages, det, _query = orchestrator.analyze(code, path="big.py", lang="python")
+
+    assert len(calls) == 1 and calls[0][0] == "IndexError_or_Bounds" and calls[0][1] == "2-2"
+    assert det["span_lines"] == "162-162" and det["chunks"] == 41
+    assert result["patched_code"] == code.replace("items[len(items)]", "items[len(items) - 1]")
+    assert "+    return items[len(items) - 1]" in result["unified_diff"]
+    assert result["_routing"]["suspect_chunks"] == 1 and result["_routing"]["tier"] == "llm"
+    assert [c["name"] for c in result["_chunks"] if c["patched"]] == ["bad"]
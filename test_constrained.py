@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Checks for schema-constrained JSON decoding (rag/constrained.py)."""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+torch = pytest.importorskip("torch")
+
+from rag.constrained import JsonConstraint
+
+
+class _CharTokenizer:
+    """One token per printable char, plus a couple of multi-char pieces and EOS."""
+
+    def __init__(self):
+        self.pieces = [chr(c) for c in range(32, 127)] + ['{"', '": "', '", "', "\\n", "}\n", "```"]
+        self.eos_token_id = len(self.pieces)
+        self.all_special_ids = [self.eos_token_id]
+
+    def __len__(self):
+        return len(self.pieces) + 1
+
+    def decode(self, ids):
+        return "".join(self.pieces[i] for i in ids if i < len(self.pieces))
+
+    def id_of(self, piece):
+        return self.pieces.index(piece)
+
+
+def _run(constraint, tok, preferred):
+    """Greedy decode where the 'model' always prefers the next char of `preferred`."""
+    out = []
+    for _ in range(400):
+        scores = torch.zeros(len(tok))
+        want = preferred[len("".join(out)) :]
+        for piece in ("```", "}\n", want[:4], want[:1]):
+            if piece and piece in tok.pieces:
+                scores[tok.id_of(piece)] += 1.0
+        scores[tok.id_of(" ")] += 0.5
+        tid = int(torch.argmax(constraint([], scores)))
+        if tid == tok.eos_token_id:
+            break
+        out.append(tok.pieces[tid])
+        if constraint.stop(tid):
+            break
+    return "".join(out)
+
+
+def test_output_parses_and_stops_at_closing_brace():
+    tok = _CharTokenizer()
+    target = json.dumps(
+        {
+            "root_cause": "off by one",
+            "fix_explanation": "use len - 1",
+            "patched_code": "print(nums[2])\n",
+            "patch_unified_diff": "",
+            "references": ["kb_1"],
+            "confidence": 0.9,
+        }
+    )
+    constraint = JsonConstraint(tok)
+    text = _run(constraint, tok, target)
+    assert constraint.done
+    assert text.endswith("}")
+    parsed = json.loads(text)
+    assert parsed["patched_code"] == "print(nums[2])\n"
+    assert parsed["references"] == ["kb_1"]
+
+
+def test_code_fences_and_raw_newlines_are_masked():
+    tok = _CharTokenizer()
+    constraint = JsonConstraint(tok)
+    scores = torch.zeros(len(tok))
+    scores[tok.id_of("```")] = 5.0
+    scores[tok.id_of('{"')] = 1.0
+    masked = constraint([], scores)
+    assert int(torch.argmax(masked)) == tok.id_of('{"')
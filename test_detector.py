@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""Checks for the single-pass defect detector (rag/detector.py)."""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import EXT_TO_LANG
+
+from rag.detector import detect, mask
+from rag.predictor import predict_defect
+
+
+def _rules(code, lang="python"):
+    return [(f["rule"], f["line"]) for f in detect(code, lang)]
+
+
+def test_strings_and_comments_are_masked():
+    code = 'x = "a[len(a)] / y"  # b[i + 1]\ns = """\nc[j+1]\n"""\n'
+    masked = mask(code)
+    assert len(masked) == len(code) and masked.count("\n") == code.count("\n")
+    assert "[" not in masked and _rules(code) == []
+    assert _rules('String s = "x[i+1]"; // y[i+1]\n/* z[i+1] */\n', "java") == []
+
+
+def test_plain_subscripts_and_type_hints_are_not_flagged():
+    code = "def f(xs: list[int], d: dict[str, int]) -> Optional[int]:\n    return d['k'] + xs[i] + xs[1:] + [x][0]\n"
+    assert _rules(code) == []
+
+
+def test_reports_every_finding_most_confident_first():
+    code = (
+        "def f(xs, d):\n"
+        "    m = d.get('k')\n"
+        "    for i in range(len(xs) + 1):\n"
+        "        if xs[i] > xs[i + 1]:\n"
+        "            pass\n"
+        "    return m.value / len(xs)\n"
+    )
+    found = detect(code)
+    assert [(f["rule"], f["line"]) for f in found] == [
+        ("range_len_plus_one", 3),
+        ("neighbor_index", 4),
+        ("unchecked_optional", 6),
+        ("unchecked_divisor", 6),
+    ]
+    assert [f["issue_type"] for f in found][2:] == ["NoneType_Attribute", "ZeroDivisionError"]
+    det = predict_defect(code)
+    assert (det["issue_type"], det["span_lines"], det["confidence"]) == ("IndexError_or_Bounds", "3-3", 0.85)
+    assert det["findings"] == found
+
+
+def test_checks_suppress_findings():
+    assert _rules("m = re.match(p, s)\nif m:\n    print(m.group(0))\n") == []
+    assert _rules("def avg(xs):\n    if not xs:\n        return 0\n    return sum(xs) / len(xs)\n") == []
+    assert _rules("v = d.get('k', '')\nv.strip()\n") == []
+    assert _rules('print("%d items" % count)\n') == []
+    assert _rules("if n <= len(a):\n    pass\n") == []
+
+
+def test_c_family_rules():
+    code = "for (int i = 0; i <= arr.length; i++) {\n  sum += arr[i];\n}\nString s = null;\nint n = s.length();\n"
+    assert _rules(code, "java") == [("loop_le", 1), ("unchecked_optional", 5)]
+    assert detect(code, "java")[1]["issue_type"] == "NullPointer_Dereference"
+
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample files")
+
+
+@pytest.mark.parametrize(
+    "name, rule, span",
+    [
+        ("index_error.py", "literal_index", "2-2"),  # nums = [1, 2, 3]; nums[3]
+        ("cpp_test.cpp", "literal_index", "10-10"),  # numbers = {10, 20, 30}; numbers[3]
+        ("python_test.py", "index_past_check", "8-8"),  # if len(data) > 0: f"{data[3]}"
+        ("infinite_loop.py", "missing_increment", "3-4"),  # while i < len(items) without i += 1
+        ("array_out_of_bounds.cpp", "loop_le", "5-5"),
+        ("zero_division.py", "unchecked_divisor", "2-2"),
+    ],
+)
+def test_sample_files_keep_their_top_finding(name, rule, span):
+    with open(os.path.join(SAMPLES, name), encoding="utf-8") as f:
+        code = f.read()
+    top = detect(code, EXT_TO_LANG[os.path.splitext(name)[1]])[0]
+    assert (top["rule"], top["span_lines"]) == (rule, span)
+    expected = "ZeroDivisionError" if rule == "unchecked_divisor" else "IndexError_or_Bounds"
+    assert top["issue_type"] == expected
+
+
+def test_literal_index_and_loop_update_checks_stay_quiet_on_safe_code():
+    assert _rules("nums = [1, 2, 3]\nnums.append(4)\nprint(nums[3], nums[-3])\n") == []
+    assert _rules("if len(x) == 0:\n    return\nprint(x[0])\n") == []
+    assert _rules("d = {'a': 1}\nprint(d[1])\n") == []
+    assert _rules("while i < n:\n    i += 1\n") == []
+    assert _rules("while i < len(stack):\n    stack.pop()\n") == []
+    assert _rules("while i < n:\n    if done(i):\n        break\n") == []
+    assert _rules("do { i++; } while (i < n);\nwhile (p != NULL) p = p->next;\n", "c") == []
+    assert _rules("int[] a = {1, 2};\nint b = a[2];\n", "java") == [("literal_index", 2)]
+
+
+def test_linear_time_on_large_inputs():
+    chunk = "def f(xs, d):\n    m = d.get('k')\n    s = 'x[i+1] % y'  # a[b]\n    return xs[i] / n + m.v\n"
+    small = chunk * (20_000 // len(chunk))
+    large = small * 10
+
+    def cost(code):
+        t0 = time.perf_counter()
+        detect(code)
+        return time.perf_counter() - t0
+
+    t_small = min(cost(small) for _ in range(3))
+    t_large = min(cost(large) for _ in range(3))
+    assert t_small < 0.25
+    assert t_large < t_small * 25  # ~10x expected; quadratic would be ~100x
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Import-time budget: fast mode on a CPU host must start without torch.
+
+Runs `python -X importtime -c "import rag.orchestrator"` in a fresh
+interpreter and checks that no heavy ML package was imported and that the
+cumulative import time stays under IMPORT_TIME_BUDGET_MS (default 1500).
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+HEAVY = ("torch", "transformers", "numpy", "faiss", "sentencepiece", "tokenizers")
+BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS") or 1500)
+
+
+def _importtime(module: str) -> dict[str, int]:
+    """Module name -> cumulative import time in microseconds."""
+    env = dict(os.environ, FAST_ANALYSIS_MODE="1", CUDA_VISIBLE_DEVICES="")
+    env.pop("MODEL_SERVER_URL", None)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_fast_mode_imports_no_ml_stack():
+    times = _importtime("rag.orchestrator")
+    heavy = sorted(n for n in times if n.split(".")[0] in HEAVY)
+    assert not heavy, f"imported at startup: {', '.join(heavy[:10])}"
+
+
+def test_fast_mode_import_time_budget():
+    times = _importtime("rag.orchestrator")
+    ms = times["rag.orchestrator"] / 1000
+    slowest = sorted(times.items(), key=lambda kv: -kv[1])[:5]
+    assert ms <= BUDGET_MS, f"import rag.orchestrator took {ms:.0f} ms (budget {BUDGET_MS:.0f}); slowest: {slowest}"
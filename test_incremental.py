@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""Checks for incremental rescans (rag/incremental.py, rag/scan.py)."""
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import incremental, orchestrator, predictor, scan
+
+needs_git = pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+
+
+def _git(cwd, *args):
+    return subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        cwd=cwd, check=True, capture_output=True, text=True,
+    ).stdout
+
+
+def _repo(tmp_path):
+    (tmp_path / "a.py").write_text("".join(f"x{i} = {i}\n" for i in range(1, 11)))
+    (tmp_path / "b.py").write_text("y = 1\n")
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-qm", "init")
+    return tmp_path
+
+
+def _fake_analyze(calls):
+    def analyze(code, path, lang):
+        calls.append(os.path.basename(path))
+        det = {
+            "issue_type": "IndexError_or_Bounds", "span_lines": "2-2", "confidence": 0.9,
+            "findings": [{"rule": "r1", "span_lines": "2-2"}, {"rule": "r2", "span_lines": "8-9"}],
+        }
+        return {"root_cause": "rc", "_routing": {"tier": "heuristic"}}, [], det, ""
+
+    return analyze
+
+
+@needs_git
+def test_blob_sha_matches_git(tmp_path):
+    p = tmp_path / "f.py"
+    p.write_bytes(b"print('hi')\n\x00\xff")
+    assert incremental.blob_sha(str(p)) == _git(tmp_path, "hash-object", str(p)).strip()
+
+
+def test_cache_roundtrip_and_version_invalidation(tmp_path):
+    db = str(tmp_path / "c.sqlite")
+    c = incremental.ScanCache(db, version="v1")
+    assert c.get("abc", "python") is None
+    c.put("abc", "python", {"status": "ok", "findings": [1]})
+    assert c.get("abc", "python") == {"status": "ok", "findings": [1]}
+    assert c.get("abc", "javascript") is None
+    c.close()
+
+    assert incremental.ScanCache(db, version="v1").get("abc", "python") is not None
+    assert incremental.ScanCache(db, version="v2").get("abc", "python") is None
+
+
+@needs_git
+def test_changes_since_reports_files_and_hunks(tmp_path):
+    root = _repo(tmp_path)
+    text = (root / "a.py").read_text().replace("x3 = 3", "x3 = 33").replace("x8 = 8", "x8 = 88")
+    (root / "a.py").write_text(text)
+    (root / "new.py").write_text("z = 1\n")
+
+    changed = incremental.changes_since([str(root)], "HEAD")
+    real = os.path.realpath(str(root))
+    assert changed == {os.path.join(real, "a.py"): [(3, 3), (8, 8)], os.path.join(real, "new.py"): None}
+
+    hasher = incremental.BlobHasher([str(root)])
+    for name in ("a.py", "b.py", "new.py"):
+        assert hasher.sha(str(root / name)) == incremental.blob_sha(str(root / name))
+
+
+
+@needs_git
+def test_changes_since_handles_quoted_and_deleted_file_names(tmp_path):
+    root = _repo(tmp_path)
+    for name in ("my file.py", 'q"uote.py', "tab\tname.py"):
+        (root / name).write_text("v = 1\n")
+    _git(root, "add", ".")
+    _git(root, "commit", "-qm", "more")
+    for name in ("my file.py", 'q"uote.py', "tab\tname.py"):
+        (root / name).write_text("v = 2\n")
+    (root / "b.py").unlink()
+
+    changed = incremental.changes_since([str(root)], "HEAD")
+    real = os.path.realpath(str(root))
+    assert changed == {os.path.join(real, n): [(1, 1)] for n in ("my file.py", 'q"uote.py', "tab\tname.py")}
+
+
+def test_changes_since_outside_git_is_an_error(tmp_path, monkeypatch):
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(tmp_path.parent))
+    (tmp_path / "a.py").write_text("x = 1\n")
+    with pytest.raises(RuntimeError, match="not in one"):
+        incremental.changes_since([str(tmp_path)], "HEAD")
+    assert scan.main([str(tmp_path), "--since", "HEAD", "--no-cache"]) == 2
+
+def test_second_scan_is_served_from_cache(tmp_path, monkeypatch):
+    (tmp_path / "a.py").write_text("x = 1\n")
+    (tmp_path / "b.py").write_text("y = 2\n")
+    calls = []
+    monkeypatch.setattr(orchestrator, "analyze", _fake_analyze(calls))
+    cache = incremental.ScanCache(str(tmp_path / "cache" / "c.sqlite"), version="v")
+
+    scan.scan([str(tmp_path)], workers=1, out=io.StringIO(), err=io.StringIO(), cache=cache)
+    (tmp_path / "b.py").write_text("y = 3\n")
+    out = io.StringIO()
+    summary = scan.scan([str(tmp_path)], workers=1, out=out, err=io.StringIO(), cache=cache)
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert calls == ["a.py", "b.py", "b.py"]
+    assert [bool(r.get("cached")) for r in records] == [True, False]
+    assert records[0]["root_cause"] == "rc" and records[0]["path"].endswith("a.py")
+    assert summary["cached"] == 1 and summary["ok"] == 2
+
+
+@needs_git
+def test_changed_hunks_filter_findings_and_skip_untouched_files(tmp_path, monkeypatch):
+    root = _repo(tmp_path)
+    (root / "a.py").write_text((root / "a.py").read_text().replace("x8 = 8", "x8 = 88"))
+    (root / "b.py").write_text("y = 2\n")
+    calls = []
+    monkeypatch.setattr(orchestrator, "analyze", _fake_analyze(calls))
+
+    def fake_predict(code, lang="python"):
+        span = "8-8" if "x8" in code else "5-5"
+        return {"issue_type": "Possible_Bug", "span_lines": span, "confidence": 0.6, "findings": [{"span_lines": span}]}
+
+    monkeypatch.setattr(predictor, "predict_defect", fake_predict)
+    out = io.StringIO()
+    summary = scan.scan([str(root)], workers=1, out=out, err=io.StringIO(), since="HEAD", changed_hunks=True)
+
+    records = {os.path.basename(r["path"]): r for r in map(json.loads, out.getvalue().splitlines())}
+    assert calls == ["a.py"]
+    assert records["a.py"]["status"] == "ok" and records["a.py"]["changed_lines"] == [[8, 8]]
+    assert [f["rule"] for f in records["a.py"]["findings"]] == ["r2"]
+    assert records["b.py"]["status"] == "clean"
+    assert summary["files"] == 2 and summary["clean"] == 1
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Checks for the tolerant streaming JSON parser (rag/jsonstream.py)."""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag.jsonstream import JSONStreamParser, extract_json
+
+OBJ = {
+    "root_cause": "off-by-one in {loop}",
+    "fix_explanation": "Use < instead of <=",
+    "patched_code": "for i in range(n):\n\tprint(a[i])\n",
+    "references": ["kb_1"],
+    "confidence": 0.9,
+}
+
+
+def _raw_newlines(s):
+    # What LLMs often emit: real newlines/tabs inside string values.
+    return s.replace("\\n", "\n").replace("\\t", "\t")
+
+
+def test_plain_json():
+    assert extract_json(json.dumps(OBJ)) == OBJ
+
+
+def test_fenced_with_prose_and_trailing_garbage():
+    text = "Here is the fix:\n```json\n" + json.dumps(OBJ, indent=2) + "\n```\nHope this helps! }"
+    assert extract_json(text) == OBJ
+
+
+def test_unescaped_newlines_and_tabs_in_strings():
+    assert extract_json(_raw_newlines(json.dumps(OBJ))) == OBJ
+
+
+def test_invalid_escape_is_kept_literally():
+    text = '{"patched_code": "re.match(r\'\\d+\', s)", "confidence": 1}'
+    assert extract_json(text)["patched_code"] == "re.match(r'\\d+', s)"
+
+
+def test_streaming_chunks_complete_at_closing_brace():
+    text = "```json\n" + _raw_newlines(json.dumps(OBJ)) + "\n```"
+    parser = JSONStreamParser()
+    results = [parser.feed(text[i : i + 7]) for i in range(0, len(text), 7)]
+    assert results[-1] == OBJ
+    first = next(i for i, r in enumerate(results) if r is not None)
+    assert (first + 1) * 7 >= text.index("}\n```")
+
+
+def test_escape_split_across_chunks():
+    parser = JSONStreamParser()
+    parser.feed('{"a": "x\\')
+    assert parser.feed('"y"}') == {"a": 'x"y'}
+
+
+def test_truncated_response_is_salvaged():
+    text = json.dumps(OBJ)[:-40]
+    out = extract_json(text)
+    assert out is not None
+    assert out["root_cause"] == OBJ["root_cause"]
+
+
+def test_no_object():
+    assert extract_json("no json here") is None
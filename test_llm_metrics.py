@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Checks for token/latency accounting of Groq calls (rag/gemini_api._complete)."""
+
+import json
+import os
+import sys
+from types import SimpleNamespace as NS
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("dotenv")
+
+from rag import gemini_api
+
+BODY = json.dumps({"root_cause": "off by one", "patched_code": "x = 1\n", "confidence": 0.9})
+
+
+class _FakeCompletions:
+    def __init__(self, usage_on_last_chunk=True):
+        self.usage_on_last_chunk = usage_on_last_chunk
+
+    def create(self, stream=False, **kwargs):
+        if not stream:
+            return NS(choices=[NS(message=NS(content=BODY))], usage=NS(prompt_tokens=120, completion_tokens=30))
+        pieces = ["```json\n", BODY[:10], BODY[10:], "\n```"]
+        chunks = [NS(choices=[NS(delta=NS(content=p))], usage=None, x_groq=None) for p in pieces]
+        if self.usage_on_last_chunk:
+            chunks.append(NS(choices=[], usage=None, x_groq=NS(usage=NS(prompt_tokens=120, completion_tokens=30))))
+        return iter(chunks)
+
+
+def _client(**kw):
+    return NS(chat=NS(completions=_FakeCompletions(**kw)))
+
+
+def test_streamed_call_reports_usage_and_parses(monkeypatch):
+    monkeypatch.setattr(gemini_api, "_CLIENT", _client())
+    monkeypatch.setattr(gemini_api, "GROQ_STREAM", True)
+    text, parsed, metrics = gemini_api._complete("sys", "user")
+    assert parsed["root_cause"] == "off by one"
+    assert metrics["prompt_tokens"] == 120 and metrics["completion_tokens"] == 30
+    assert not metrics["usage_estimated"] and metrics["streamed"]
+    assert 0 <= metrics["ttfb_ms"] <= metrics["total_ms"]
+
+
+def test_missing_usage_is_estimated(monkeypatch):
+    monkeypatch.setattr(gemini_api, "_CLIENT", _client(usage_on_last_chunk=False))
+    monkeypatch.setattr(gemini_api, "GROQ_STREAM", True)
+    _, _, metrics = gemini_api._complete("system prompt", "user prompt")
+    assert metrics["usage_estimated"] and metrics["completion_tokens"] > 0
+
+
+def test_json_mode_call(monkeypatch):
+    monkeypatch.setattr(gemini_api, "_CLIENT", _client())
+    monkeypatch.setattr(gemini_api, "GROQ_STREAM", False)
+    text, parsed, metrics = gemini_api._complete("sys", "user")
+    assert text == BODY and parsed is None
+    assert metrics["completion_tokens"] == 30 and not metrics["streamed"]
+    # The body arrives in one piece: no first-byte time or generation rate to report.
+    assert metrics["ttfb_ms"] is None and metrics["generation_ms"] is None and metrics["tokens_per_s"] is None
+    assert metrics["total_ms"] >= 0
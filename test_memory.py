@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Checks for the model memory budget manager (rag/memory.py)."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag.memory import MemoryManager
+
+
+class _Models:
+    """Fake resident models whose sizes add up to the process RSS."""
+
+    def __init__(self, mgr, base_mb=100.0):
+        self.mgr, self.base_mb, self.resident = mgr, base_mb, {}
+
+    def rss(self):
+        return self.base_mb + sum(self.resident.values())
+
+    def add(self, name, size_mb):
+        self.mgr.register(name, lambda: self.resident.pop(name))
+        self.load(name, size_mb)
+
+    def load(self, name, size_mb):
+        self.resident[name] = size_mb
+        self.mgr.loaded(name, size_mb)
+
+
+def _setup(budget_mb, idle_s=0):
+    mgr = MemoryManager(budget_mb=budget_mb, idle_s=idle_s, check_s=0)
+    models = _Models(mgr)
+    mgr._rss = models.rss
+    return mgr, models
+
+
+def test_evicts_least_recently_used_until_under_budget():
+    mgr, models = _setup(budget_mb=1000)
+    models.add("embedder", 400)
+    models.add("predictor", 300)
+    with mgr.using("embedder"):
+        pass  # embedder is now the most recently used
+    models.add("llm", 400)  # 1200 MB: predictor (LRU) has to go
+    assert set(models.resident) == {"embedder", "llm"}
+    comps = mgr.stats()["components"]
+    assert comps["predictor"]["evictions"] == 1 and not comps["predictor"]["loaded"]
+    assert comps["embedder"]["evictions"] == 0 and comps["llm"]["loaded"]
+
+
+def test_in_use_and_recently_used_models_are_kept():
+    mgr, models = _setup(budget_mb=500, idle_s=3600)
+    models.add("embedder", 300)
+    models.add("llm", 300)
+    assert mgr.enforce_budget() == []  # nothing idle long enough
+    mgr.idle_s = 0
+    with mgr.using("embedder"), mgr.using("llm"):
+        assert mgr.enforce_budget() == []
+        assert set(models.resident) == {"embedder", "llm"}
+    with mgr.using("llm"):
+        assert mgr.enforce_budget() == ["embedder"]
+
+
+def test_reload_after_eviction_is_counted():
+    mgr, models = _setup(budget_mb=600)
+    models.add("embedder", 300)
+    models.add("llm", 400)
+    assert "embedder" not in models.resident
+    models.load("embedder", 300)  # lazy reload on next use evicts the llm
+    comps = mgr.stats()["components"]
+    assert comps["embedder"]["reloads"] == 1 and comps["embedder"]["loaded"]
+    assert comps["llm"]["evictions"] == 1
+
+
+def test_no_budget_never_evicts():
+    mgr, models = _setup(budget_mb=0)
+    models.add("llm", 10_000)
+    assert mgr.enforce_budget() == [] and "llm" in models.resident
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""Checks for cross-request micro-batching in the model server (rag/model_server.py)."""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag.model_server import MicroBatcher
+
+
+def test_concurrent_calls_share_a_batch():
+    calls = []
+    gate = threading.Event()
+
+    def fake_embed(texts, max_len):
+        gate.wait(1)
+        calls.append(list(texts))
+        return [f"v:{t}" for t in texts]
+
+    batcher = MicroBatcher(fake_embed, max_batch=32, wait_ms=50)
+    futures = [batcher.submit([f"q{i}", f"r{i}"]) for i in range(4)]
+    gate.set()
+    results = [f.result(2) for f in futures]
+    assert results[2] == ["v:q2", "v:r2"]
+    assert sum(len(c) for c in calls) == 8
+    assert len(calls) < 4
+    assert batcher.stats()["requests"] == 4
+
+
+def test_different_max_len_are_separate_passes():
+    seen = []
+    batcher = MicroBatcher(lambda texts, max_len: seen.append(max_len) or list(texts), max_batch=8, wait_ms=30)
+    a = batcher.submit(["a"], 128)
+    b = batcher.submit(["b"], 256)
+    assert a.result(2) == ["a"] and b.result(2) == ["b"]
+    assert sorted(seen) == [128, 256]
+
+
+def test_errors_reach_every_caller():
+    def boom(texts, max_len):
+        raise ValueError("bad input")
+
+    batcher = MicroBatcher(boom, wait_ms=1)
+    fut = batcher.submit(["x"])
+    try:
+        fut.result(2)
+    except ValueError as e:
+        assert "bad input" in str(e)
+    else:
+        raise AssertionError("expected ValueError")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Checks for the local hunk patch engine (rag/patching.py)."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag.patching import apply_hunks, unified_diff
+
+CODE = (
+    "def safe_div(a, b):\n"
+    "    return a / b\n"
+    "\n"
+    "def first(items):\n"
+    "    return items[1]\n"
+)
+
+
+def test_exact_hunk():
+    patched, report = apply_hunks(CODE, [{"start_line": 2, "find": "    return a / b", "replace": "    return a / b if b else 0"}])
+    assert "return a / b if b else 0" in patched
+    assert report["applied"] == 1 and not report["failed"]
+    assert patched.endswith("\n")
+
+
+def test_whitespace_insensitive_hunk_is_reindented():
+    patched, report = apply_hunks(CODE, [{"start_line": 5, "find": "return items[1]", "replace": "return items[0]"}])
+    assert "    return items[0]\n" in patched
+    assert report["applied"] == 1 and report["fuzzy"] == 0
+
+
+def test_fuzzy_hunk():
+    hunk = {"start_line": 4, "find": "def first(item):\n    return items[1]", "replace": "def first(items):\n    return items[0]"}
+    patched, report = apply_hunks(CODE, [hunk])
+    assert "return items[0]" in patched
+    assert report["fuzzy"] == 1
+
+
+def test_unplaceable_and_overlapping_hunks_are_reported():
+    hunks = [
+        {"start_line": 2, "find": "    return a / b", "replace": "    return 0"},
+        {"start_line": 1, "find": "def safe_div(a, b):\n    return a / b", "replace": "pass"},
+        {"start_line": 9, "find": "totally unrelated text here", "replace": "x"},
+    ]
+    patched, report = apply_hunks(CODE, hunks)
+    assert report["total"] == 3 and report["applied"] == 1
+    assert report["failed"] == [0, 2]  # hunk 1 starts first, so hunk 0 is the overlap
+    assert report["reasons"][0].startswith("overlaps") and report["reasons"][2] == "find text not found"
+
+
+def test_malformed_hunk_is_counted_and_reported_by_index():
+    hunks = ["return 0", {"start_line": 2, "find": "    return a / b", "replace": "    return a / b if b else 0"}, None]
+    patched, report = apply_hunks(CODE, hunks)
+    assert "return a / b if b else 0" in patched
+    assert report["total"] == 3 and report["applied"] == 1
+    assert report["failed"] == [0, 2]
+    assert report["reasons"] == {0: "malformed", 2: "malformed"}
+
+
+def test_unified_diff_is_local():
+    patched, _ = apply_hunks(CODE, [{"start_line": 2, "find": "    return a / b", "replace": "    return a / b if b else 0"}])
+    diff = unified_diff(CODE, patched)
+    assert diff.startswith("--- a/snippet")
+    assert "+    return a / b if b else 0" in diff
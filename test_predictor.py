@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Checks for the sliding-window defect model path (rag/predictor.py)."""
+
+import os
+import sys
+from types import SimpleNamespace as NS
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import predictor
+
+
+class _CharTok:
+    """One token per character, with [CLS]/[SEP]-style specials (ids 1 and 2)."""
+
+    is_fast = True
+    pad_token_id = 0
+    model_max_length = 10**6
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False, verbose=True):
+        return {"input_ids": [ord(c) for c in text], "offset_mapping": [(i, i + 1) for i in range(len(text))]}
+
+    def encode(self, text, add_special_tokens=False):
+        return [ord(c) for c in text]
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def build_inputs_with_special_tokens(self, ids):
+        return [1] + list(ids) + [2]
+
+    def get_special_tokens_mask(self, ids):
+        return [1] + [0] * len(ids) + [1]
+
+
+def test_windows_cover_everything_with_overlap():
+    assert predictor._windows(10, 32, 8) == [(0, 10)]
+    spans = predictor._windows(100, 32, 8)
+    assert spans[0] == (0, 32) and spans[-1] == (68, 100)
+    assert all(e - s == 32 for s, e in spans)
+    assert all(b[0] < a[1] for a, b in zip(spans, spans[1:]))  # neighbours overlap
+
+
+def test_slow_tokenizer_maps_tokens_to_line_starts(monkeypatch):
+    tok = _CharTok()
+    tok.is_fast = False
+    monkeypatch.setattr(predictor, "_tok", tok)
+    ids, starts = predictor._token_starts("ab\ncd\n")
+    assert len(ids) == 6 and starts == [0, 0, 0, 3, 3, 3]
+
+
+def test_model_findings_merge_windows_into_line_spans(monkeypatch):
+    torch = pytest.importorskip("torch")
+    calls = []
+
+    class _Model:
+        config = NS(num_labels=2, id2label={0: "O", 1: "B-IndexError_or_Bounds"})
+
+        def __call__(self, input_ids, attention_mask):
+            calls.append(tuple(input_ids.shape))
+            hit = (input_ids == ord("X")).float()
+            return NS(logits=torch.stack([1 - hit, hit], -1) * 5)
+
+    lines = ["a = 1"] * 60
+    lines[4] = lines[5] = "b = X"
+    lines[39] = "X"
+    code = "\n".join(lines) + "\n"
+    monkeypatch.setattr(predictor, "_tok", _CharTok())
+    monkeypatch.setattr(predictor, "_model", _Model())
+    monkeypatch.setattr(predictor, "_DEVICE", "cpu")
+    monkeypatch.setattr(predictor, "DEFECT_WINDOW_TOKENS", 34)
+    monkeypatch.setattr(predictor, "DEFECT_WINDOW_OVERLAP", 8)
+
+    found = predictor._model_findings(code, max_batch=4)
+    assert [(f["issue_type"], f["span_lines"]) for f in found] == [
+        ("IndexError_or_Bounds", "5-6"),
+        ("IndexError_or_Bounds", "40-40"),
+    ]
+    assert all(f["confidence"] > 0.9 for f in found)
+    assert calls[0] == (4, 34)  # windows run as padded batches
+
+
+def test_files_in_one_call_share_padded_batches(monkeypatch):
+    torch = pytest.importorskip("torch")
+    calls = []
+
+    class _Model:
+        config = NS(num_labels=2, id2label={0: "O", 1: "B-ZeroDivisionError"})
+
+        def __call__(self, input_ids, attention_mask):
+            calls.append(tuple(input_ids.shape))
+            hit = (input_ids == ord("/")).float()
+            return NS(logits=torch.stack([1 - hit, hit], -1) * 5)
+
+    monkeypatch.setattr(predictor, "_tok", _CharTok())
+    monkeypatch.setattr(predictor, "_model", _Model())
+    monkeypatch.setattr(predictor, "_loaded", True)
+    monkeypatch.setattr(predictor, "_DEVICE", "cpu")
+    codes = ["x = 1\ny = a / b\n", "", "def f(a, b):\n    return a / b\n"]
+
+    alone = [predictor._model_findings(code, max_batch=8) for code in codes]
+    calls.clear()
+    results = predictor.predict_defect_batch([(code, "python") for code in codes], max_batch=8)
+
+    assert calls == [(2, 32)]  # both non-empty files in one forward pass
+    assert [f["span_lines"] for f in alone[0]] == ["2-2"] and alone[1] == []
+    for result, found in zip(results, alone):
+        assert [f for f in result["findings"] if f["rule"] == "defect_model"] == found
+    assert results[1]["issue_type"] == "Possible_Bug"
+
+
+def test_missing_onnx_export_falls_back_to_torch(tmp_path, monkeypatch, capsys):
+    loaded = []
+    monkeypatch.setattr(predictor, "_ENABLE_DEFECT_MODEL", True)
+    monkeypatch.setattr(predictor, "DEFECT_ONNX_DIR", str(tmp_path))
+    monkeypatch.setattr(predictor, "_load_torch", loaded.append)
+    predictor._load_or_none("onnx-int8")
+    assert loaded == ["onnx-int8"]
+    assert "run export_predictor.py" in capsys.readouterr().out
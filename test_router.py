@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""Checks for the heuristic-first analysis routing in rag/orchestrator.py."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import orchestrator
+
+
+def _llm_should_not_run(*args, **kwargs):
+    raise AssertionError("LLM called")
+
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample files")
+
+
+def _sample(name):
+    with open(os.path.join(SAMPLES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_real_division_finding_is_served_by_the_heuristic_tier(monkeypatch):
+    monkeypatch.setattr(orchestrator, "generate_fix", _llm_should_not_run)
+    result, passages, det, _ = orchestrator.analyze(_sample("zero_division.py"), path="zero_division.py")
+    assert (det["rule"], det["span_lines"]) == ("unchecked_divisor", "2-2")  # the real detector, conf 0.6
+    assert result["_routing"]["tier"] == "heuristic"
+    assert "return a / b if b != 0 else 0  # ZeroDivisionError if b == 0" in result["patched_code"]
+    assert passages == []
+
+
+def test_real_missing_increment_is_served_by_the_heuristic_tier(monkeypatch):
+    monkeypatch.setattr(orchestrator, "generate_fix", _llm_should_not_run)
+    result, _, det, _ = orchestrator.analyze(_sample("infinite_loop.py"), path="infinite_loop.py")
+    assert (det["rule"], det["span_lines"]) == ("missing_increment", "3-4")
+    assert result["_routing"]["tier"] == "heuristic"
+    assert result["patched_code"].splitlines()[4].strip().startswith("i += 1")
+
+
+def _llm_echo(lang, path, issue, span, code, passages):
+    return {"patched_code": code, "confidence": 0.5, "references": []}
+
+
+def test_literal_index_rewrite_escalates(monkeypatch):
+    monkeypatch.setattr(orchestrator, "generate_fix", _llm_echo)
+    code = "def pairs(rows):\n    for i in range(len(rows) - 1):\n        if rows[i][1] > rows[i + 1][1]:\n            return i\n"
+    result, _, det, _ = orchestrator.analyze(code, path="pairs.py")
+    assert det["rule"] == "neighbor_index" and det["confidence"] >= 0.8
+    assert result["_routing"]["tier"] == "llm"
+    assert "rows[i][0]" not in result["patched_code"]
+
+
+def test_rule_edit_outside_the_finding_escalates(monkeypatch):
+    monkeypatch.setattr(orchestrator, "generate_fix", _llm_echo)
+    monkeypatch.setattr(
+        orchestrator,
+        "predict_defect",
+        lambda code, lang, rules=None: {"issue_type": "ZeroDivisionError", "rule": "unchecked_divisor", "span_lines": "1-1", "confidence": 0.9},
+    )
+    result, _, _, _ = orchestrator.analyze("def f(a, b):\n    return a / b\n")
+    assert result["_routing"]["tier"] == "llm"
+    assert "outside lines 1-1" in result["_routing"]["reason"]
+
+
+def test_low_confidence_escalates(monkeypatch):
+    monkeypatch.setattr(
+        orchestrator,
+        "predict_defect",
+        lambda code, lang, rules=None: {"issue_type": "Possible_Bug", "span_lines": "?", "confidence": 0.5},
+    )
+    monkeypatch.setattr(orchestrator, "generate_fix", lambda *a: {"patched_code": "x"})
+    before = orchestrator.routing_stats()["llm"]["count"]
+    result, _, _, _ = orchestrator.analyze("def f(a, b):\n    return a / b\n")
+    assert result["_routing"]["tier"] == "llm"
+    assert "detector confidence" in result["_routing"]["reason"]
+    assert orchestrator.routing_stats()["llm"]["count"] == before + 1
+
+
+def test_identical_concurrent_requests_share_one_run(monkeypatch):
+    import threading
+    import time
+
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    def slow_generate(*args):
+        runs.append(1)
+        started.set()
+        release.wait(2)
+        return {"patched_code": "fixed"}
+
+    monkeypatch.setattr(
+        orchestrator,
+        "predict_defect",
+        lambda code, lang, rules=None: {"issue_type": "Possible_Bug", "span_lines": "?", "confidence": 0.1},
+    )
+    monkeypatch.setattr(orchestrator, "generate_fix", slow_generate)
+    before = orchestrator.single_flight_stats()["coalesced"]
+
+    results = {}
+    leader = threading.Thread(target=lambda: results.setdefault("a", orchestrator.analyze("x = 1\n")))
+    leader.start()
+    started.wait(2)
+    follower = threading.Thread(target=lambda: results.setdefault("b", orchestrator.analyze("x = 1\n")))
+    follower.start()
+    deadline = time.monotonic() + 2
+    while orchestrator.single_flight_stats()["coalesced"] == before and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    leader.join(2)
+    follower.join(2)
+
+    assert len(runs) == 1
+    assert results["b"][0]["patched_code"] == "fixed"
+    assert results["b"][0]["_coalesced"] and "_coalesced" not in results["a"][0]
+    assert results["a"][0] is not results["b"][0]
+
+
+def test_requests_differing_in_any_byte_do_not_coalesce():
+    key = orchestrator._flight_key
+    assert key("x = 1\n", "a.py", "python") == key("x = 1\n", "a.py", "python")
+    assert key("x = 1\r\n", "a.py", "python") != key("x = 1\n", "a.py", "python")  # CRLF keeps its own patch
+    assert key("\nx = 1\n", "a.py", "python") != key("x = 1\n", "a.py", "python")
+    assert key("x = 1   \n", "a.py", "python") != key("x = 1\n", "a.py", "python")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Checks for the heuristic fixer rule engine (rag/rules.py)."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag.rules import Source, apply_rules, run_rules
+
+
+def test_division_guard():
+    code = "def avg(total, count):\n    return total / count\n"
+    patched, explanation = apply_rules("ZeroDivisionError", code)
+    assert "return total / count if count != 0 else 0" in patched
+    assert explanation == "Added a division-by-zero guard in return expressions."
+
+
+def test_first_changing_rule_wins():
+    code = "for i in range(n - i):\n    x = arr[3]\n"
+    patched, rule = run_rules("bounds", code)
+    assert rule.name == "range_minus_i"
+    assert "arr[3]" in patched
+
+
+def test_direct_index_only_touches_indexed_lines():
+    code = "values = [1, 2, 3]\nprint(values[ 3 ])\nprint(values[0])\n"
+    patched, _ = apply_rules("IndexError", code)
+    assert patched.splitlines() == [
+        "values = [1, 2, 3]",
+        "print(values[2])  # fixed off-by-one",
+        "print(values[0])",
+    ]
+
+
+def test_missing_increment_skips_loops_that_advance():
+    code = "i = 0\nwhile i < len(items):\n    print(items[i])\nj = 0\nwhile j < len(items):\n    j += 1\n"
+    patched, rule = run_rules("auto", code)
+    assert rule.name == "missing_increment"
+    assert patched.count("+= 1") == 2
+    assert "    i += 1  # auto-fix: avoid infinite loop" in patched
+
+
+def test_rows_follow_splitlines_breaks():
+    src = Source("a\rb[2]\nwhile x\x0cwhile y\n")
+    assert src.rows("index") == [1]
+    assert src.rows("while") == [2, 3]
+
+
+def test_null_issue_only_tidies():
+    code = "x = items[3]\t\n"
+    patched, explanation = apply_rules("NullPointerException", code)
+    assert patched == "x = items[3]\n"
+    assert "readability" in explanation
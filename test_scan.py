@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Checks for the repository scanner (rag/scan.py)."""
+
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import orchestrator, scan
+
+
+def _tree(tmp_path):
+    files = {
+        "a.py": "x = 1\n",
+        "pkg/b.js": "let y = 2;\n",
+        "pkg/notes.txt": "not source\n",
+        "pkg/empty.go": "\n",
+        "node_modules/dep.js": "skip me\n",
+        ".git/hooks/h.py": "skip me\n",
+        "big.c": "int x;\n" * 5000,
+    }
+    for rel, text in files.items():
+        p = tmp_path / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(text)
+    return tmp_path
+
+
+def test_iter_files_respects_extensions_and_skip_dirs(tmp_path):
+    root = _tree(tmp_path)
+    rel = [os.path.relpath(p, root) for p in scan.iter_files([str(root)])]
+    assert rel == ["a.py", "big.c", os.path.join("pkg", "b.js"), os.path.join("pkg", "empty.go")]
+
+
+def test_scan_streams_jsonl_and_summarizes(tmp_path, monkeypatch, capsys):
+    root = _tree(tmp_path)
+    seen = []
+
+    def fake_analyze(code, path, lang):
+        seen.append((os.path.basename(path), lang))
+        print("pipeline chatter")  # must not end up in the JSONL stream
+        det = {"issue_type": "Possible_Bug", "span_lines": "?", "confidence": 0.5, "findings": [{"rule": "r"}]}
+        return {"root_cause": "rc", "_routing": {"tier": "heuristic"}}, [], det, ""
+
+    monkeypatch.setattr(orchestrator, "analyze", fake_analyze)
+    monkeypatch.setattr(scan, "MAX_CODE_LEN", 20000)  # big.c is over it
+    out, err = io.StringIO(), io.StringIO()
+    summary = scan.scan([str(root)], workers=1, out=out, err=err)
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["status"] for r in records] == ["ok", "skipped", "ok", "skipped"]
+    assert sorted(seen) == [("a.py", "python"), ("b.js", "javascript")]
+    assert records[0]["tier"] == "heuristic" and records[0]["findings"] == [{"rule": "r"}]
+    assert summary["files"] == 4 and summary["ok"] == 2 and summary["skipped"] == 2 and summary["findings"] == 2
+    assert "pipeline chatter" in capsys.readouterr().err
+    assert "[scan] 4 files" in err.getvalue()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Checks for the Aho-Corasick signature scanner (rag/signatures.py)."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import EXT_TO_LANG
+from rag import predictor, signatures
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample files")
+
+
+def _hits(code, lang):
+    return [(f["issue_type"], f["span_lines"]) for f in signatures.scan(code, lang)]
+
+
+def test_automaton_reports_every_overlapping_match():
+    words = ["he", "she", "his", "hers", "is"]
+    text = "ushers this"
+    found = sorted((s, e, w) for s, e, w in signatures.Automaton((w, w) for w in words).finditer(text))
+    naive = sorted((i, i + len(w), w) for w in words for i in range(len(text)) if text.startswith(w, i))
+    assert found == naive
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("c_buffer_overflow.c", [("Buffer_Overflow", "5-5")]),
+        ("c_double_free.c", [("Double_Free", "4-5")]),
+        ("c_use_after_free.c", [("Use_After_Free", "6-7")]),
+        ("cpp_double_delete.cpp", [("Double_Free", "4-5")]),
+        ("memory_leak.cpp", [("Memory_Leak", "4-4")]),
+        ("cpp_unique_ptr_leak.cpp", [("Memory_Leak", "4-4")]),
+        ("FileLeak.java", [("Resource_Leak", "4-4")]),
+        ("resource_leak_combined.java", [("Resource_Leak", "4-4")]),
+        ("JavaDeadlock.java", [("Deadlock", "5-6")]),
+        ("sql_injection.py", [("SQL_Injection", "2-2")]),
+        ("sql_injection_js.js", [("SQL_Injection", "2-2")]),
+        ("sql_injection_php.php", [("SQL_Injection", "3-3")]),
+        ("file_leak.py", [("Resource_Leak", "2-2")]),
+    ],
+)
+def test_sample_files(name, expected):
+    with open(os.path.join(SAMPLES_DIR, name), "r", encoding="utf-8") as f:
+        code = f.read()
+    assert _hits(code, EXT_TO_LANG[os.path.splitext(name)[1]]) == expected
+
+
+def test_safe_code_is_not_flagged():
+    c = (
+        "// strcpy(a, b) in a comment\n"
+        "void f(char *s) {\n"
+        "  char *p = malloc(4);\n"
+        "  xfree(p);\n"
+        "  free(p);\n"
+        "  p = NULL;\n"
+        "  if (p) puts(\"strcpy(\");\n"
+        "}\n"
+    )
+    assert _hits(c, "c") == []
+    java = (
+        "try (FileReader fr = new FileReader(path)) { fr.read(); }\n"
+        "FileReader g = new FileReader(path);\n"
+        "g.close();\n"
+        'String q = "SELECT * FROM t WHERE id = ?";\n'
+    )
+    assert _hits(java, "java") == []
+    py = 'with open(p) as f:\n    data = f.read()\nq = "select 1"\n'
+    assert _hits(py, "python") == []
+
+
+def test_predict_defect_reports_signature_findings():
+    code = "#include <stdlib.h>\nint main(){\n  int *p = malloc(4);\n  free(p);\n  free(p);\n}\n"
+    det = predictor.predict_defect(code, "c")
+    assert det["issue_type"] == "Double_Free" and det["span_lines"] == "4-5"
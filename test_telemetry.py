@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Checks for stage timing and the Prometheus exposition (rag/telemetry.py)."""
+
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import orchestrator, telemetry
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    telemetry.reset()
+    yield
+    telemetry.reset()
+
+
+def test_span_feeds_histogram_and_counts_errors():
+    telemetry.observe("stage", 0.003)
+    with telemetry.span("stage"):
+        pass
+    with pytest.raises(ValueError):
+        with telemetry.span("stage"):
+            raise ValueError("boom")
+
+    snap = telemetry.snapshot()
+    assert snap["stages"]["stage"]["count"] == 3
+    assert snap["counters"]["stage_errors_total"] == {"stage=stage": 1}
+
+
+def test_render_is_prometheus_text_format():
+    telemetry.observe("embed", 0.003)
+    telemetry.observe("embed", 100.0)
+    telemetry.count("fallbacks_total", stage="llm", failed='gr"oq')
+    telemetry.count("fallbacks_total", failed='gr"oq', stage="llm")
+    text = telemetry.render()
+
+    assert "# TYPE stage_duration_seconds histogram" in text
+    assert 'stage_duration_seconds_bucket{stage="embed",le="0.001"} 0' in text
+    assert 'stage_duration_seconds_bucket{stage="embed",le="0.005"} 1' in text
+    assert 'stage_duration_seconds_bucket{stage="embed",le="60"} 1' in text
+    assert 'stage_duration_seconds_bucket{stage="embed",le="+Inf"} 2' in text
+    assert 'stage_duration_seconds_count{stage="embed"} 2' in text
+    assert "# TYPE fallbacks_total counter" in text
+    assert 'fallbacks_total{failed="gr\\"oq",stage="llm"} 2' in text
+    sample = re.compile(r'^[a-z_]+(\{([a-z_]+="([^"\\]|\\.)*",?)*\})? [0-9.e+-]+$')
+    assert all(line.startswith("# ") or sample.match(line) for line in text.splitlines())
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(telemetry, "METRICS_ENABLED", False)
+    with telemetry.span("stage"):
+        telemetry.count("cache_hits_total", cache="x")
+    assert telemetry.render() == ""
+
+
+def test_analysis_records_stage_spans_and_counters(monkeypatch):
+    monkeypatch.setattr(orchestrator, "HEURISTIC_TIER", False)
+    monkeypatch.setattr(orchestrator, "_FAST_ANALYSIS_MODE", False)
+    monkeypatch.setattr(orchestrator, "prepare", lambda: None)
+    monkeypatch.setattr(orchestrator, "retrieve", lambda query, k: ([], []))
+    monkeypatch.setattr(
+        orchestrator,
+        "generate_fix",
+        lambda lang, path, issue, span, code, passages: {"patched_code": code, "confidence": 0.9, "references": []},
+    )
+    orchestrator.analyze("def last(items):\n    return items[len(items)]\n", path="m.py")
+
+    snap = telemetry.snapshot()
+    assert {"analyze", "predict_defect", "build_query"} <= set(snap["stages"])
+    assert snap["counters"]["analyses_total"] == {"chunked=0,tier=llm": 1}
+    assert snap["counters"]["cache_hits_total"] == {"cache=retrieval_prefetch": 1}
+    assert snap["counters"]["cache_misses_total"] == {"cache=single_flight": 1}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""Checks for background warmup and readiness (rag/warmup.py)."""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag import warmup
+
+
+def _reset(monkeypatch, loaders):
+    monkeypatch.setattr(warmup, "_started", False)
+    monkeypatch.setattr(warmup, "_state", {})
+    monkeypatch.setattr(warmup, "_LOADERS", loaders)
+
+
+def _wait_settled(timeout=2.0):
+    import time
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        states = [c["state"] for c in warmup.status()["components"].values()]
+        if all(s not in {"pending", "loading"} for s in states):
+            return
+        time.sleep(0.005)
+
+
+def test_ready_only_after_every_component_loads(monkeypatch):
+    release = threading.Event()
+    _reset(monkeypatch, {"fast": lambda: "ready", "slow": lambda: release.wait(2) and "ready"})
+    warmup.start(["fast", "slow"])
+    assert not warmup.ready()
+    release.set()
+    _wait_settled()
+    assert warmup.ready()
+    assert warmup.status()["components"]["slow"]["seconds"] is not None
+
+
+def test_failed_component_keeps_not_ready(monkeypatch):
+    def boom():
+        raise OSError("missing weights")
+
+    _reset(monkeypatch, {"llm": boom, "predictor": lambda: "skipped"})
+    warmup.start(["llm", "predictor"])
+    _wait_settled()
+    comps = warmup.status()["components"]
+    assert comps["llm"]["state"] == "failed" and "missing weights" in comps["llm"]["error"]
+    assert comps["predictor"]["state"] == "skipped"
+    assert not warmup.ready()
+
+
+def test_start_is_idempotent(monkeypatch):
+    calls = []
+    _reset(monkeypatch, {"llm": lambda: calls.append(1) or "ready"})
+    warmup.start(["llm"])
+    warmup.start(["llm"])
+    _wait_settled()
+    assert calls == [1]